@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Disaster Response API.
+
+Run from the backend directory, e.g. ``python -m benchmarks.startup``.
+"""
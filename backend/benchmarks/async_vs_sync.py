@@ -0,0 +1,159 @@
+"""
+Sync (WSGI) vs async (ASGI) benchmark.
+
+Starts the API twice with the same number of worker processes, once with
+sync gunicorn workers serving /api/... and once with uvicorn workers
+serving /api/async/..., then holds a fixed number of concurrent requests
+in flight against each for a fixed time and reports throughput, latency
+percentiles and errors.
+
+Usage:
+	python -m benchmarks.async_vs_sync [--workers 2] [--concurrency 200] [--duration 20]
+	python -m benchmarks.async_vs_sync --sync-url http://host:8000 --async-url http://host:8001
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Endpoint name -> path under /api/ (sync) and /api/async/ (async)
+ENDPOINTS = {
+	'list': 'reports/',
+	'nearby': 'reports/?lat=6.5244&lng=3.3792&radius=10',
+	'detail': 'reports/{id}/',
+	'summary': 'summary/',
+}
+
+SERVERS = {
+	'sync': (['gunicorn', 'disaster_response.wsgi:application'], '/api/'),
+	'async': (['gunicorn', 'disaster_response.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'], '/api/async/'),
+}
+
+
+def start_server(mode, port, workers):
+	command, _ = SERVERS[mode]
+	return subprocess.Popen(
+		[sys.executable, '-m', *command, '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning'],
+		cwd=BACKEND_DIR,
+		stdout=subprocess.DEVNULL,
+	)
+
+
+async def wait_until_up(client, url, timeout=30):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			await client.get(url)
+			return
+		except httpx.TransportError:
+			await asyncio.sleep(0.2)
+	raise RuntimeError(f'Server at {url} did not start')
+
+
+def percentile(values, fraction):
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def drive(client, url, concurrency, duration):
+	"""Keep `concurrency` requests in flight against url for `duration` seconds."""
+	latencies = []
+	errors = 0
+	deadline = time.monotonic() + duration
+
+	async def worker():
+		nonlocal errors
+		while time.monotonic() < deadline:
+			started = time.perf_counter()
+			try:
+				response = await client.get(url)
+				if response.status_code >= 500:
+					errors += 1
+					continue
+			except httpx.HTTPError:
+				errors += 1
+				continue
+			latencies.append((time.perf_counter() - started) * 1000)
+
+	started = time.monotonic()
+	await asyncio.gather(*(worker() for _ in range(concurrency)))
+	elapsed = time.monotonic() - started
+
+	if not latencies:
+		return {'requests': 0, 'errors': errors}
+	return {
+		'requests': len(latencies),
+		'errors': errors,
+		'requests_per_second': round(len(latencies) / elapsed, 1),
+		'latency_ms': {
+			'p50': round(statistics.median(latencies), 2),
+			'p95': round(percentile(latencies, 0.95), 2),
+			'p99': round(percentile(latencies, 0.99), 2),
+			'max': round(max(latencies), 2),
+		},
+	}
+
+
+async def benchmark(base_url, prefix, args):
+	limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+	async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+		await wait_until_up(client, '/api/health/')
+		response = await client.get(f'{prefix}reports/?page_size=1')
+		listing = response.json() if response.status_code == 200 else {}
+		report_id = listing['results'][0]['id'] if listing.get('results') else 'missing'
+
+		results = {}
+		for name in args.endpoints:
+			url = prefix + ENDPOINTS[name].format(id=report_id)
+			# Warm up pools and caches before measuring
+			await drive(client, url, min(args.concurrency, 10), 1)
+			results[name] = await drive(client, url, args.concurrency, args.duration)
+		return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+	parser.add_argument('--concurrency', type=int, default=200, help='Requests kept in flight')
+	parser.add_argument('--duration', type=float, default=20, help='Seconds per endpoint')
+	parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+	parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+	parser.add_argument('--sync-url', help='Benchmark an already running sync server')
+	parser.add_argument('--async-url', help='Benchmark an already running async server')
+	parser.add_argument('--port', type=int, default=8765, help='First port for spawned servers')
+	args = parser.parse_args()
+
+	results = {
+		'workers': args.workers,
+		'concurrency': args.concurrency,
+		'duration_seconds': args.duration,
+	}
+
+	for offset, mode in enumerate(SERVERS):
+		_, prefix = SERVERS[mode]
+		url = getattr(args, f'{mode}_url')
+		server = None
+		if url is None:
+			url = f'http://localhost:{args.port + offset}'
+			server = start_server(mode, args.port + offset, args.workers)
+		try:
+			results[mode] = asyncio.run(benchmark(url, prefix, args))
+		finally:
+			if server is not None:
+				server.terminate()
+				server.wait()
+
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+	main()
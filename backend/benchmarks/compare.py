@@ -0,0 +1,88 @@
+"""
+Compare two endpoint benchmark result files.
+
+Prints the change in p50/p95/p99 latency, commands per request and peak
+memory for every dataset size and endpoint present in both files, and
+exits non-zero when any latency percentile regressed by more than the
+threshold, or any endpoint issues more commands than before.
+
+Usage:
+	python -m benchmarks.compare before.json after.json [--threshold 0.2]
+"""
+import argparse
+import json
+import sys
+
+
+PERCENTILES = ('p50', 'p95', 'p99')
+
+
+def load(path):
+	with open(path) as results_file:
+		results = json.load(results_file)
+	return results['meta'], {run['reports']: run['endpoints'] for run in results['runs']}
+
+
+def change(before, after):
+	if not before or after is None:
+		return None
+	return (after - before) / before
+
+
+def format_change(before, after):
+	delta = change(before, after)
+	if delta is None:
+		return f'{before} -> {after}'
+	return f'{before} -> {after} ({delta:+.0%})'
+
+
+def compare(before, after, threshold):
+	"""Yield (size, endpoint, metric, description, regressed) for every shared measurement."""
+	for size in sorted(set(before) & set(after)):
+		for endpoint in before[size]:
+			if endpoint not in after[size]:
+				continue
+			old, new = before[size][endpoint], after[size][endpoint]
+
+			old_latency, new_latency = old['latency_ms'] or {}, new['latency_ms'] or {}
+			for name in PERCENTILES:
+				if name in old_latency and name in new_latency:
+					delta = change(old_latency[name], new_latency[name])
+					regressed = delta is not None and delta > threshold
+					yield size, endpoint, name, format_change(old_latency[name], new_latency[name]), regressed
+
+			old_commands, new_commands = old['commands_per_request'], new['commands_per_request']
+			if old_commands and new_commands:
+				regressed = new_commands['mean'] > old_commands['mean']
+				yield size, endpoint, 'commands', format_change(old_commands['mean'], new_commands['mean']), regressed
+
+			if old['peak_memory_kb'] is not None and new['peak_memory_kb'] is not None:
+				yield size, endpoint, 'memory_kb', format_change(old['peak_memory_kb'], new['peak_memory_kb']), False
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('before')
+	parser.add_argument('after')
+	parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative latency increase')
+	args = parser.parse_args()
+
+	before_meta, before = load(args.before)
+	after_meta, after = load(args.after)
+	if before_meta.get('backend') != after_meta.get('backend'):
+		print(f"Warning: comparing {before_meta.get('backend')} against {after_meta.get('backend')}")
+	print(f"{before_meta.get('commit')} -> {after_meta.get('commit')}")
+
+	regressions = 0
+	for size, endpoint, metric, description, regressed in compare(before, after, args.threshold):
+		marker = '!!' if regressed else '  '
+		print(f'{marker} {size:>9} {endpoint:<14} {metric:<10} {description}')
+		regressions += regressed
+
+	if regressions:
+		print(f'{regressions} regressions above {args.threshold:.0%}')
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,298 @@
+"""
+In-process endpoint benchmark on large synthetic datasets.
+
+Seeds a dedicated database with 10k, 100k and 1M synthetic reports
+(clustered around cities, skewed towards the recent past; see
+reports/synthetic.py), then drives every endpoint through the Django test
+client and records latency percentiles, MongoDB commands per request and
+peak Python memory per request. Results go to a JSON file that
+benchmarks/compare.py can diff against an earlier run.
+
+Command counts come from the pymongo command listener and are null under
+--mongomock, which does not emit command events. Peak memory is measured
+in a separate tracemalloc pass so it does not inflate the latencies.
+
+Usage:
+	python -m benchmarks.endpoints [--sizes 10000 100000 1000000] [--iterations 200]
+	python -m benchmarks.endpoints --mongomock --sizes 10000 --output results.json
+	python -m benchmarks.endpoints --uri mongodb://localhost:27017 --db disaster_benchmark --reuse
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# Read endpoints first: writes make the snapshot rebuild in the background
+ENDPOINTS = (
+	'list',
+	'list_radius',
+	'list_priority',
+	'detail',
+	'batch',
+	'simple',
+	'markers',
+	'summary',
+	'ai_summary',
+	'create',
+	'status_update',
+	'cleanup',
+)
+
+
+def configure(args):
+	"""Point settings at the benchmark database before Django is set up."""
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'disaster_response.settings')
+	if args.uri:
+		os.environ['MONGODB_URI'] = args.uri
+	os.environ['MONGODB_NAME'] = args.db
+	# Commands are counted explicitly; keep the middleware out of the way
+	os.environ['MONGODB_PROFILING_ENABLED'] = 'True'
+	os.environ['MONGODB_PROFILING_SAMPLE_RATE'] = '0'
+	os.environ['REPORT_SNAPSHOT_ENABLED'] = 'False' if args.no_snapshot else 'True'
+	os.environ['REPORT_SNAPSHOT_PATH'] = os.path.join(args.workdir, 'reports.snapshot')
+
+	import django
+	django.setup()
+
+	from django.conf import settings
+	settings.ALLOWED_HOSTS = ['*']
+
+	if args.mongomock:
+		import mongoengine
+		import mongomock
+		mongoengine.disconnect_all()
+		mongoengine.connect(args.db, host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+
+
+def git_commit():
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def percentile(values, fraction):
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies, commands, peaks, errors):
+	result = {
+		'requests': len(latencies),
+		'errors': errors,
+		'latency_ms': {
+			'p50': round(statistics.median(latencies), 3),
+			'p95': round(percentile(latencies, 0.95), 3),
+			'p99': round(percentile(latencies, 0.99), 3),
+			'max': round(max(latencies), 3),
+		} if latencies else None,
+		'commands_per_request': None,
+		'peak_memory_kb': round(max(peaks) / 1024, 1) if peaks else None,
+	}
+	if commands:
+		result['commands_per_request'] = {
+			'mean': round(statistics.mean(commands), 2),
+			'max': max(commands),
+		}
+	return result
+
+
+def seed(collection, size, args):
+	from reports.indexes import ensure_indexes
+	from reports.synthetic import seed_collection
+
+	if args.reuse and collection.estimated_document_count() == size:
+		print(f'Reusing {size} reports in {args.db}', file=sys.stderr)
+	else:
+		collection.delete_many({})
+		started = time.perf_counter()
+		seed_collection(collection, size, seed=args.seed)
+		print(f'Seeded {size} reports in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+	if not args.mongomock:
+		ensure_indexes(collection)
+
+
+class Requests:
+	"""Builds one request per endpoint, with fresh ids and bodies on every call."""
+
+	def __init__(self, collection, rng):
+		self.rng = rng
+		# A sample of (id, reporter_id) pairs for detail and status updates
+		self.samples = [
+			(str(document['_id']), document['reporter_id'])
+			for document in collection.aggregate([
+				{'$sample': {'size': 500}},
+				{'$project': {'reporter_id': 1}},
+			])
+		]
+		self.created = 0
+
+	def location(self):
+		from reports.synthetic import random_location
+		return random_location(self.rng, 'cities')
+
+	def __call__(self, client, name):
+		if name == 'list':
+			return client.get('/api/reports/', {'page': self.rng.randint(1, 5)})
+		if name == 'list_radius':
+			lat, lng = self.location()
+			return client.get('/api/reports/', {'lat': lat, 'lng': lng, 'radius': self.rng.choice([2, 10, 25])})
+		if name == 'list_priority':
+			return client.get('/api/reports/', {'sort': 'priority', 'page': self.rng.randint(1, 5)})
+		if name == 'detail':
+			report_id, _ = self.rng.choice(self.samples)
+			return client.get(f'/api/reports/{report_id}/')
+		if name == 'batch':
+			ids = [report_id for report_id, _ in self.rng.sample(self.samples, 50)]
+			return client.get('/api/reports/batch/', {'ids': ','.join(ids)})
+		if name == 'simple':
+			return client.get('/api/reports/simple/')
+		if name == 'markers':
+			return client.get('/api/reports/markers/')
+		if name == 'summary':
+			return client.get('/api/summary/')
+		if name == 'ai_summary':
+			return client.get('/api/ai/summary/')
+		if name == 'create':
+			lat, lng = self.location()
+			self.created += 1
+			return client.post('/api/reports/create/', {
+				'type': self.rng.choice(['flood', 'fire', 'accident', 'collapse']),
+				'description': f'Benchmark report {self.created}',
+				'latitude': round(lat, 6),
+				'longitude': round(lng, 6),
+			}, content_type='application/json')
+		if name == 'status_update':
+			report_id, reporter_id = self.rng.choice(self.samples)
+			# Never resolve, so the TTL index cannot shrink the dataset mid-run
+			return client.patch(f'/api/reports/{report_id}/status/', {
+				'status': self.rng.choice(['active', 'investigating']),
+				'reporter_id': reporter_id,
+			}, content_type='application/json')
+		if name == 'cleanup':
+			return client.post('/api/cleanup/resolved/')
+		raise ValueError(f'Unknown endpoint {name!r}')
+
+
+def measure(client, requests, name, args):
+	from disaster_response.profiling import profile_commands
+
+	for _ in range(args.warmup):
+		requests(client, name)
+
+	latencies, commands, errors = [], [], 0
+	for _ in range(args.iterations):
+		with profile_commands() as profile:
+			started = time.perf_counter()
+			response = requests(client, name)
+			elapsed = (time.perf_counter() - started) * 1000
+		if response.status_code >= 400:
+			errors += 1
+			continue
+		latencies.append(elapsed)
+		if not args.mongomock:
+			commands.append(profile.commands)
+
+	peaks = []
+	tracemalloc.start()
+	try:
+		for _ in range(args.memory_iterations):
+			tracemalloc.reset_peak()
+			baseline = tracemalloc.get_traced_memory()[0]
+			requests(client, name)
+			peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+	finally:
+		tracemalloc.stop()
+
+	return summarize(latencies, commands, peaks, errors)
+
+
+def run_size(size, args):
+	from django.test import Client
+	from reports import views
+	from reports.models import DisasterReport
+	from reports.snapshot import snapshot_manager
+
+	collection = DisasterReport._get_collection()
+	seed(collection, size, args)
+
+	if not args.no_snapshot:
+		started = time.perf_counter()
+		snapshot_manager.rebuild()
+		print(f'Built snapshot in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+	# Never call the external AI API from a benchmark
+	views.generate_ai_summary = views.generate_fallback_summary
+
+	client = Client()
+	requests = Requests(collection, random.Random(args.seed))
+	results = {}
+	for name in args.endpoints:
+		results[name] = measure(client, requests, name, args)
+		latency = results[name]['latency_ms'] or {}
+		print(f"{size:>9} {name:<14} p50={latency.get('p50')}ms p99={latency.get('p99')}ms", file=sys.stderr)
+
+	return {
+		'reports': size,
+		'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+		'endpoints': results,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+	parser.add_argument('--iterations', type=int, default=200, help='Timed requests per endpoint')
+	parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per endpoint')
+	parser.add_argument('--memory-iterations', type=int, default=5, help='Requests per endpoint under tracemalloc')
+	parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+	parser.add_argument('--uri', help='Override MONGODB_URI for the run')
+	parser.add_argument('--db', default='disaster_benchmark', help='Database to seed; it is overwritten')
+	parser.add_argument('--mongomock', action='store_true', help='Run against mongomock instead of a mongod')
+	parser.add_argument('--reuse', action='store_true', help='Keep an existing dataset of the right size')
+	parser.add_argument('--no-snapshot', action='store_true', help='Serve reads from MongoDB only')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', default='benchmark-results.json')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory(prefix='report-benchmark-') as workdir:
+		args.workdir = workdir
+		configure(args)
+		runs = [run_size(size, args) for size in args.sizes]
+
+	results = {
+		'meta': {
+			'commit': git_commit(),
+			'timestamp': datetime.now(timezone.utc).isoformat(),
+			'python': platform.python_version(),
+			'backend': 'mongomock' if args.mongomock else 'mongod',
+			'snapshot': not args.no_snapshot,
+			'iterations': args.iterations,
+			'seed': args.seed,
+		},
+		'runs': runs,
+	}
+	with open(args.output, 'w') as output:
+		json.dump(results, output, indent=2)
+	print(f'Wrote {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+	main()
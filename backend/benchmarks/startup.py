@@ -0,0 +1,81 @@
+"""
+Cold-start benchmark.
+
+Times, in fresh interpreters, how long it takes to import settings and run
+``manage.py check`` (what every worker and management command pays), and
+how long the first MongoDB round-trip takes afterwards.
+
+Usage:
+	python -m benchmarks.startup [--runs 5] [--uri mongodb://host:27017]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_QUERY_SNIPPET = """
+import os, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'disaster_response.settings')
+import django
+django.setup()
+from reports.models import DisasterReport
+started = time.perf_counter()
+try:
+	DisasterReport.objects.count()
+	ok = True
+except Exception:
+	ok = False
+print('FIRST_QUERY', time.perf_counter() - started, ok)
+"""
+
+
+def time_command(command, env):
+	started = time.perf_counter()
+	result = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+	return time.perf_counter() - started, result
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--runs', type=int, default=5)
+	parser.add_argument('--uri', help='Override MONGODB_URI for the run')
+	parser.add_argument('--skip-first-query', action='store_true')
+	args = parser.parse_args()
+
+	env = dict(os.environ)
+	if args.uri:
+		env['MONGODB_URI'] = args.uri
+
+	check_times = []
+	for _ in range(args.runs):
+		elapsed, _ = time_command([sys.executable, 'manage.py', 'check'], env)
+		check_times.append(elapsed)
+
+	results = {
+		'uri': env.get('MONGODB_URI', '').split('@')[-1],
+		'runs': args.runs,
+		'manage_check_seconds': {
+			'median': statistics.median(check_times),
+			'max': max(check_times),
+		},
+	}
+
+	if not args.skip_first_query:
+		_, result = time_command([sys.executable, '-c', FIRST_QUERY_SNIPPET], env)
+		for line in result.stdout.splitlines():
+			if line.startswith('FIRST_QUERY'):
+				_, seconds, ok = line.split()
+				results['first_query_seconds'] = float(seconds)
+				results['first_query_ok'] = ok == 'True'
+
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+	main()
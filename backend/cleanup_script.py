@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 """
-Simple script to cleanup resolved reports.
+Simple script to verify expiry of resolved reports.
+Resolved reports are deleted by a MongoDB TTL index; this keeps the index
+in sync with the configured retention and reports on expiry. With
+REPORT_ARCHIVE_ENABLED it archives and deletes them in batches first.
 Can be run via cron job or scheduled task.
 """
 
 import os
 import sys
 import django
-from datetime import timedelta
 
 # Add the project directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -16,45 +18,47 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'disaster_response.settings')
 django.setup()
 
-from django.core.management import call_command
+from django.conf import settings
 from django.utils import timezone
-from reports.models import DisasterReport
+from reports.archive import sweep_resolved_reports
+from reports.retention import retention_report
+from reports.snapshot import snapshot_manager
 
 
 def cleanup_resolved_reports():
 	"""
-	Cleanup resolved reports that have been resolved for more than 10 minutes.
+	Verify the TTL index and report resolved reports awaiting expiry.
 	"""
 	try:
-		# Calculate the cutoff time (10 minutes ago)
-		cutoff_time = timezone.now() - timedelta(minutes=10)
-		
-		# Find resolved reports that were updated more than 10 minutes ago
-		resolved_reports = DisasterReport.objects.filter(
-			status='resolved',
-			updated_at__lt=cutoff_time
-		)
-		
-		count = resolved_reports.count()
-		
-		if count == 0:
-			print(f"[{timezone.now()}] No resolved reports found to delete.")
-			return
-		
-		print(f"[{timezone.now()}] Found {count} resolved reports to delete:")
-		
-		# Log the reports being deleted
-		for report in resolved_reports:
-			print(f"  - {report.get_disaster_type_display()} (ID: {report.id}) - "
-				  f"Resolved: {report.updated_at.strftime('%Y-%m-%d %H:%M:%S')}")
-		
-		# Delete the reports
-		deleted_count = resolved_reports.delete()
-		
-		print(f"[{timezone.now()}] Successfully deleted {deleted_count} resolved reports.")
-		
+		if settings.REPORT_ARCHIVE_ENABLED:
+			result = sweep_resolved_reports()
+			if result['deleted_count']:
+				snapshot_manager.rebuild()
+			if result['skipped']:
+				print(f"[{timezone.now()}] Archive sweep skipped: another sweep is running.")
+			else:
+				print(f"[{timezone.now()}] Archived {result['archived_count']} and deleted "
+					  f"{result['deleted_count']} resolved reports "
+					  f"({', '.join(result['segments']) or 'no segments'}).")
+
+		report = retention_report(fix=True)
+		ttl_index = report['ttl_index']
+
+		if ttl_index['action'] in ('created', 'updated'):
+			print(f"[{timezone.now()}] TTL index {ttl_index['action']} "
+				  f"(expires after {ttl_index['expire_after_seconds']}s).")
+
+		print(f"[{timezone.now()}] {report['resolved_count']} resolved reports, "
+			  f"{report['pending_expiry']} awaiting TTL expiry, "
+			  f"{report['overdue']} overdue, "
+			  f"{report['missing_resolved_at']} missing resolved_at.")
+
+		if not report['healthy']:
+			print(f"[{timezone.now()}] Resolved report expiry is not healthy.")
+			sys.exit(1)
+
 	except Exception as e:
-		print(f"[{timezone.now()}] Error during cleanup: {str(e)}")
+		print(f"[{timezone.now()}] Error during cleanup check: {str(e)}")
 		sys.exit(1)
 
 
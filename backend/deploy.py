@@ -71,6 +71,11 @@ def run_migrations():
 	return run_command("python manage.py migrate", "Running migrations")
 
 
+def ensure_indexes():
+	"""Create the MongoDB indexes; reports don't create them on first use."""
+	return run_command("python manage.py ensure_indexes --skip-explain", "Ensuring MongoDB indexes")
+
+
 def collect_static():
 	"""Collect static files for production."""
 	return run_command("python manage.py collectstatic --noinput", "Collecting static files")
@@ -149,6 +154,10 @@ def main():
 		print("\n❌ Migration failed.")
 		return
 	
+	# Indexes back the feed, area and search queries
+	if not ensure_indexes():
+		print("\n⚠️  Index creation failed; run 'python manage.py ensure_indexes' once MongoDB is reachable.")
+	
 	# Collect static files (for production)
 	if os.getenv('DEBUG', 'True').lower() == 'false':
 		if not collect_static():
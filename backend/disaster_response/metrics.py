@@ -0,0 +1,182 @@
+"""
+Prometheus metrics.
+
+MetricsMiddleware times every request per view, method and status;
+MongoCommandMetrics is registered as a pymongo command listener on every
+client (sync and Motor); the outbound calls to the summarizer and to
+Cloudinary are timed with ``time_outbound``; cache lookups and the
+background rebuild queue are reported by the modules that own them.
+
+Under gunicorn each worker is a separate process. When
+PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) every worker
+writes its samples to memory-mapped files in that directory and
+``metrics_view`` aggregates them, so a scrape of any worker sees the whole
+server. Without it (runserver, tests) the metrics are per process.
+"""
+import asyncio
+import hmac
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+from .profiling import view_name
+
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+OUTBOUND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Time spent serving a request.',
+    ['view', 'method'], buckets=REQUEST_BUCKETS,
+)
+http_responses = Counter(
+    'http_responses_total', 'Responses sent.',
+    ['view', 'method', 'status'],
+)
+mongodb_command_duration = Histogram(
+    'mongodb_command_duration_seconds', 'Duration of MongoDB commands.',
+    ['command'], buckets=MONGO_BUCKETS,
+)
+mongodb_command_failures = Counter(
+    'mongodb_command_failures_total', 'MongoDB commands that failed.',
+    ['command'],
+)
+outbound_request_duration = Histogram(
+    'outbound_request_duration_seconds', 'Duration of calls to external services.',
+    ['service', 'outcome'], buckets=OUTBOUND_BUCKETS,
+)
+cache_requests = Counter(
+    'cache_requests_total', 'Cache lookups; hit ratio = hit / (hit + miss).',
+    ['cache', 'result'],
+)
+background_queue_depth = Gauge(
+    'background_queue_depth', 'Background jobs waiting to run, summed over live workers.',
+    ['queue'], multiprocess_mode='livesum',
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Time every MongoDB command by name."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongodb_command_duration.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        mongodb_command_duration.labels(event.command_name).observe(event.duration_micros / 1e6)
+        mongodb_command_failures.labels(event.command_name).inc()
+
+
+command_metrics = MongoCommandMetrics()
+
+
+class OutboundTimer:
+    __slots__ = ('outcome',)
+
+    def __init__(self):
+        self.outcome = 'ok'
+
+    def mark_failed(self):
+        self.outcome = 'error'
+
+
+@contextmanager
+def time_outbound(service):
+    """
+    Time a call to an external service. The outcome is 'error' when the
+    block raises and 'ok' otherwise; mark_failed() on the yielded timer
+    records an unsuccessful response that did not raise.
+    """
+    timer = OutboundTimer()
+    started = time.perf_counter()
+    try:
+        yield timer
+    except BaseException:
+        timer.outcome = 'error'
+        raise
+    finally:
+        outbound_request_duration.labels(service, timer.outcome).observe(time.perf_counter() - started)
+
+
+def cache_lookup(cache, hit):
+    """Count a cache lookup."""
+    cache_requests.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def set_queue_depth(queue, depth):
+    background_queue_depth.labels(queue).set(depth)
+
+
+class MetricsMiddleware:
+    """
+    Time every request and count its status per view.
+    Works under WSGI and ASGI without adapting the rest of the chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def finish(self, request, status, started):
+        view = view_name(request)
+        http_request_duration.labels(view, request.method).observe(time.perf_counter() - started)
+        http_responses.labels(view, request.method, str(status)).inc()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.finish(request, status, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self.finish(request, status, started)
+
+
+def collect():
+    """Return every worker's metrics in the Prometheus text format."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. With METRICS_TOKEN set, the scraper must
+    send it as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        supplied = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            return HttpResponseForbidden()
+    return HttpResponse(collect(), content_type=CONTENT_TYPE_LATEST)
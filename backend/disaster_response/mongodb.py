@@ -0,0 +1,282 @@
+"""
+Lazy MongoDB connection bootstrap.
+
+Importing settings never touches the network. ``register_connection`` only
+records the connection settings with MongoEngine (for ``mongodb+srv://``
+URIs that includes a single SRV lookup), and the pymongo client is created
+on first use. Readiness is established once by ``ensure_connection`` with a
+short server selection timeout, so an unreachable cluster fails fast instead
+of stalling startup. If registration itself fails (e.g. DNS is down) it is
+retried by ``ensure_connection``, which MongoReadinessMiddleware calls until
+the connection is registered.
+
+The async views use a Motor client with the same options, created lazily
+per event loop by ``get_async_database``.
+"""
+import asyncio
+import threading
+import time
+import weakref
+
+import mongoengine
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_connection
+from pymongo import monitoring, timeout as pymongo_timeout
+
+
+_lock = threading.Lock()
+_registered = False
+
+# Readiness of the default connection, reported by the health check
+readiness = {
+    'state': 'pending',     # pending -> ready | failed
+    'error': None,
+    'checked_at': None,
+    'ready_at': None,
+    'ping_ms': None,
+}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Track connection pool (CMAP) activity for the health endpoints.
+    Counters are per worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {
+                'pools_created': 0,
+                'pools_cleared': 0,
+                'connections_open': 0,
+                'connections_created': 0,
+                'connections_closed': 0,
+                'checked_out': 0,
+                'checkouts': 0,
+                'checkout_failures': 0,
+                'checkout_timeouts': 0,
+                'last_checkout_failure_at': None,
+                'max_checkout_wait_ms': 0.0,
+                'total_checkout_wait_ms': 0.0,
+            }
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+
+    def _waited_ms(self):
+        started = getattr(self._local, 'checkout_started', None)
+        self._local.checkout_started = None
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def pool_created(self, event):
+        self._count('pools_created')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('pools_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.stats['connections_created'] += 1
+            self.stats['connections_open'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.stats['connections_closed'] += 1
+            self.stats['connections_open'] -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        waited = self._waited_ms()
+        with self._lock:
+            self.stats['checkout_failures'] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.stats['checkout_timeouts'] += 1
+            self.stats['last_checkout_failure_at'] = time.time()
+            self.stats['max_checkout_wait_ms'] = max(self.stats['max_checkout_wait_ms'], waited)
+
+    def connection_checked_out(self, event):
+        waited = self._waited_ms()
+        with self._lock:
+            self.stats['checked_out'] += 1
+            self.stats['checkouts'] += 1
+            self.stats['total_checkout_wait_ms'] += waited
+            self.stats['max_checkout_wait_ms'] = max(self.stats['max_checkout_wait_ms'], waited)
+
+    def connection_checked_in(self, event):
+        self._count('checked_out', -1)
+
+    def snapshot(self):
+        """Return a copy of the counters plus derived pool utilisation."""
+        with self._lock:
+            stats = dict(self.stats)
+        max_pool_size = settings.MONGODB_CLIENT_OPTIONS['maxPoolSize']
+        stats['max_pool_size'] = max_pool_size
+        stats['utilisation'] = round(stats['checked_out'] / max_pool_size, 3) if max_pool_size else None
+        stats['avg_checkout_wait_ms'] = (
+            round(stats['total_checkout_wait_ms'] / stats['checkouts'], 3) if stats['checkouts'] else 0.0
+        )
+        return stats
+
+
+pool_stats = PoolStatsListener()
+
+
+def connection_options():
+    """Return the pymongo client options for the configured strategy."""
+    options = dict(settings.MONGODB_CLIENT_OPTIONS)
+    options['event_listeners'] = [pool_stats]
+    if settings.MONGODB_PROFILING_ENABLED:
+        from .profiling import command_profiler
+        options['event_listeners'].append(command_profiler)
+    if settings.METRICS_ENABLED:
+        from .metrics import command_metrics
+        options['event_listeners'].append(command_metrics)
+    if settings.MONGODB_TLS_ALLOW_INVALID_CERTIFICATES:
+        options['tlsAllowInvalidCertificates'] = True
+        options['tlsAllowInvalidHostnames'] = True
+    return options
+
+
+def register_connection():
+    """
+    Register the default MongoEngine connection without connecting.
+    Safe to call more than once; raises if the URI cannot be resolved.
+    """
+    global _registered
+    if _registered:
+        return
+    with _lock:
+        if _registered:
+            return
+        mongoengine.register_connection(
+            DEFAULT_CONNECTION_NAME,
+            db=settings.MONGODB_NAME,
+            host=settings.MONGODB_URI,
+            **connection_options(),
+        )
+        _registered = True
+
+
+def is_registered():
+    return _registered
+
+
+def try_register_connection():
+    """Register the connection at startup, recording a failure instead of raising."""
+    try:
+        register_connection()
+    except Exception as e:
+        readiness.update(state='failed', error=str(e), checked_at=time.time())
+        print(f"❌ MongoDB connection could not be registered: {e}")
+
+
+def ping(timeout_ms=None):
+    """Ping the server and return the round-trip time in milliseconds."""
+    register_connection()
+    client = get_connection()
+    started = time.perf_counter()
+    if timeout_ms is None:
+        client.admin.command('ping')
+    else:
+        # Bound the whole operation, including server selection
+        with pymongo_timeout(timeout_ms / 1000):
+            client.admin.command('ping')
+    return (time.perf_counter() - started) * 1000
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_database():
+    """
+    Return the Motor database for the running event loop. Motor clients are
+    bound to the loop they were first used on, so one is kept per loop
+    (a single one under an ASGI server).
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URI, **connection_options())
+        _async_clients[loop] = client
+    return client[settings.MONGODB_NAME]
+
+
+def ensure_connection():
+    """
+    Establish readiness once. After a failure the ping is retried at most
+    every MONGODB_RETRY_INTERVAL seconds; in between the cached state is returned.
+    """
+    if readiness['state'] == 'ready':
+        return readiness
+
+    with _lock:
+        now = time.time()
+        if readiness['state'] == 'ready':
+            return readiness
+        if (
+            readiness['state'] == 'failed'
+            and now - readiness['checked_at'] < settings.MONGODB_RETRY_INTERVAL
+        ):
+            return readiness
+
+    try:
+        ping_ms = ping()
+    except Exception as e:
+        with _lock:
+            readiness.update(state='failed', error=str(e), checked_at=time.time())
+        print(f"❌ MongoDB not ready: {e}")
+        return readiness
+
+    with _lock:
+        now = time.time()
+        readiness.update(state='ready', error=None, checked_at=now, ready_at=now, ping_ms=round(ping_ms, 2))
+    print("✅ MongoDB connected successfully")
+    return readiness
+
+
+class MongoReadinessMiddleware:
+    """
+    Retry registering the connection on requests until it succeeds.
+    Costs a single flag check once the connection is registered.
+    Works under WSGI and ASGI without adapting the rest of the chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function for Django's handler
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not _registered:
+            ensure_connection()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not _registered:
+            await sync_to_async(ensure_connection, thread_sensitive=False)()
+        return await self.get_response(request)
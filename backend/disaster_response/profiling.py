@@ -0,0 +1,255 @@
+"""
+Per-request MongoDB command profiling.
+
+CommandProfiler is registered as a pymongo command listener on every
+client (sync and Motor). For a sampled request, MongoProfilingMiddleware
+puts a RequestProfile in a context variable; the listener adds each
+command's duration to it, including commands Motor runs on its executor
+threads, which inherit the context. After the response the middleware
+folds the profile into per-view histograms, exposed by the admin-only
+profiling stats endpoint. The Server-Timing header is added with
+MONGODB_PROFILING_SERVER_TIMING (DEBUG by default) or for requests carrying
+a valid X-Stack-Profile token, which are always profiled.
+
+Unsampled requests cost one context variable lookup per command.
+"""
+import asyncio
+import bisect
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from pymongo import monitoring
+
+
+# Upper bounds (inclusive) of the histogram buckets; the last bucket is open
+DB_TIME_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+_current_profile = ContextVar('mongo_request_profile', default=None)
+
+
+class RequestProfile:
+    """MongoDB commands issued while serving one request."""
+
+    __slots__ = ('commands', 'db_ms', 'slowest_name', 'slowest_ms', 'failed', '_lock')
+
+    def __init__(self):
+        self.commands = 0
+        self.db_ms = 0.0
+        self.slowest_name = None
+        self.slowest_ms = 0.0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, duration_ms, failed=False):
+        # Motor may report from several executor threads at once
+        with self._lock:
+            self.commands += 1
+            self.db_ms += duration_ms
+            if failed:
+                self.failed += 1
+            if duration_ms >= self.slowest_ms:
+                self.slowest_name = name
+                self.slowest_ms = duration_ms
+
+    def server_timing(self):
+        """Return the Server-Timing header value for this profile."""
+        timing = f'db;dur={self.db_ms:.2f};desc="{self.commands} commands"'
+        if self.slowest_name:
+            timing += f', db-slowest;dur={self.slowest_ms:.2f};desc="{self.slowest_name}"'
+        return timing
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """Attribute command durations to the request being profiled, if any."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.add(event.command_name, event.duration_micros / 1000)
+
+    def failed(self, event):
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.add(event.command_name, event.duration_micros / 1000, failed=True)
+
+
+command_profiler = CommandProfiler()
+
+
+@contextmanager
+def profile_commands():
+    """Collect the commands issued inside the block into a RequestProfile."""
+    profile = RequestProfile()
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max."""
+
+    __slots__ = ('bounds', 'counts', 'total', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile, capped at the max."""
+        observations = sum(self.counts)
+        if not observations:
+            return None
+        rank = fraction * observations
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        labels = [f'<={bound}' for bound in self.bounds] + [f'>{self.bounds[-1]}']
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'sum': round(self.total, 3),
+            'max': round(self.max, 3),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class ViewStats:
+    __slots__ = ('requests', 'db_ms', 'commands', 'failed', 'slowest_name', 'slowest_ms')
+
+    def __init__(self):
+        self.requests = 0
+        self.db_ms = Histogram(DB_TIME_BUCKETS_MS)
+        self.commands = Histogram(COMMAND_COUNT_BUCKETS)
+        self.failed = 0
+        self.slowest_name = None
+        self.slowest_ms = 0.0
+
+    def observe(self, profile):
+        self.requests += 1
+        self.db_ms.observe(profile.db_ms)
+        self.commands.observe(profile.commands)
+        self.failed += profile.failed
+        if profile.slowest_ms >= self.slowest_ms and profile.slowest_name:
+            self.slowest_name = profile.slowest_name
+            self.slowest_ms = profile.slowest_ms
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'db_time_ms': self.db_ms.to_dict(),
+            'commands_per_request': self.commands.to_dict(),
+            'failed_commands': self.failed,
+            'slowest_command': {'name': self.slowest_name, 'duration_ms': round(self.slowest_ms, 3)},
+        }
+
+
+class ProfileStats:
+    """Per-view aggregates of sampled request profiles, per worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+            self.started_at = time.time()
+
+    def observe(self, view_name, profile):
+        with self._lock:
+            stats = self.views.get(view_name)
+            if stats is None:
+                stats = self.views[view_name] = ViewStats()
+            stats.observe(profile)
+
+    def snapshot(self):
+        with self._lock:
+            views = {name: stats.to_dict() for name, stats in sorted(self.views.items())}
+            started_at = self.started_at
+        return {
+            'sample_rate': settings.MONGODB_PROFILING_SAMPLE_RATE,
+            'since': started_at,
+            'views': views,
+        }
+
+
+profile_stats = ProfileStats()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or 'unnamed'
+
+
+class MongoProfilingMiddleware:
+    """
+    Profile the MongoDB commands of a sampled fraction of requests.
+    Works under WSGI and ASGI without adapting the rest of the chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def sampled(self):
+        rate = settings.MONGODB_PROFILING_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def signed(self, request):
+        """Whether the request carries a valid profiling token (see stack_profiler)."""
+        from .stack_profiler import HEADER, valid_token
+
+        token = request.META.get(HEADER)
+        return bool(token) and valid_token(token)
+
+    def finish(self, request, response, profile, signed):
+        if signed or settings.MONGODB_PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = profile.server_timing()
+        profile_stats.observe(view_name(request), profile)
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        signed = self.signed(request)
+        if not signed and not self.sampled():
+            return self.get_response(request)
+        with profile_commands() as profile:
+            response = self.get_response(request)
+        return self.finish(request, response, profile, signed)
+
+    async def __acall__(self, request):
+        signed = self.signed(request)
+        if not signed and not self.sampled():
+            return await self.get_response(request)
+        with profile_commands() as profile:
+            response = await self.get_response(request)
+        return self.finish(request, response, profile, signed)
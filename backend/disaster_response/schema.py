@@ -0,0 +1,155 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so outside
+DEBUG `/api/schema/` serves the artifact written at deploy time by
+``manage.py build_schema`` instead: YAML and JSON, each stored plain and
+gzipped in OPENAPI_SCHEMA_DIR. Responses carry the SHA-256 of the document
+as ETag (weak when gzipped), are gzipped for clients that accept it, and
+a matching If-None-Match gets a 304. Swagger UI and ReDoc fetch this same
+URL, so they no longer regenerate the schema either.
+
+Files are re-read only when their mtime changes, so rebuilding the schema
+in place needs no restart. Startup never fails on the schema: when the
+artifact is missing, the first request builds it, and if that fails too the
+schema is generated live for each request, as in DEBUG.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from reports.columnar import write_atomic
+
+
+# format: (file name, media type), as served by SpectacularAPIView
+FORMATS = {
+    'yaml': ('schema.yaml', 'application/vnd.oai.openapi'),
+    'json': ('schema.json', 'application/vnd.oai.openapi+json'),
+}
+
+_lock = threading.Lock()
+_artifacts = {}
+_build_lock = threading.Lock()
+_build_failed = False
+
+
+def build_schema(directory=None):
+    """Generate the schema and write every format, plain and gzipped. Returns {file: bytes}."""
+    from drf_spectacular.generators import SchemaGenerator
+    from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    directory = directory or settings.OPENAPI_SCHEMA_DIR
+    schema = SchemaGenerator().get_schema(request=None, public=spectacular_settings.SERVE_PUBLIC)
+    written = {}
+    for renderer in (OpenApiYamlRenderer(), OpenApiJsonRenderer()):
+        name, media_type = FORMATS[renderer.format]
+        data = renderer.render(schema, media_type, {})
+        for file_name, content in ((name, data), (f'{name}.gz', gzip.compress(data, 9, mtime=0))):
+            write_atomic(os.path.join(directory, file_name), content)
+            written[file_name] = len(content)
+    return written
+
+
+class SchemaArtifact:
+    """One format of the built schema, plain and gzipped."""
+
+    __slots__ = ('mtime_ns', 'media_type', 'data', 'gzipped', 'etag')
+
+    def __init__(self, mtime_ns, media_type, data, gzipped):
+        self.mtime_ns = mtime_ns
+        self.media_type = media_type
+        self.data = data
+        self.gzipped = gzipped
+        self.etag = '"%s"' % hashlib.sha256(data).hexdigest()
+
+
+def load_artifact(schema_format, directory=None):
+    """Return the built artifact of a format, or None when it has not been built."""
+    directory = directory or settings.OPENAPI_SCHEMA_DIR
+    name, media_type = FORMATS[schema_format]
+    path = os.path.join(directory, name)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    artifact = _artifacts.get(path)
+    if artifact is not None and artifact.mtime_ns == mtime_ns:
+        return artifact
+    with _lock:
+        with open(path, 'rb') as schema_file:
+            data = schema_file.read()
+        try:
+            with open(f'{path}.gz', 'rb') as gz_file:
+                gzipped = gz_file.read()
+        except FileNotFoundError:
+            gzipped = gzip.compress(data, 9, mtime=0)
+        artifact = _artifacts[path] = SchemaArtifact(mtime_ns, media_type, data, gzipped)
+    return artifact
+
+
+def build_missing_artifact(schema_format):
+    """Build the schema the deploy did not, once per process. Returns the artifact, or None."""
+    global _build_failed
+    with _build_lock:
+        artifact = load_artifact(schema_format)
+        if artifact is not None or _build_failed:
+            return artifact
+        try:
+            build_schema()
+        except Exception as e:
+            _build_failed = True
+            print(f"Failed to build the API schema, generating it per request: {e}")
+            return None
+        return load_artifact(schema_format)
+
+
+def live_schema(request):
+    """Generate the schema for this request, as SpectacularAPIView does in DEBUG."""
+    from drf_spectacular.views import SpectacularAPIView
+    return SpectacularAPIView.as_view()(request)
+
+
+def requested_format(request):
+    """?format=json|yaml wins, then the Accept header; YAML by default as SpectacularAPIView."""
+    schema_format = request.GET.get('format')
+    if schema_format in FORMATS:
+        return schema_format
+    return 'json' if 'json' in request.META.get('HTTP_ACCEPT', '') else 'yaml'
+
+
+def etag_matches(header, etag):
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def schema_view(request):
+    """Serve the precomputed schema with ETag revalidation and gzip."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    schema_format = requested_format(request)
+    artifact = load_artifact(schema_format) or build_missing_artifact(schema_format)
+    if artifact is None:
+        return live_schema(request)
+
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), artifact.etag):
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(artifact.gzipped, content_type=artifact.media_type)
+        response['Content-Encoding'] = 'gzip'
+        # Same document, different bytes: the gzipped body only matches weakly
+        response['ETag'] = f'W/{artifact.etag}'
+    else:
+        response = HttpResponse(artifact.data, content_type=artifact.media_type)
+    if not response.has_header('ETag'):
+        response['ETag'] = artifact.etag
+    response['Cache-Control'] = f'public, max-age={settings.OPENAPI_SCHEMA_MAX_AGE}'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
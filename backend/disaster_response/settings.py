@@ -1,7 +1,6 @@
 import os
 from pathlib import Path
 from decouple import config
-import mongoengine
 
 # -----------------------------
 # Base Directory
@@ -40,13 +39,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # must be first
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'disaster_response.middleware.StaticFilesMiddleware',  # async-capable WhiteNoise
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'disaster_response.mongodb.MongoReadinessMiddleware',
 ]
 
 # -----------------------------
@@ -74,127 +74,143 @@ WSGI_APPLICATION = 'disaster_response.wsgi.application'
 # -----------------------------
 # MongoDB (MongoEngine)
 # -----------------------------
-# MongoDB connection with Atlas-specific SSL configuration
-mongodb_connected = False
-connection_errors = []
-
-# Strategy 1: Connection with SSL parameters in URI
-try:
-    # Modify URI to include SSL parameters
-    mongodb_uri = config('MONGODB_URI')
-    if '?' in mongodb_uri:
-        mongodb_uri += '&ssl=true&tlsAllowInvalidCertificates=true&tlsAllowInvalidHostnames=true'
-    else:
-        mongodb_uri += '?ssl=true&tlsAllowInvalidCertificates=true&tlsAllowInvalidHostnames=true'
-    
-    mongoengine.connect(
-        db=config('MONGODB_NAME'),
-        host=mongodb_uri,
-        serverSelectionTimeoutMS=30000,
-        connectTimeoutMS=30000,
-        socketTimeoutMS=30000,
-        maxPoolSize=10,
-        retryWrites=True,
-    )
-    print("✅ MongoDB connected successfully (URI with SSL params)")
-    mongodb_connected = True
-except Exception as e:
-    connection_errors.append(f"URI SSL connection failed: {e}")
-    print(f"❌ MongoDB URI SSL connection failed: {e}")
-
-# Strategy 2: Simple connection (let MongoDB handle SSL automatically)
-if not mongodb_connected:
-    try:
-        mongoengine.connect(
-            db=config('MONGODB_NAME'),
-            host=config('MONGODB_URI'),
-            serverSelectionTimeoutMS=30000,
-            connectTimeoutMS=30000,
-            socketTimeoutMS=30000,
-            maxPoolSize=10,
-            retryWrites=True,
-        )
-        print("✅ MongoDB connected successfully (simple connection)")
-        mongodb_connected = True
-    except Exception as e:
-        connection_errors.append(f"Simple connection failed: {e}")
-        print(f"❌ MongoDB simple connection failed: {e}")
-
-# Strategy 2: Direct PyMongo connection
-if not mongodb_connected:
-    try:
-        from pymongo import MongoClient
-        
-        # Create direct PyMongo client
-        client = MongoClient(
-            config('MONGODB_URI'),
-            serverSelectionTimeoutMS=30000,
-            connectTimeoutMS=30000,
-            socketTimeoutMS=30000,
-            maxPoolSize=10,
-            retryWrites=True,
-        )
-        
-        # Test connection
-        client.admin.command('ping')
-        
-        # Connect MongoEngine to the existing client
-        mongoengine.connect(
-            db=config('MONGODB_NAME'),
-            _connect=False,  # Don't create new connection
-            mongo_client=client
-        )
-        
-        print("✅ MongoDB connected successfully (direct PyMongo)")
-        mongodb_connected = True
-    except Exception as e:
-        connection_errors.append(f"Direct PyMongo connection failed: {e}")
-        print(f"❌ MongoDB direct PyMongo connection failed: {e}")
-
-# Strategy 3: Atlas-specific TLS settings
-if not mongodb_connected:
-    try:
-        mongoengine.connect(
-            db=config('MONGODB_NAME'),
-            host=config('MONGODB_URI'),
-            serverSelectionTimeoutMS=30000,
-            connectTimeoutMS=30000,
-            socketTimeoutMS=30000,
-            maxPoolSize=10,
-            retryWrites=True,
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            tlsAllowInvalidHostnames=True,
-        )
-        print("✅ MongoDB connected successfully (Atlas TLS)")
-        mongodb_connected = True
-    except Exception as e:
-        connection_errors.append(f"Atlas TLS connection failed: {e}")
-        print(f"❌ MongoDB Atlas TLS connection failed: {e}")
-
-# Strategy 4: Minimal settings
-if not mongodb_connected:
-    try:
-        mongoengine.connect(
-            db=config('MONGODB_NAME'),
-            host=config('MONGODB_URI'),
-            serverSelectionTimeoutMS=60000,
-            connectTimeoutMS=60000,
-            socketTimeoutMS=60000,
-            maxPoolSize=5,
-            retryWrites=False,
-        )
-        print("✅ MongoDB connected successfully (minimal settings)")
-        mongodb_connected = True
-    except Exception as e:
-        connection_errors.append(f"Minimal connection failed: {e}")
-        print(f"❌ MongoDB minimal connection failed: {e}")
-
-if not mongodb_connected:
-    print("❌ All MongoDB connection strategies failed!")
-    print("Connection errors:", connection_errors)
-    # Don't raise error in production to allow app to start
-    # raise Exception("MongoDB connection failed")
+# The connection is registered lazily in ReportsConfig.ready() and only
+# opened on first use (see disaster_response/mongodb.py), so importing
+# settings never blocks on the network.
+MONGODB_URI = config('MONGODB_URI')
+MONGODB_NAME = config('MONGODB_NAME')
+
+MONGODB_CLIENT_OPTIONS = {
+    # Fail fast when the cluster is unreachable
+    'serverSelectionTimeoutMS': config('MONGODB_SERVER_SELECTION_TIMEOUT_MS', default=5000, cast=int),
+    'connectTimeoutMS': config('MONGODB_CONNECT_TIMEOUT_MS', default=5000, cast=int),
+    'socketTimeoutMS': config('MONGODB_SOCKET_TIMEOUT_MS', default=20000, cast=int),
+    # Connection pool (per worker process)
+    'maxPoolSize': config('MONGODB_MAX_POOL_SIZE', default=20, cast=int),
+    'minPoolSize': config('MONGODB_MIN_POOL_SIZE', default=0, cast=int),
+    'maxIdleTimeMS': config('MONGODB_MAX_IDLE_TIME_MS', default=60000, cast=int),
+    'waitQueueTimeoutMS': config('MONGODB_WAIT_QUEUE_TIMEOUT_MS', default=2000, cast=int),
+    'retryWrites': config('MONGODB_RETRY_WRITES', default=True, cast=bool),
+}
+
+# Atlas deployments behind interception proxies need relaxed TLS verification
+MONGODB_TLS_ALLOW_INVALID_CERTIFICATES = config('MONGODB_TLS_ALLOW_INVALID_CERTIFICATES', default=True, cast=bool)
+
+# Seconds between readiness retries after a failed ping
+MONGODB_RETRY_INTERVAL = config('MONGODB_RETRY_INTERVAL', default=5, cast=int)
+
+# Ping timeout used by the deep health and readiness checks
+MONGODB_HEALTH_TIMEOUT_MS = config('MONGODB_HEALTH_TIMEOUT_MS', default=500, cast=int)
+
+# Per-request command profiling: per-view histograms for a sampled fraction
+# of requests (see disaster_response/profiling.py). The Server-Timing header
+# exposes command counts and timings, so outside DEBUG it is only sent to
+# requests signed with a profiling token (`manage.py profile_token`)
+MONGODB_PROFILING_ENABLED = config('MONGODB_PROFILING_ENABLED', default=True, cast=bool)
+MONGODB_PROFILING_SAMPLE_RATE = config('MONGODB_PROFILING_SAMPLE_RATE', default=0.1, cast=float)
+MONGODB_PROFILING_SERVER_TIMING = config('MONGODB_PROFILING_SERVER_TIMING', default=DEBUG, cast=bool)
+if MONGODB_PROFILING_ENABLED:
+    MIDDLEWARE.append('disaster_response.profiling.MongoProfilingMiddleware')
+
+# Read preference per endpoint (URL name). Endpoints that tolerate slightly
+# stale data may read from secondaries; anything not listed uses 'default'.
+# Override with e.g. MONGODB_READ_ROUTING="report-detail=secondaryPreferred,default=primary"
+MONGODB_READ_ROUTING = {
+    'default': 'primary',
+    'reports-list': 'secondaryPreferred',
+    'simple-reports': 'secondaryPreferred',
+    'reports-summary': 'secondaryPreferred',
+    'ai-summary': 'secondaryPreferred',
+    'report-search': 'secondaryPreferred',
+    'report-markers': 'secondaryPreferred',
+}
+MONGODB_READ_ROUTING.update(
+    pair.strip().split('=', 1)
+    for pair in config('MONGODB_READ_ROUTING', default='').split(',')
+    if '=' in pair
+)
+
+# Upper bound on secondary replication lag for routed reads (MongoDB minimum is 90)
+MONGODB_MAX_STALENESS_SECONDS = config('MONGODB_MAX_STALENESS_SECONDS', default=90, cast=int)
+
+# -----------------------------
+# Shared report snapshot
+# -----------------------------
+# Memory-mapped columnar snapshot shared read-only by all workers
+REPORT_SNAPSHOT_ENABLED = config('REPORT_SNAPSHOT_ENABLED', default=True, cast=bool)
+REPORT_SNAPSHOT_PATH = config('REPORT_SNAPSHOT_PATH', default=str(BASE_DIR / 'var' / 'reports.snapshot'))
+REPORT_SNAPSHOT_MAX_AGE = config('REPORT_SNAPSHOT_MAX_AGE', default=60, cast=int)  # seconds
+
+# -----------------------------
+# Resolved report retention
+# -----------------------------
+# Resolved reports are expired by a MongoDB TTL index on resolved_at
+RESOLVED_REPORT_RETENTION_MINUTES = config('RESOLVED_REPORT_RETENTION_MINUTES', default=10, cast=int)
+
+# Optional cold archive: cleanup streams resolved reports into JSONL.gz segments
+# before deleting them. The TTL index then only acts as a backstop after the
+# grace period, so the archiver gets to every report first.
+REPORT_ARCHIVE_ENABLED = config('REPORT_ARCHIVE_ENABLED', default=False, cast=bool)
+REPORT_ARCHIVE_DIR = config('REPORT_ARCHIVE_DIR', default=str(BASE_DIR / 'var' / 'archive'))
+REPORT_ARCHIVE_BATCH_SIZE = config('REPORT_ARCHIVE_BATCH_SIZE', default=500, cast=int)
+REPORT_ARCHIVE_SEGMENT_MAX_REPORTS = config('REPORT_ARCHIVE_SEGMENT_MAX_REPORTS', default=50000, cast=int)
+RESOLVED_REPORT_TTL_GRACE_MINUTES = config(
+    'RESOLVED_REPORT_TTL_GRACE_MINUTES',
+    default=60 if REPORT_ARCHIVE_ENABLED else 0,
+    cast=int,
+)
+
+# -----------------------------
+# Region partitions
+# -----------------------------
+# Reports are partitioned by geohash prefix (see reports/regions.py). Every
+# region starts as a cell of REGION_BASE_PRECISION characters and
+# `manage.py rebalance_regions` splits regions holding more than
+# REGION_SPLIT_THRESHOLD reports, down to REGION_MAX_PRECISION.
+REGION_BASE_PRECISION = config('REGION_BASE_PRECISION', default=2, cast=int)
+REGION_MAX_PRECISION = config('REGION_MAX_PRECISION', default=6, cast=int)
+REGION_SPLIT_THRESHOLD = config('REGION_SPLIT_THRESHOLD', default=100000, cast=int)
+# Seconds a worker keeps its copy of the partition map
+REGION_MAP_REFRESH_SECONDS = config('REGION_MAP_REFRESH_SECONDS', default=60, cast=int)
+
+# -----------------------------
+# Priority ranking
+# -----------------------------
+# The feed's sort=priority order (see reports/priority.py): type and status
+# weights, boosted by the reports filed within the density radius and window,
+# halving every PRIORITY_HALF_LIFE_HOURS. `manage.py refresh_priorities`
+# keeps the density up to date.
+PRIORITY_HALF_LIFE_HOURS = config('PRIORITY_HALF_LIFE_HOURS', default=6, cast=float)
+PRIORITY_DENSITY_RADIUS_KM = config('PRIORITY_DENSITY_RADIUS_KM', default=1.0, cast=float)
+PRIORITY_DENSITY_WINDOW_HOURS = config('PRIORITY_DENSITY_WINDOW_HOURS', default=24, cast=float)
+
+# -----------------------------
+# Geofence alerts
+# -----------------------------
+# Subscribers register circles or polygons; new reports are matched against
+# them through a 2dsphere index and delivered to a polled inbox (see
+# reports/geofences.py). Unacknowledged alerts expire after the retention.
+GEOFENCE_ALERTS_ENABLED = config('GEOFENCE_ALERTS_ENABLED', default=True, cast=bool)
+GEOFENCE_MAX_RADIUS_KM = config('GEOFENCE_MAX_RADIUS_KM', default=50, cast=float)
+GEOFENCE_MAX_VERTICES = config('GEOFENCE_MAX_VERTICES', default=100, cast=int)
+GEOFENCE_MAX_PER_SUBSCRIBER = config('GEOFENCE_MAX_PER_SUBSCRIBER', default=10, cast=int)
+GEOFENCE_ALERT_RETENTION_HOURS = config('GEOFENCE_ALERT_RETENTION_HOURS', default=72, cast=float)
+
+# -----------------------------
+# Report event log
+# -----------------------------
+# Creates, status changes and deletes are appended to the report_events log
+# (see reports/events.py); `manage.py run_projections` folds it into the read
+# models of reports/projections.py. A missing sequence number holds readers
+# back for the gap grace, in case its writer has not committed yet.
+EVENT_LOG_ENABLED = config('EVENT_LOG_ENABLED', default=True, cast=bool)
+EVENT_LOG_GAP_GRACE_SECONDS = config('EVENT_LOG_GAP_GRACE_SECONDS', default=60, cast=int)
+PROJECTION_BATCH_SIZE = config('PROJECTION_BATCH_SIZE', default=1000, cast=int)
+PROJECTION_TIMESERIES_HOURS = config('PROJECTION_TIMESERIES_HOURS', default=48, cast=int)
+# Background jobs (projections, archive sweeps) hold a lease on their
+# job_checkpoints document this long, renewed after every batch, so
+# overlapping runs skip instead of doing the same work twice
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=600, cast=int)
 
 # -----------------------------
 # Default Django DB (for admin/auth)
@@ -278,6 +294,42 @@ SPECTACULAR_SETTINGS = {
     'SCHEMA_PATH_PREFIX': '/api/',
 }
 
+# Outside DEBUG /api/schema/ serves the schema built at deploy time by
+# manage.py build_schema (see disaster_response/schema.py)
+OPENAPI_SCHEMA_DIR = config('OPENAPI_SCHEMA_DIR', default=str(BASE_DIR / 'var' / 'openapi'))
+OPENAPI_SCHEMA_MAX_AGE = config('OPENAPI_SCHEMA_MAX_AGE', default=300, cast=int)
+
+# -----------------------------
+# Metrics
+# -----------------------------
+# Prometheus metrics on /metrics (see disaster_response/metrics.py). Under
+# gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a shared
+# directory so every worker's samples are aggregated.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+# When set, scrapers must send "Authorization: Bearer <token>"
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+if METRICS_ENABLED:
+    # Right after CORS, so the timing covers the rest of the chain
+    MIDDLEWARE.insert(1, 'disaster_response.metrics.MetricsMiddleware')
+
+# -----------------------------
+# Stack profiler
+# -----------------------------
+# Opt-in sampled stack profiles written as collapsed stacks per view (see
+# disaster_response/stack_profiler.py). A request is profiled when it sends an
+# X-Stack-Profile token signed with STACK_PROFILER_SECRET (manage.py
+# profile_token) or falls in STACK_PROFILER_SAMPLE_RATE.
+STACK_PROFILER_ENABLED = config('STACK_PROFILER_ENABLED', default=False, cast=bool)
+STACK_PROFILER_SECRET = config('STACK_PROFILER_SECRET', default='')
+STACK_PROFILER_SAMPLE_RATE = config('STACK_PROFILER_SAMPLE_RATE', default=0.0, cast=float)
+STACK_PROFILER_INTERVAL_MS = config('STACK_PROFILER_INTERVAL_MS', default=5, cast=float)
+STACK_PROFILER_DIR = config('STACK_PROFILER_DIR', default=str(BASE_DIR / 'var' / 'stack-profiles'))
+STACK_PROFILER_MAX_FILE_BYTES = config('STACK_PROFILER_MAX_FILE_BYTES', default=5 * 1024 * 1024, cast=int)
+STACK_PROFILER_BACKUPS = config('STACK_PROFILER_BACKUPS', default=3, cast=int)
+STACK_PROFILER_MAX_BYTES = config('STACK_PROFILER_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+if STACK_PROFILER_ENABLED:
+    MIDDLEWARE.append('disaster_response.stack_profiler.StackProfilingMiddleware')
+
 # -----------------------------
 # Upload limits
 # -----------------------------
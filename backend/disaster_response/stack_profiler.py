@@ -0,0 +1,229 @@
+"""
+Sampled stack profiling of selected requests.
+
+StackProfilingMiddleware profiles a request when it carries a valid
+X-Stack-Profile token (see ``manage.py profile_token``) or falls in the
+STACK_PROFILER_SAMPLE_RATE fraction. A sampler thread then records the
+stack of the thread serving the request every STACK_PROFILER_INTERVAL_MS
+until the response is ready, and the samples are appended to
+``<view>.collapsed`` in STACK_PROFILER_DIR, one ``frame;frame;frame count``
+line per distinct stack. flamegraph.pl, speedscope or inferno render those
+files offline.
+
+A file is rotated to .1, .2, ... once it reaches STACK_PROFILER_MAX_FILE_BYTES,
+keeping STACK_PROFILER_BACKUPS of them, and the oldest files are removed
+while the directory holds more than STACK_PROFILER_MAX_BYTES. Workers
+serialise writes and rotation on a lock file.
+
+Async views run on the event loop thread, so their profile also holds any
+other coroutine the loop ran meanwhile. Requests that are not profiled cost
+one random() call.
+"""
+import asyncio
+import fcntl
+import hashlib
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from .profiling import view_name
+
+
+HEADER = 'HTTP_X_STACK_PROFILE'
+SUFFIX = '.collapsed'
+
+
+def sign_token(expires, secret=None):
+    """Return the header value allowing profiling until the expires timestamp."""
+    secret = secret or settings.STACK_PROFILER_SECRET
+    signature = hmac.new(secret.encode(), str(int(expires)).encode(), hashlib.sha256).hexdigest()
+    return f'{int(expires)}.{signature}'
+
+
+def valid_token(token, secret=None, now=None):
+    """Whether a header value is correctly signed and not expired."""
+    secret = secret or settings.STACK_PROFILER_SECRET
+    if not secret or not token or '.' not in token:
+        return False
+    expires, _ = token.split('.', 1)
+    if not expires.isdigit() or int(expires) < (now or time.time()):
+        return False
+    return hmac.compare_digest(token, sign_token(int(expires), secret))
+
+
+def frame_label(code, base_dir):
+    """Name a frame by function and definition site, so its samples merge across lines."""
+    path = code.co_filename
+    if path.startswith(base_dir):
+        path = os.path.relpath(path, base_dir)
+    else:
+        # Library frames: keep the package-relative tail
+        parts = path.split(os.sep)
+        path = '/'.join(parts[-2:])
+    return f'{code.co_name} ({path}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """Sample the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._labels = {}
+        self._base_dir = str(settings.BASE_DIR) + os.sep
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = frame_label(code, self._base_dir)
+        return label
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        if labels:
+            self.stacks[';'.join(reversed(labels))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def collapsed(stacks):
+    """Format sampled stacks in the collapsed-stack format."""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.items())
+
+
+def profile_path(view, directory=None):
+    directory = directory or settings.STACK_PROFILER_DIR
+    return os.path.join(directory, re.sub(r'[^\w.-]', '_', view) + SUFFIX)
+
+
+def rotate(path, backups):
+    """Shift path to path.1, path.1 to path.2, ..., dropping the oldest."""
+    for index in range(backups, 0, -1):
+        source = path if index == 1 else f'{path}.{index - 1}'
+        if os.path.exists(source):
+            os.replace(source, f'{path}.{index}')
+    if backups == 0 and os.path.exists(path):
+        os.remove(path)
+
+
+def enforce_budget(directory, max_bytes):
+    """Remove the oldest profile files until the directory fits in max_bytes."""
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and SUFFIX in entry.name:
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def write_profile(view, stacks, directory=None):
+    """Append sampled stacks to the view's profile, rotating within the disk budget."""
+    if not stacks:
+        return
+    directory = directory or settings.STACK_PROFILER_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = profile_path(view, directory)
+    data = collapsed(stacks).encode()
+
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(data) > settings.STACK_PROFILER_MAX_FILE_BYTES:
+                rotate(path, settings.STACK_PROFILER_BACKUPS)
+            with open(path, 'ab') as profile_file:
+                profile_file.write(data)
+            enforce_budget(directory, settings.STACK_PROFILER_MAX_BYTES)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class StackProfilingMiddleware:
+    """
+    Sample the stacks of signed or randomly selected requests.
+    Works under WSGI and ASGI without adapting the rest of the chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def selected(self, request):
+        token = request.META.get(HEADER)
+        if token:
+            return valid_token(token)
+        rate = settings.STACK_PROFILER_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def start(self):
+        return StackSampler(threading.get_ident(), settings.STACK_PROFILER_INTERVAL_MS / 1000).start()
+
+    def finish(self, request, response, sampler):
+        stacks = sampler.stop()
+        view = view_name(request)
+        try:
+            write_profile(view, stacks)
+        except OSError as e:
+            print(f"Failed to write stack profile for {view}: {e}")
+        response['X-Stack-Profile'] = f'{view}; samples={sum(stacks.values())}'
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.selected(request):
+            return self.get_response(request)
+        sampler = self.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            sampler.stop()
+            raise
+        return self.finish(request, response, sampler)
+
+    async def __acall__(self, request):
+        if not self.selected(request):
+            return await self.get_response(request)
+        sampler = self.start()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            sampler.stop()
+            raise
+        return self.finish(request, response, sampler)
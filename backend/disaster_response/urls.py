@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from .schema import schema_view
 
 urlpatterns = [
     # Admin
@@ -27,12 +28,17 @@ urlpatterns = [
     # API endpoints
     path('api/', include('reports.urls')),
     
-    # API Documentation
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    # API Documentation: generated live only in DEBUG, otherwise built at deploy time
+    path('api/schema/', SpectacularAPIView.as_view() if settings.DEBUG else schema_view, name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 ]
 
+# Prometheus scrape endpoint
+if settings.METRICS_ENABLED:
+    from .metrics import metrics_view
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
+
 # Serve media files in development
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration.
+
+Prometheus metrics are aggregated across workers through files in
+PROMETHEUS_MULTIPROC_DIR (see disaster_response/metrics.py). The directory
+must be set before any worker imports prometheus_client and emptied on
+every start, and a dead worker's live gauges are dropped when it exits.
+"""
+import os
+import shutil
+import tempfile
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = 120
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus-multiproc'))
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
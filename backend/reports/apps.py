@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
+
+    def ready(self):
+        # Register the MongoDB connection lazily; nothing connects until first use
+        from disaster_response.mongodb import try_register_connection
+        try_register_connection()
@@ -0,0 +1,615 @@
+"""
+Cold archive of resolved reports.
+
+Resolved reports past the retention window are walked in bounded batches,
+streamed into compressed, append-only JSONL.gz segments and only then
+deleted with a single ``delete_many`` per batch, logged to the report event
+log. Nothing is held in memory beyond the current batch.
+
+Every batch is written as its own gzip member and fsynced before the delete,
+so a segment is a valid (concatenated) gzip file even if the sweep dies half
+way, and no report is deleted before it is on disk. Segments are written
+under a ``.partial`` name and renamed once complete, so compaction only ever
+sees finished segments; the next sweep publishes those a dead sweep left.
+
+One sweep runs at a time: the cron job and the cleanup endpoint share a
+lease (see JobCheckpoint.lease), so they never archive the same reports into
+two segments. A report reopened after its batch was written but before the
+delete stays live; its id is added to the segment's ``.discarded`` list,
+which compaction skips.
+
+Each finished JSONL.gz segment is then compacted into an immutable columnar
+segment (``.col``) whose header carries the segment's time and bounding-box
+min/max. Archive queries prune whole segments from the header alone and scan
+the survivors through read-only memory maps, so history never touches MongoDB.
+
+Columnar segment layout (little-endian, 8-byte aligned columns):
+
+	header           magic, row count, heap size, created_at min/max,
+	                 resolved_at min/max, latitude min/max, longitude min/max
+	created_at       int64[count]   ms since epoch, sorted oldest first
+	resolved_at      int64[count]
+	latitude         float64[count]
+	longitude        float64[count]
+	ids              12 bytes[count]
+	desc_offsets     uint32[count + 1]
+	reporter_offsets uint32[count + 1]
+	image_offsets    uint32[count + 1]
+	types            uint8[count]
+	statuses         uint8[count]
+	heap             utf-8 descriptions, reporter ids and image URLs
+"""
+import glob
+import gzip
+import heapq
+import itertools
+import math
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+
+from bson import ObjectId, json_util
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ASCENDING
+
+from .columnar import StringColumn, from_millis, pack, read_string, to_millis, view_columns, write_atomic
+from .events import reports_deleted
+from .models import DisasterReport, JobCheckpoint
+from .retention import retention_seconds
+from .snapshot import STATUS_CODES, TYPE_CODES, choice_code, choice_value
+from .utils import haversine_distance
+
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+PARTIAL_SUFFIX = '.partial'
+# Ids written to a segment but not deleted (reopened meanwhile), one per line
+DISCARDED_SUFFIX = '.discarded'
+COLUMNAR_SUFFIX = '.col'
+COLUMNAR_MAGIC = b'DRARCH01'
+COLUMNAR_HEADER = struct.Struct('<8sIIqqqqdddd')
+
+# Mapped segments kept open per process
+MAX_OPEN_SEGMENTS = 64
+
+
+class ArchiveSegmentWriter:
+	"""
+	Append batches of report documents to JSONL.gz segments,
+	rotating to a new segment after max_reports documents.
+
+	A segment is written under a ``.partial`` name and only renamed to its
+	final name when the writer rotates or closes, so compaction never reads
+	a segment that is still growing.
+	"""
+
+	def __init__(self, directory=None, max_reports=None, prefix='resolved'):
+		self.directory = directory or settings.REPORT_ARCHIVE_DIR
+		self.max_reports = max_reports or settings.REPORT_ARCHIVE_SEGMENT_MAX_REPORTS
+		self.prefix = prefix
+		self.stamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+		self.segments = []
+		self._sequence = 0
+		self._current = None
+		self._current_count = 0
+		os.makedirs(self.directory, exist_ok=True)
+
+	def _next_segment(self):
+		self.close()
+		self._sequence += 1
+		name = f'{self.prefix}-{self.stamp}-{os.getpid()}-{self._sequence:04d}{SEGMENT_SUFFIX}'
+		self._current = os.path.join(self.directory, name)
+		self._current_count = 0
+		self.segments.append(name)
+
+	def write_batch(self, documents):
+		"""
+		Durably append documents; returns the ids that were written.
+		"""
+		ids = []
+		lines = []
+		for document in documents:
+			ids.append(document['_id'])
+			lines.append(json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS))
+		if not lines:
+			return ids
+
+		if self._current is None or self._current_count >= self.max_reports:
+			self._next_segment()
+		member = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+		with open(partial_path(self._current), 'ab') as segment:
+			segment.write(member)
+			segment.flush()
+			os.fsync(segment.fileno())
+
+		self._current_count += len(ids)
+		return ids
+
+	def discard(self, ids):
+		"""
+		Drop written documents from the current segment, e.g. reports reopened
+		before they could be deleted: their ids are appended to the segment's
+		discard list, which iter_segment() skips.
+		"""
+		if not ids:
+			return
+		with open(discarded_path(self._current), 'a') as discarded:
+			discarded.write(''.join(f'{document_id}\n' for document_id in ids))
+			discarded.flush()
+			os.fsync(discarded.fileno())
+
+	def close(self):
+		"""Publish the current segment under its final name."""
+		if self._current is not None:
+			os.replace(partial_path(self._current), self._current)
+			self._current = None
+
+
+def partial_path(segment_path):
+	"""Return the name a segment is written under until it is complete."""
+	return segment_path + PARTIAL_SUFFIX
+
+
+def publish_partial_segments(directory):
+	"""
+	Publish the segments left ``.partial`` by a sweep that died: their reports
+	are already deleted from MongoDB. Only call this while holding the sweep lease.
+	"""
+	published = []
+	for path in sorted(glob.glob(os.path.join(directory, f'*{SEGMENT_SUFFIX}{PARTIAL_SUFFIX}'))):
+		segment_path = path[:-len(PARTIAL_SUFFIX)]
+		os.replace(path, segment_path)
+		published.append(os.path.basename(segment_path))
+	return published
+
+
+def resolved_cutoff(now=None):
+	"""Resolved reports older than this are due for archiving."""
+	return (now or timezone.now()) - timedelta(seconds=retention_seconds())
+
+
+SWEEP_JOB_NAME = 'archive_sweep'
+
+
+def sweep_resolved_reports(batch_size=None, directory=None, dry_run=False):
+	"""
+	Archive and delete resolved reports past the retention window.
+	Returns counts and the names of the segments written; skipped is True
+	when another sweep (cron or the cleanup endpoint) holds the lease.
+	"""
+	batch_size = batch_size or settings.REPORT_ARCHIVE_BATCH_SIZE
+	collection = DisasterReport._get_collection()
+	query = {'status': 'resolved', 'resolved_at': {'$lt': resolved_cutoff()}}
+
+	if dry_run:
+		return {
+			'matched_count': collection.count_documents(query),
+			'archived_count': 0,
+			'deleted_count': 0,
+			'batches': 0,
+			'segments': [],
+			'skipped': False,
+		}
+
+	with JobCheckpoint.lease(SWEEP_JOB_NAME) as lease:
+		if lease is None:
+			return {
+				'matched_count': 0,
+				'archived_count': 0,
+				'deleted_count': 0,
+				'batches': 0,
+				'segments': [],
+				'skipped': True,
+			}
+		writer = ArchiveSegmentWriter(directory=directory)
+		# Compacted below along with this sweep's own segments
+		recovered = publish_partial_segments(writer.directory)
+		try:
+			archived_count, deleted_count, batches = sweep_batches(collection, query, batch_size, writer, lease)
+		finally:
+			# Its reports are deleted: the segment must become visible even if the sweep failed
+			writer.close()
+
+	for name in recovered + writer.segments:
+		try:
+			compact_segment(os.path.join(writer.directory, name))
+		except Exception as e:
+			# The JSONL.gz copy is durable; build_archive_segments can retry
+			print(f"Failed to compact archive segment {name}: {e}")
+
+	return {
+		'matched_count': archived_count,
+		'archived_count': archived_count,
+		'deleted_count': deleted_count,
+		'batches': batches,
+		'segments': writer.segments,
+		'skipped': False,
+	}
+
+
+def sweep_batches(collection, query, batch_size, writer, lease):
+	"""Archive and delete due reports batch by batch. Returns (archived, deleted, batches)."""
+	archived_count = deleted_count = batches = 0
+	stalled = None
+
+	while JobCheckpoint.renew(SWEEP_JOB_NAME, lease):
+		# Deleted batches drop out of the query, so no cursor state is needed
+		ids = [
+			document['_id']
+			for document in collection.find(query, {'_id': 1})
+			.sort('resolved_at', ASCENDING)
+			.limit(batch_size)
+		]
+		if not ids or set(ids) == stalled:
+			# Done, or the same batch again after it made no progress
+			break
+
+		# Re-apply the filter so a report reopened meanwhile is left alone
+		documents = list(collection.find({'_id': {'$in': ids}, **query}))
+		written_ids = writer.write_batch(documents)
+		archived_count += len(written_ids)
+		batches += 1
+
+		deleted = 0
+		if written_ids:
+			deleted = collection.delete_many({'_id': {'$in': written_ids}, 'status': 'resolved'}).deleted_count
+		deleted_count += deleted
+		if deleted < len(written_ids):
+			# Reopened between the write and the delete: live again, so out of the archive
+			kept = {row['_id'] for row in collection.find({'_id': {'$in': written_ids}}, {'_id': 1})}
+			writer.discard(kept)
+			archived_count -= len(kept)
+			documents = [document for document in documents if document['_id'] not in kept]
+		reports_deleted(documents, reason='archived')
+
+		# A batch lost to reopening or TTL expiry leaves the query; carry on with the next
+		stalled = set(ids) if not deleted else None
+
+	return archived_count, deleted_count, batches
+
+
+def discarded_path(segment_path):
+	"""Return the path of the ids discarded from a JSONL.gz segment."""
+	return segment_path[:-len(SEGMENT_SUFFIX)] + DISCARDED_SUFFIX
+
+
+def discarded_ids(segment_path):
+	try:
+		with open(discarded_path(segment_path)) as discarded:
+			return {ObjectId(line.strip()) for line in discarded if line.strip()}
+	except FileNotFoundError:
+		return set()
+
+
+def iter_segment(path):
+	"""Stream the report documents stored in a JSONL.gz segment, less the discarded ones."""
+	discarded = discarded_ids(path)
+	with gzip.open(path, 'rt', encoding='utf-8') as segment:
+		for line in segment:
+			if line.strip():
+				document = json_util.loads(line)
+				if document['_id'] not in discarded:
+					yield document
+
+
+def columnar_path(segment_path):
+	"""Return the columnar segment path for a JSONL.gz segment."""
+	return segment_path[:-len(SEGMENT_SUFFIX)] + COLUMNAR_SUFFIX
+
+
+def encode_columnar_segment(documents):
+	"""
+	Encode archived report documents into the columnar segment layout.
+	"""
+	documents = sorted(documents, key=lambda document: to_millis(document.get('created_at')))
+
+	created_at = array('q')
+	resolved_at = array('q')
+	latitude = array('d')
+	longitude = array('d')
+	ids = bytearray()
+	types = bytearray()
+	statuses = bytearray()
+	heap = bytearray()
+
+	for document in documents:
+		created_at.append(to_millis(document.get('created_at')))
+		resolved_at.append(to_millis(document.get('resolved_at') or document.get('updated_at')))
+		latitude.append(document.get('latitude') or 0.0)
+		longitude.append(document.get('longitude') or 0.0)
+		ids += ObjectId(document['_id']).binary
+		types.append(choice_code(TYPE_CODES, document.get('disaster_type')))
+		statuses.append(choice_code(STATUS_CODES, document.get('status')))
+
+	# One pass per string column keeps each column's heap range contiguous
+	descriptions = StringColumn(heap)
+	for document in documents:
+		descriptions.append(document.get('description'))
+	reporters = StringColumn(heap)
+	for document in documents:
+		reporters.append(document.get('reporter_id'))
+	images = StringColumn(heap)
+	for document in documents:
+		images.append(document.get('image'))
+
+	def bounds(column):
+		return (min(column), max(column)) if len(column) else (0, 0)
+
+	header = COLUMNAR_HEADER.pack(
+		COLUMNAR_MAGIC, len(created_at), len(heap),
+		*bounds(created_at), *bounds(resolved_at),
+		*bounds(latitude), *bounds(longitude),
+	)
+	columns = (
+		created_at, resolved_at, latitude, longitude, ids,
+		descriptions.offsets, reporters.offsets, images.offsets,
+		types, statuses,
+	)
+	return pack(header, columns, heap)
+
+
+def compact_segment(segment_path, overwrite=False):
+	"""
+	Build the immutable columnar copy of a JSONL.gz segment.
+	Returns the columnar path, or None if it already existed.
+	"""
+	target = columnar_path(segment_path)
+	if os.path.exists(target) and not overwrite:
+		return None
+	write_atomic(target, encode_columnar_segment(iter_segment(segment_path)))
+	return target
+
+
+class SegmentMetadata:
+	"""Header-only view of a columnar segment, used for pruning."""
+
+	def __init__(self, path, header):
+		(
+			magic, self.count, self.heap_size,
+			self.created_min, self.created_max,
+			self.resolved_min, self.resolved_max,
+			self.lat_min, self.lat_max,
+			self.lng_min, self.lng_max,
+		) = COLUMNAR_HEADER.unpack(header)
+		if magic != COLUMNAR_MAGIC:
+			raise ValueError(f'Not an archive segment: {path}')
+		self.path = path
+
+	@classmethod
+	def read(cls, path):
+		with open(path, 'rb') as segment:
+			return cls(path, segment.read(COLUMNAR_HEADER.size))
+
+	def overlaps(self, since_ms=None, until_ms=None, bbox=None):
+		"""Return False when the segment cannot contain a match."""
+		if not self.count:
+			return False
+		if since_ms is not None and self.created_max < since_ms:
+			return False
+		if until_ms is not None and self.created_min > until_ms:
+			return False
+		if bbox is not None:
+			min_lng, min_lat, max_lng, max_lat = bbox
+			if self.lat_max < min_lat or self.lat_min > max_lat:
+				return False
+			if self.lng_max < min_lng or self.lng_min > max_lng:
+				return False
+		return True
+
+
+class ArchiveSegment:
+	"""
+	Read-only, zero-copy view over a mapped columnar archive segment.
+	"""
+
+	def __init__(self, path):
+		with open(path, 'rb') as segment:
+			self._mmap = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+
+		buf = memoryview(self._mmap)
+		self.metadata = SegmentMetadata(path, bytes(buf[:COLUMNAR_HEADER.size]))
+		count = self.metadata.count
+		offsets_width = 4 * (count + 1)
+
+		columns, offset = view_columns(buf, COLUMNAR_HEADER.size, [
+			('created_at', 'q', 8 * count),
+			('resolved_at', 'q', 8 * count),
+			('latitude', 'd', 8 * count),
+			('longitude', 'd', 8 * count),
+			('ids', 'B', 12 * count),
+			('desc_offsets', 'I', offsets_width),
+			('reporter_offsets', 'I', offsets_width),
+			('image_offsets', 'I', offsets_width),
+			('types', 'B', count),
+			('statuses', 'B', count),
+		])
+		self.columns = columns
+		self.heap = buf[offset:offset + self.metadata.heap_size]
+
+	def _time_range(self, since_ms, until_ms):
+		"""Binary search the created_at column (oldest first) for a time range."""
+		created_at = self.columns['created_at']
+		low, high = 0, self.metadata.count
+		if since_ms is not None:
+			while low < high:
+				middle = (low + high) // 2
+				if created_at[middle] < since_ms:
+					low = middle + 1
+				else:
+					high = middle
+		start, high = low, self.metadata.count
+		if until_ms is not None:
+			while low < high:
+				middle = (low + high) // 2
+				if created_at[middle] <= until_ms:
+					low = middle + 1
+				else:
+					high = middle
+			return start, low
+		return start, high
+
+	def matching(self, since_ms=None, until_ms=None, bbox=None, circle=None, type_codes=None, status_codes=None):
+		"""
+		Yield (created_at, row index) for matching rows, newest first.
+		"""
+		columns = self.columns
+		created_at, latitude, longitude = columns['created_at'], columns['latitude'], columns['longitude']
+		types, statuses = columns['types'], columns['statuses']
+		start, stop = self._time_range(since_ms, until_ms)
+
+		for index in range(stop - 1, start - 1, -1):
+			if type_codes is not None and types[index] not in type_codes:
+				continue
+			if status_codes is not None and statuses[index] not in status_codes:
+				continue
+			lat, lng = latitude[index], longitude[index]
+			if bbox is not None:
+				min_lng, min_lat, max_lng, max_lat = bbox
+				if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+					continue
+			if circle is not None:
+				center_lat, center_lng, radius_km = circle
+				if haversine_distance(center_lat, center_lng, lat, lng) > radius_km:
+					continue
+			yield created_at[index], index
+
+	def row(self, index):
+		"""Decode one archived report."""
+		columns = self.columns
+		return {
+			'id': str(ObjectId(bytes(columns['ids'][index * 12:index * 12 + 12]))),
+			'disaster_type': choice_value(TYPE_CODES, columns['types'][index]),
+			'description': read_string(self.heap, columns['desc_offsets'], index),
+			'latitude': columns['latitude'][index],
+			'longitude': columns['longitude'][index],
+			'status': choice_value(STATUS_CODES, columns['statuses'][index]),
+			'reporter_id': read_string(self.heap, columns['reporter_offsets'], index) or None,
+			'image': read_string(self.heap, columns['image_offsets'], index) or None,
+			'created_at': from_millis(columns['created_at'][index]),
+			'resolved_at': from_millis(columns['resolved_at'][index]),
+		}
+
+
+class ArchiveStore:
+	"""
+	Per-process access to the columnar archive segments.
+	Segment files are immutable, so headers and maps are cached by path.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._metadata = {}
+		self._segments = OrderedDict()
+
+	@property
+	def directory(self):
+		return settings.REPORT_ARCHIVE_DIR
+
+	def metadata(self):
+		"""Return metadata for every columnar segment, newest data first."""
+		paths = glob.glob(os.path.join(self.directory, f'*{COLUMNAR_SUFFIX}'))
+		result = []
+		with self._lock:
+			for path in paths:
+				metadata = self._metadata.get(path)
+				if metadata is None:
+					try:
+						metadata = self._metadata[path] = SegmentMetadata.read(path)
+					except (OSError, ValueError, struct.error) as e:
+						print(f"Skipping unreadable archive segment {path}: {e}")
+						continue
+				result.append(metadata)
+		return sorted(result, key=lambda metadata: metadata.created_max, reverse=True)
+
+	def segment(self, path):
+		"""Return the mapped segment for path, keeping at most MAX_OPEN_SEGMENTS open."""
+		with self._lock:
+			segment = self._segments.get(path)
+			if segment is None:
+				segment = self._segments[path] = ArchiveSegment(path)
+				while len(self._segments) > MAX_OPEN_SEGMENTS:
+					self._segments.popitem(last=False)
+			else:
+				self._segments.move_to_end(path)
+			return segment
+
+	def query(self, since=None, until=None, bbox=None, circle=None, types=None, statuses=None):
+		"""
+		Return an ArchiveResults sequence of matching archived reports, newest first.
+
+		bbox    (min_lng, min_lat, max_lng, max_lat)
+		circle  (lat, lng, radius_km)
+		"""
+		since_ms = to_millis(since) if since is not None else None
+		until_ms = to_millis(until) if until is not None else None
+
+		if circle is not None:
+			# Prune segments on the circle's bounding box, filter exactly per row
+			lat, lng, radius_km = circle
+			lat_delta = radius_km / 111.0
+			lng_delta = radius_km / max(111.0 * abs(math.cos(math.radians(lat))), 1e-6)
+			circle_bbox = (lng - lng_delta, lat - lat_delta, lng + lng_delta, lat + lat_delta)
+			bbox = circle_bbox if bbox is None else (
+				max(bbox[0], circle_bbox[0]), max(bbox[1], circle_bbox[1]),
+				min(bbox[2], circle_bbox[2]), min(bbox[3], circle_bbox[3]),
+			)
+
+		type_codes = {choice_code(TYPE_CODES, value) for value in types} if types else None
+		status_codes = {choice_code(STATUS_CODES, value) for value in statuses} if statuses else None
+
+		matches = []
+		scanned = 0
+		for metadata in self.metadata():
+			if not metadata.overlaps(since_ms, until_ms, bbox):
+				continue
+			segment = self.segment(metadata.path)
+			scanned += 1
+			rows = [
+				(created, index, segment)
+				for created, index in segment.matching(since_ms, until_ms, bbox, circle, type_codes, status_codes)
+			]
+			if rows:
+				matches.append(rows)
+
+		return ArchiveResults(matches, segments_scanned=scanned)
+
+
+class ArchiveResults:
+	"""
+	Lazy, paginator-friendly sequence of archived reports.
+	Rows are only decoded for the requested slice.
+	"""
+
+	def __init__(self, matches, segments_scanned=0):
+		self.matches = matches
+		self.segments_scanned = segments_scanned
+		self._count = sum(len(rows) for rows in matches)
+
+	def __len__(self):
+		return self._count
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			return self[key:key + 1][0]
+		start, stop, _ = key.indices(self._count)
+		# Each segment's matches are newest first; merge them lazily
+		merged = heapq.merge(*self.matches, key=lambda match: match[0], reverse=True)
+		return [segment.row(index) for _, index, segment in itertools.islice(merged, start, stop)]
+
+
+archive_store = ArchiveStore()
+
+
+def compact_pending_segments(overwrite=False, directory=None):
+	"""Compact every JSONL.gz segment that has no columnar copy yet."""
+	directory = directory or settings.REPORT_ARCHIVE_DIR
+	built = []
+	for segment_path in sorted(glob.glob(os.path.join(directory, f'*{SEGMENT_SUFFIX}'))):
+		target = compact_segment(segment_path, overwrite=overwrite)
+		if target:
+			built.append(os.path.basename(target))
+	return built
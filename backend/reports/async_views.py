@@ -0,0 +1,524 @@
+"""
+Async report endpoints for ASGI deployments.
+
+Mirrors the list, detail, create, status-update and summary endpoints with
+Motor for MongoDB and httpx for outbound HTTP (Cloudinary, the AI summary),
+so a worker never blocks a thread on I/O and one process can hold many
+requests in flight. Validation and serialization reuse the sync
+serializers, and documents are loaded with DisasterReport._from_son, so
+the responses match the sync endpoints. Served under /api/async/ next to
+the sync views, which remain the default.
+
+Run under an ASGI server, e.g.:
+	gunicorn disaster_response.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import json
+import uuid
+import weakref
+from datetime import timedelta
+
+import cloudinary.utils
+import httpx
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.utils import timezone
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from disaster_response.metrics import time_outbound
+from disaster_response.mongodb import get_async_database
+from .models import DisasterReport
+from .retention import ensure_ttl_index_once
+from .routing import read_preference_for
+from .serializers import (
+	IMAGE_UPLOAD_OPTIONS,
+	CreateDisasterReportSerializer,
+	DisasterReportSerializer,
+	UpdateReportStatusSerializer,
+)
+from .facets import (
+	area_counts_pipeline,
+	area_filters,
+	facet_counts,
+	facet_pipeline,
+	parse_area_counts,
+	parse_facet_filters,
+	parse_facet_result,
+	parse_sort,
+)
+from .fieldsets import mongo_projection, parse_fieldset
+from .geofences import deliver_alerts_async
+from .events import append_events_async, event_data
+from .snapshot import get_snapshot, reports_changed
+from .utils import fingerprint_reporter_id
+from .views import (
+	AI_SUMMARY_API_URL,
+	AI_SUMMARY_HEADERS,
+	AI_SUMMARY_TIMEOUT,
+	CustomPagination,
+	ai_summary_payload,
+	build_ai_summary_prompt,
+	generate_fallback_summary,
+	parse_ai_summary,
+	summary_counts_by_type,
+)
+
+
+IMAGE_UPLOAD_TIMEOUT = 30
+
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client():
+	"""Return the pooled httpx client for the running event loop."""
+	loop = asyncio.get_running_loop()
+	client = _http_clients.get(loop)
+	if client is None:
+		client = httpx.AsyncClient(timeout=AI_SUMMARY_TIMEOUT)
+		_http_clients[loop] = client
+	return client
+
+
+def reports_collection(endpoint=None):
+	"""Return the Motor reports collection, routed for endpoint if given."""
+	collection = get_async_database()[DisasterReport._get_collection_name()]
+	if endpoint is None:
+		# Writes and read-after-write always go to the primary
+		return collection
+	return collection.with_options(read_preference=read_preference_for(endpoint))
+
+
+def csrf_exempt(view):
+	"""
+	Mark an async view CSRF exempt, like the DRF views it mirrors.
+	django.views.decorators.csrf.csrf_exempt wraps views in a sync function.
+	"""
+	view.csrf_exempt = True
+	return view
+
+
+def request_data(request):
+	"""Return the JSON or form (with files) request body as a dict."""
+	if request.content_type == 'application/json':
+		return json.loads(request.body or b'{}')
+	data = request.POST.dict()
+	data.update(request.FILES.dict())
+	return data
+
+
+def to_report(document):
+	return DisasterReport._from_son(document)
+
+
+def serialize_reports(documents, fieldset=None):
+	context = {'fields': fieldset.fields, 'compat': fieldset.compat} if fieldset else {}
+	return DisasterReportSerializer([to_report(document) for document in documents], many=True, context=context).data
+
+
+def page_bounds(request):
+	"""Return (page, page_size) using the same rules as CustomPagination."""
+	page_size = CustomPagination.page_size
+	try:
+		requested = int(request.GET[CustomPagination.page_size_query_param])
+		if requested > 0:
+			page_size = min(requested, CustomPagination.max_page_size)
+	except (KeyError, ValueError):
+		pass
+
+	page = int(request.GET.get('page', 1))
+	if page < 1:
+		raise ValueError('Invalid page.')
+	return page, page_size
+
+
+def page_links(request, page, page_size, count):
+	url = request.build_absolute_uri()
+	next_url = replace_query_param(url, 'page', page + 1) if page * page_size < count else None
+	if page <= 1:
+		previous_url = None
+	elif page == 2:
+		previous_url = remove_query_param(url, 'page')
+	else:
+		previous_url = replace_query_param(url, 'page', page - 1)
+	return next_url, previous_url
+
+
+async def load_ordered(collection, ids, projection=None):
+	"""Load documents by id in one $in query, preserving the order of ids."""
+	if not ids:
+		return []
+	cursor = collection.find({'_id': {'$in': ids}}, projection)
+	documents = {document['_id']: document async for document in cursor}
+	return [documents[report_id] for report_id in ids if report_id in documents]
+
+
+async def reports_list_view(request):
+	"""
+	Async counterpart of ReportsListView, with the same filters, facets and fieldsets.
+	"""
+	if request.method != 'GET':
+		return HttpResponseNotAllowed(['GET'])
+	try:
+		page, page_size = page_bounds(request)
+	except ValueError:
+		return JsonResponse({'detail': 'Invalid page.'}, status=404)
+
+	start = (page - 1) * page_size
+	collection = reports_collection('reports-list')
+	try:
+		filters = parse_facet_filters(request.GET)
+		sort = parse_sort(request.GET)
+		fieldset = parse_fieldset(request.GET)
+	except ValueError as e:
+		return JsonResponse(
+			{'results': [], 'count': 0, 'next': None, 'previous': None, 'error': f'Invalid filter: {e}'},
+			status=400
+		)
+
+	try:
+		snapshot = get_snapshot()
+		if snapshot is not None:
+			# Filter, order and count from the shared snapshot; only the page is read from MongoDB
+			positions, type_counts, status_counts = snapshot.filter(
+				types=filters.types,
+				statuses=filters.statuses,
+				since=filters.since,
+				until=filters.until,
+				circle=filters.circle,
+				bbox=filters.bbox,
+				sort=sort,
+			)
+			count = len(positions)
+			facets = facet_counts(type_counts, status_counts)
+			ids = [snapshot.id_at(position) for position in positions[start:start + page_size]]
+			documents = await load_ordered(collection, ids, mongo_projection(fieldset))
+		else:
+			# One $facet aggregation returns the page, the total and the facet counts
+			pipeline = facet_pipeline(filters, start, page_size, mongo_projection(fieldset), sort)
+			results = await collection.aggregate(pipeline).to_list(length=1)
+			documents, count, facets = parse_facet_result(results[0])
+	except Exception as e:
+		print(f"Error in reports_list_view: {e}")
+		return JsonResponse(
+			{
+				'results': [],
+				'count': 0,
+				'next': None,
+				'previous': None,
+				'error': 'Failed to fetch reports'
+			},
+			status=500
+		)
+
+	if page > 1 and not documents:
+		return JsonResponse({'detail': 'Invalid page.'}, status=404)
+
+	next_url, previous_url = page_links(request, page, page_size, count)
+	return JsonResponse({
+		'count': count,
+		'next': next_url,
+		'previous': previous_url,
+		'results': serialize_reports(documents, fieldset),
+		'facets': facets,
+	})
+
+
+async def report_detail_view(request, id):
+	"""
+	Async counterpart of ReportDetailView, with the same fieldsets.
+	"""
+	if request.method != 'GET':
+		return HttpResponseNotAllowed(['GET'])
+	try:
+		fieldset = parse_fieldset(request.GET)
+	except ValueError as e:
+		return JsonResponse({'error': f'Invalid fields: {e}'}, status=400)
+	try:
+		document = await reports_collection('report-detail').find_one({'_id': ObjectId(id)}, mongo_projection(fieldset))
+	except InvalidId:
+		document = None
+	if document is None:
+		return JsonResponse({'detail': 'Report not found'}, status=404)
+	context = {'fields': fieldset.fields, 'compat': fieldset.compat}
+	return JsonResponse(DisasterReportSerializer(to_report(document), context=context).data)
+
+
+async def upload_image(image_file):
+	"""Upload an image to Cloudinary with the same options as the sync path."""
+	try:
+		params = cloudinary.utils.build_upload_params(**IMAGE_UPLOAD_OPTIONS)
+		params = cloudinary.utils.sign_request(params, {})
+		with time_outbound('image-upload'):
+			response = await get_http_client().post(
+				cloudinary.utils.cloudinary_api_url('upload', resource_type=IMAGE_UPLOAD_OPTIONS['resource_type']),
+				data=params,
+				files={'file': (image_file.name, image_file.read(), image_file.content_type)},
+				timeout=IMAGE_UPLOAD_TIMEOUT,
+			)
+			result = response.json()
+			if 'error' in result:
+				raise ValueError(result['error'].get('message'))
+		return result['secure_url']
+	except Exception as e:
+		print(f"Cloudinary upload failed: {e}")
+		# Fallback to placeholder if upload fails
+		return f"upload_failed_{image_file.name}"
+
+
+@csrf_exempt
+async def create_report_view(request):
+	"""
+	Async counterpart of CreateReportView.
+	"""
+	if request.method != 'POST':
+		return HttpResponseNotAllowed(['POST'])
+
+	# Generate reporter ID using browser fingerprinting (same as get_reporter_id_view)
+	try:
+		reporter_id = fingerprint_reporter_id(request)
+	except Exception as e:
+		print(f"Error generating reporter ID in create: {e}")
+		reporter_id = f"reporter_{uuid.uuid4().hex[:8]}"
+
+	try:
+		data = request_data(request)
+	except ValueError:
+		return JsonResponse({'success': False, 'error': 'Invalid JSON body.'}, status=400)
+	data['reporter_id'] = reporter_id
+
+	serializer = CreateDisasterReportSerializer(data=data)
+	if not serializer.is_valid():
+		return JsonResponse({
+			'success': False,
+			'error': 'Failed to create report. Please check your data.',
+			'errors': serializer.errors
+		}, status=400)
+
+	validated_data = dict(serializer.validated_data)
+	image_file = validated_data.pop('image', None)
+	image_url = await upload_image(image_file) if image_file else None
+
+	report = serializer.build_report(validated_data, image_url)
+	report.updated_at = timezone.now()
+	report.validate()
+	result = await reports_collection().insert_one(report.to_mongo().to_dict())
+	report.id = result.inserted_id
+	reports_changed()
+	document = report.to_mongo().to_dict()
+	await append_events_async(get_async_database(), [('created', report.id, event_data(document))])
+	await deliver_alerts_async(get_async_database(), document)
+
+	# Rendered from the written document, never re-read from a secondary
+	return JsonResponse({
+		'success': True,
+		'report': DisasterReportSerializer(report).data,
+		'reporter_id': reporter_id
+	}, status=201)
+
+
+@csrf_exempt
+async def update_report_status_view(request, id):
+	"""
+	Async counterpart of UpdateReportStatusView.
+	"""
+	if request.method not in ('PUT', 'PATCH'):
+		return HttpResponseNotAllowed(['PUT', 'PATCH'])
+
+	collection = reports_collection()
+	try:
+		document = await collection.find_one({'_id': ObjectId(id)})
+	except InvalidId:
+		document = None
+	if document is None:
+		return JsonResponse({'detail': 'Report not found'}, status=404)
+	instance = to_report(document)
+
+	try:
+		data = request_data(request)
+	except ValueError:
+		return JsonResponse({'success': False, 'error': 'Invalid JSON body.'}, status=400)
+
+	# Get reporter ID from request data (required for authorization)
+	request_reporter_id = data.get('reporter_id')
+	if not request_reporter_id:
+		return JsonResponse({
+			'success': False,
+			'error': 'reporter_id is required for status updates'
+		}, status=400)
+
+	# Validate that the reporter ID matches the report's reporter ID
+	if instance.reporter_id and instance.reporter_id != request_reporter_id:
+		return JsonResponse({
+			'success': False,
+			'error': 'Unauthorized: Only the original reporter can update this report'
+		}, status=403)
+
+	serializer = UpdateReportStatusSerializer(instance, data=data, partial=request.method == 'PATCH')
+	if not serializer.is_valid():
+		return JsonResponse({
+			'success': False,
+			'error': 'Invalid status',
+			'errors': serializer.errors
+		}, status=400)
+
+	changes = serializer.status_changes(instance, serializer.validated_data.get('status', instance.status))
+	if changes.get('resolved_at'):
+		await sync_to_async(ensure_ttl_index_once, thread_sensitive=False)()
+	changes['updated_at'] = timezone.now()
+	await collection.update_one({'_id': instance.id}, {'$set': changes})
+	previous_status = instance.status
+	for attr, value in changes.items():
+		setattr(instance, attr, value)
+	reports_changed()
+	if instance.status != previous_status:
+		await append_events_async(get_async_database(), [
+			('status_changed', instance.id, event_data(instance.to_mongo().to_dict(), previous_status=previous_status)),
+		])
+
+	return JsonResponse({
+		'success': True,
+		'report': DisasterReportSerializer(instance).data
+	})
+
+
+async def count_by(collection, match, *fields):
+	"""Count documents per value of each field in a single $facet aggregation."""
+	pipeline = [
+		{'$match': match},
+		{'$facet': {
+			field: [{'$group': {'_id': f'${field}', 'count': {'$sum': 1}}}]
+			for field in fields
+		}},
+	]
+	result = await collection.aggregate(pipeline).to_list(length=1)
+	facets = result[0] if result else {}
+	return {
+		field: {group['_id']: group['count'] for group in facets.get(field, [])}
+		for field in fields
+	}
+
+
+async def reports_summary_view(request):
+	"""
+	Async counterpart of reports_summary_view, with the same area filters.
+	"""
+	if request.method != 'GET':
+		return HttpResponseNotAllowed(['GET'])
+	try:
+		area = area_filters(request.GET)
+	except ValueError as e:
+		return JsonResponse({'error': f'Invalid filter: {e}'}, status=400)
+	try:
+		snapshot = get_snapshot()
+		if area.circle or area.bbox:
+			if snapshot is not None:
+				_, type_counts, status_counts = snapshot.filter(circle=area.circle, bbox=area.bbox)
+			else:
+				results = await reports_collection('reports-summary').aggregate(area_counts_pipeline(area)).to_list(length=1)
+				type_counts, status_counts = parse_area_counts(results[0])
+			counts = facet_counts(type_counts, status_counts)
+			type_counts, status_counts = counts['type'], counts['status']
+		elif snapshot is not None:
+			# Served from the shared snapshot without touching MongoDB
+			type_counts = snapshot.count_by_type()
+			status_counts = snapshot.count_by_status()
+		else:
+			counts = await count_by(reports_collection('reports-summary'), {}, 'disaster_type', 'status')
+			type_counts = counts['disaster_type']
+			status_counts = {
+				name: counts['status'].get(name, 0)
+				for name, _ in DisasterReport.STATUS_CHOICES
+			}
+
+		return JsonResponse({
+			'total_reports': sum(status_counts.values()),
+			'by_type': summary_counts_by_type(type_counts),
+			'by_status': status_counts,
+			'last_updated': timezone.now().isoformat(),
+		})
+	except Exception as e:
+		print(f"Error in async reports_summary_view: {e}")
+		return JsonResponse({'error': 'Failed to generate summary'}, status=500)
+
+
+async def generate_ai_summary(summary_counts, reports_data):
+	"""
+	Generate AI-powered summary using Hugging Face Inference API.
+	"""
+	try:
+		prompt = build_ai_summary_prompt(summary_counts, reports_data)
+		with time_outbound('ai-summary') as call:
+			response = await get_http_client().post(
+				AI_SUMMARY_API_URL,
+				headers=AI_SUMMARY_HEADERS,
+				json=ai_summary_payload(prompt),
+			)
+			if response.status_code != 200:
+				call.mark_failed()
+		if response.status_code == 200:
+			summary = parse_ai_summary(prompt, response.json())
+			if summary:
+				return summary
+	except Exception as e:
+		print(f"AI Summary Generation Error: {e}")
+	return generate_fallback_summary(summary_counts, reports_data)
+
+
+async def ai_summary_view(request):
+	"""
+	Async counterpart of ai_summary_view.
+	"""
+	if request.method != 'GET':
+		return HttpResponseNotAllowed(['GET'])
+	last_24_hours = timezone.now() - timedelta(hours=24)
+
+	try:
+		snapshot = get_snapshot()
+		if snapshot is not None:
+			recent_count = snapshot.created_since(last_24_hours)
+			summary_counts = summary_counts_by_type(snapshot.count_by_type(recent_count))
+			reports_data = [
+				{
+					'type': snapshot.type_at(index),
+					'description': snapshot.description_at(index),
+					'status': snapshot.status_at(index),
+					'location': f"{snapshot.latitude[index]:.4f}, {snapshot.longitude[index]:.4f}"
+				}
+				for index in range(recent_count)
+			]
+		else:
+			cursor = reports_collection('ai-summary').find(
+				{'created_at': {'$gte': last_24_hours}},
+				{'disaster_type': 1, 'description': 1, 'status': 1, 'latitude': 1, 'longitude': 1},
+				sort=[('created_at', -1)],
+			)
+			reports_data = [
+				{
+					'type': document.get('disaster_type'),
+					'description': document.get('description'),
+					'status': document.get('status'),
+					'location': f"{document['latitude']:.4f}, {document['longitude']:.4f}"
+				}
+				async for document in cursor
+			]
+			type_counts = {}
+			for report in reports_data:
+				type_counts[report['type']] = type_counts.get(report['type'], 0) + 1
+			summary_counts = summary_counts_by_type(type_counts)
+	except Exception as e:
+		print(f"AI Summary Error: {e}")
+		return JsonResponse({'error': 'Failed to generate summary'}, status=500)
+
+	if sum(summary_counts.values()) == 0:
+		summary_text = "No disaster reports in the last 24 hours. The area appears to be safe with no emergency incidents reported."
+	else:
+		summary_text = await generate_ai_summary(summary_counts, reports_data)
+
+	return JsonResponse({
+		'summary': summary_text,
+		'last24Hours': summary_counts,
+		'location': 'Global',
+		'generatedAt': timezone.now().isoformat(),
+	})
@@ -0,0 +1,99 @@
+"""
+Helpers for the compact columnar binary files (report snapshot, archive segments).
+
+A file is a fixed-size header followed by fixed-width columns, each padded
+to an 8-byte boundary, and an optional utf-8 string heap at the end.
+Readers map the file and cast memoryviews over the columns, so nothing is
+copied or parsed up front.
+"""
+import os
+import tempfile
+from array import array
+from calendar import timegm
+from datetime import datetime, timezone as dt_timezone
+
+
+def to_millis(value):
+	"""Convert a (naive UTC or aware) datetime to ms since epoch."""
+	if value is None:
+		return 0
+	if value.tzinfo is not None:
+		value = value.astimezone(dt_timezone.utc)
+	return timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def from_millis(value):
+	"""Convert ms since epoch to an aware UTC datetime."""
+	return datetime.fromtimestamp(value / 1000, tz=dt_timezone.utc)
+
+
+def align(offset):
+	"""Round offset up to the next 8-byte boundary."""
+	return (offset + 7) & ~7
+
+
+class StringColumn:
+	"""
+	Variable-length strings stored as offsets into a shared heap.
+	"""
+
+	def __init__(self, heap, max_chars=None):
+		self.heap = heap
+		self.max_chars = max_chars
+		self.offsets = array('I', [len(heap)])
+
+	def append(self, value):
+		value = value or ''
+		if self.max_chars is not None:
+			value = value[:self.max_chars]
+		self.heap += value.encode('utf-8')
+		self.offsets.append(len(self.heap))
+
+
+def pack(header, columns, heap=b''):
+	"""Concatenate a packed header, aligned columns and the string heap."""
+	out = bytearray(header)
+	out += b'\0' * (align(len(out)) - len(out))
+	for column in columns:
+		out += column.tobytes() if isinstance(column, array) else bytes(column)
+		out += b'\0' * (align(len(out)) - len(out))
+	out += heap
+	return bytes(out)
+
+
+def view_columns(buf, offset, layout):
+	"""
+	Cast memoryviews over the columns described by layout, a list of
+	(name, format, byte width). Returns the views and the offset after them.
+	"""
+	offset = align(offset)
+	columns = {}
+	for name, fmt, width in layout:
+		columns[name] = buf[offset:offset + width].cast(fmt)
+		offset = align(offset + width)
+	return columns, offset
+
+
+def read_string(heap, offsets, index):
+	"""Decode the string at index from a heap and its offsets column."""
+	start, end = offsets[index], offsets[index + 1]
+	return bytes(heap[start:end]).decode('utf-8', errors='ignore')
+
+
+def write_atomic(path, data):
+	"""
+	Write data to path so readers only ever see the old or the new file.
+	"""
+	directory = os.path.dirname(path) or '.'
+	os.makedirs(directory, exist_ok=True)
+	fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+	try:
+		with os.fdopen(fd, 'wb') as tmp_file:
+			tmp_file.write(data)
+			tmp_file.flush()
+			os.fsync(tmp_file.fileno())
+		os.replace(tmp_path, path)
+	except Exception:
+		if os.path.exists(tmp_path):
+			os.unlink(tmp_path)
+		raise
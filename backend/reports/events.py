@@ -0,0 +1,169 @@
+"""
+Append-only report event log.
+
+Every create, status change and delete of a DisasterReport appends a
+ReportEvent carrying a sequence number and the fields the read models need
+(type, status, location), so derived views are folded from the log instead
+of recomputed by scanning the collection (see reports/projections.py).
+
+Sequence numbers come from one counter document in `event_sequences`: a
+writer reserves a block with a single $inc and numbers its events from it,
+so a batch of deletes costs one counter update. Numbers are unique and
+increasing but committed out of order by concurrent writers, and a writer
+that dies between reserving and inserting leaves a hole; readers therefore
+stop at a missing number until EVENT_LOG_GAP_GRACE_SECONDS have passed
+(see contiguous()).
+
+Appending is best effort, as for geofence alerts: the report write has
+already happened, so a failure is logged and the request goes on. Reports
+deleted by the TTL index are removed by MongoDB itself and are not logged;
+`manage.py run_projections --backfill` logs a created event for reports
+that predate the log or were bulk loaded.
+"""
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReturnDocument
+
+from .columnar import to_millis
+from .models import ReportEvent
+
+
+SEQUENCE_COLLECTION = 'event_sequences'
+SEQUENCE_NAME = 'report_events'
+
+# The report fields copied into every event
+EVENT_FIELDS = ('disaster_type', 'status', 'geohash', 'latitude', 'longitude', 'created_at')
+EVENT_PROJECTION = {field: 1 for field in EVENT_FIELDS}
+
+
+def event_data(report, **extra):
+	"""The event payload of a raw report document."""
+	data = {field: report.get(field) for field in EVENT_FIELDS}
+	data.update(extra)
+	return data
+
+
+def sequence_reservation(count):
+	"""The counter update reserving `count` sequence numbers."""
+	return (
+		{'_id': SEQUENCE_NAME},
+		{'$inc': {'value': count}},
+	)
+
+
+def numbered(last, events):
+	"""Number events with the block of sequence numbers ending at last."""
+	first = last - len(events) + 1
+	now = timezone.now()
+	return [
+		{'_id': first + offset, 'kind': kind, 'report': report_id, 'data': data, 'occurred_at': now}
+		for offset, (kind, report_id, data) in enumerate(events)
+	]
+
+
+def append_events(events):
+	"""
+	Append (kind, report id, data) events to the log in one insert.
+	Returns the documents written, or [] when the log is disabled or failed.
+	"""
+	if not settings.EVENT_LOG_ENABLED or not events:
+		return []
+	try:
+		collection = ReportEvent._get_collection()
+		counter = collection.database[SEQUENCE_COLLECTION].find_one_and_update(
+			*sequence_reservation(len(events)), upsert=True, return_document=ReturnDocument.AFTER,
+		)
+		documents = numbered(counter['value'], events)
+		collection.insert_many(documents, ordered=True)
+		return documents
+	except Exception as e:
+		# The report change is stored either way; --rebuild cannot recover this event
+		print(f"Failed to append {len(events)} report events: {e}")
+		return []
+
+
+async def append_events_async(database, events):
+	"""append_events() through a Motor database."""
+	if not settings.EVENT_LOG_ENABLED or not events:
+		return []
+	try:
+		counter = await database[SEQUENCE_COLLECTION].find_one_and_update(
+			*sequence_reservation(len(events)), upsert=True, return_document=ReturnDocument.AFTER,
+		)
+		documents = numbered(counter['value'], events)
+		await database[ReportEvent._get_collection_name()].insert_many(documents, ordered=True)
+		return documents
+	except Exception as e:
+		print(f"Failed to append {len(events)} report events: {e}")
+		return []
+
+
+def report_created(report):
+	"""Log the creation of a report (raw document)."""
+	return append_events([('created', report['_id'], event_data(report))])
+
+
+def report_status_changed(report, previous_status):
+	"""Log a status change of a report (raw document, after the change)."""
+	if report.get('status') == previous_status:
+		return []
+	return append_events([('status_changed', report['_id'], event_data(report, previous_status=previous_status))])
+
+
+def reports_deleted(reports, reason):
+	"""Log the deletion of raw report documents, e.g. reason='archived'."""
+	return append_events([('deleted', report['_id'], event_data(report, reason=reason)) for report in reports])
+
+
+def head_sequence(database=None):
+	"""The last sequence number reserved, or 0 for an empty log."""
+	database = database if database is not None else ReportEvent._get_collection().database
+	counter = database[SEQUENCE_COLLECTION].find_one({'_id': SEQUENCE_NAME})
+	return counter['value'] if counter else 0
+
+
+def contiguous(events, position, now=None):
+	"""
+	Yield events in order from position + 1 until a missing sequence number.
+	A hole is stepped over once the event after it is older than the gap
+	grace: the writer that reserved the missing number is not coming back.
+	"""
+	settled = to_millis(now or timezone.now()) - settings.EVENT_LOG_GAP_GRACE_SECONDS * 1000
+	for event in events:
+		if event['_id'] != position + 1 and to_millis(event['occurred_at']) > settled:
+			return
+		position = event['_id']
+		yield event
+
+
+def read_events(after, limit, collection=None):
+	"""Return up to limit events following sequence number `after`, stopping at an unsettled hole."""
+	collection = collection if collection is not None else ReportEvent._get_collection()
+	events = collection.find({'_id': {'$gt': after}}).sort('_id', 1).limit(limit)
+	return list(contiguous(events, after))
+
+
+def backfill_created_events(batch_size=1000):
+	"""
+	Log a created event for every report without one, e.g. reports that
+	predate the log or were bulk loaded. Returns the number logged.
+	"""
+	from .models import DisasterReport
+
+	logged = {
+		row['_id'] for row in ReportEvent._get_collection().aggregate([
+			{'$match': {'kind': 'created'}},
+			{'$group': {'_id': '$report'}},
+		])
+	}
+	appended = 0
+	batch = []
+	for report in DisasterReport._get_collection().find({}, EVENT_PROJECTION).sort('created_at', 1):
+		if report['_id'] in logged:
+			continue
+		batch.append(('created', report['_id'], event_data(report)))
+		if len(batch) >= batch_size:
+			appended += len(append_events(batch))
+			batch = []
+	appended += len(append_events(batch))
+	return appended
@@ -0,0 +1,280 @@
+"""
+Faceted filtering for the report feed.
+
+The feed accepts multi-value type and status filters, a created_at window
+(since/until), a radius and a viewport (bbox), newest first or, with
+sort=priority, by priority (see reports/priority.py). Facet counts are disjunctive: the type counts
+apply every filter except type, and the status counts every filter except
+status. A client can then show how many reports each option would add
+without downloading them.
+
+From the snapshot, filtering and counting need no MongoDB round-trip.
+Without it, a single $facet aggregation returns the page, the total and
+both facet counts. The time window and the bounding box of the radius are
+matched on indexes, restricted to the region partitions they overlap (see
+reports/regions.py), and the exact distance is computed server-side.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from django.utils import timezone
+
+from .models import DisasterReport
+from .regions import geohash_match
+from .utils import EARTH_RADIUS_KM, bounding_box
+
+
+TYPE_VALUES = [choice[0] for choice in DisasterReport.DISASTER_TYPE_CHOICES]
+STATUS_VALUES = [choice[0] for choice in DisasterReport.STATUS_CHOICES]
+
+FacetFilters = namedtuple('FacetFilters', 'types statuses since until circle bbox')
+
+# sort= value: the order of the page
+FEED_SORTS = {
+	'newest': {'created_at': -1},
+	'priority': {'priority': -1, 'created_at': -1},
+}
+
+
+def list_param(params, name):
+	"""Read a multi-value query parameter given as repeats and/or comma lists."""
+	values = []
+	for value in params.getlist(name):
+		values.extend(item.strip() for item in value.split(',') if item.strip())
+	return values
+
+
+def datetime_param(value):
+	"""Parse an ISO 8601 query parameter (a trailing Z is accepted)."""
+	if not value:
+		return None
+	parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+	if parsed.tzinfo is None:
+		parsed = timezone.make_aware(parsed, timezone.utc)
+	return parsed
+
+
+def parse_area(params):
+	"""
+	Read (circle, bbox) from lat/lng/radius (km) and bbox=min_lng,min_lat,max_lng,max_lat.
+	Invalid coordinates are ignored, as they always have been by the feed;
+	a malformed bbox raises ValueError.
+	"""
+	circle = None
+	if params.get('lat') and params.get('lng'):
+		try:
+			circle = (float(params['lat']), float(params['lng']), float(params.get('radius', 10)))  # Default 10km
+		except (ValueError, TypeError):
+			pass
+
+	bbox = None
+	if params.get('bbox'):
+		bbox = tuple(float(value) for value in params['bbox'].split(','))
+		if len(bbox) != 4:
+			raise ValueError('bbox needs min_lng,min_lat,max_lng,max_lat')
+	return circle, bbox
+
+
+def area_filters(params):
+	"""Filters with only the area of the request, for area-scoped summaries."""
+	circle, bbox = parse_area(params)
+	return FacetFilters(types=[], statuses=[], since=None, until=None, circle=circle, bbox=bbox)
+
+
+def parse_facet_filters(params):
+	"""
+	Read the feed filters from a QueryDict. Raises ValueError for unknown
+	types or statuses and malformed dates or bbox; invalid coordinates are
+	ignored, as they always have been by the feed.
+	"""
+	types = list_param(params, 'type')
+	statuses = list_param(params, 'status')
+	for name, values, allowed in (('type', types, TYPE_VALUES), ('status', statuses, STATUS_VALUES)):
+		unknown = sorted(set(values) - set(allowed))
+		if unknown:
+			raise ValueError(f"unknown {name} {', '.join(unknown)}")
+
+	circle, bbox = parse_area(params)
+	return FacetFilters(
+		types=types,
+		statuses=statuses,
+		since=datetime_param(params.get('since')),
+		until=datetime_param(params.get('until')),
+		circle=circle,
+		bbox=bbox,
+	)
+
+
+def parse_sort(params):
+	"""Read sort= (newest by default). Raises ValueError for unknown orders."""
+	sort = params.get('sort') or 'newest'
+	if sort not in FEED_SORTS:
+		raise ValueError(f"unknown sort {sort}, expected {' or '.join(FEED_SORTS)}")
+	return sort
+
+
+def facet_counts(type_counts, status_counts):
+	"""Shape raw counts as the 'facets' member of a feed response."""
+	return {
+		'type': {value: type_counts.get(value, 0) for value in TYPE_VALUES},
+		'status': {value: status_counts.get(value, 0) for value in STATUS_VALUES},
+	}
+
+
+def haversine_expr(lat, lng, radius_km):
+	"""An $expr that is true within radius_km of (lat, lng), as utils.haversine_distance."""
+	def half_delta_sin_squared(field, origin):
+		half = {'$divide': [{'$degreesToRadians': {'$subtract': [f'${field}', origin]}}, 2]}
+		return {'$pow': [{'$sin': half}, 2]}
+
+	a = {'$add': [
+		half_delta_sin_squared('latitude', lat),
+		{'$multiply': [
+			{'$cos': {'$degreesToRadians': lat}},
+			{'$cos': {'$degreesToRadians': '$latitude'}},
+			half_delta_sin_squared('longitude', lng),
+		]},
+	]}
+	distance = {'$multiply': [2 * EARTH_RADIUS_KM, {'$asin': {'$sqrt': {'$min': [a, 1]}}}]}
+	return {'$lte': [distance, radius_km]}
+
+
+def area_box(filters):
+	"""Return the (lat_min, lat_max, lng_min, lng_max) box bounding the area filters, or None."""
+	boxes = []
+	if filters.circle:
+		boxes.append(bounding_box(*filters.circle))
+	if filters.bbox:
+		min_lng, min_lat, max_lng, max_lat = filters.bbox
+		boxes.append((min_lat, max_lat, min_lng, max_lng))
+	if not boxes:
+		return None
+	return (
+		max(box[0] for box in boxes), min(box[1] for box in boxes),
+		max(box[2] for box in boxes), min(box[3] for box in boxes),
+	)
+
+
+def base_match(filters):
+	"""The indexed part of the filters shared by the page and every facet."""
+	match = {}
+	created_at = {}
+	if filters.since:
+		created_at['$gte'] = filters.since
+	if filters.until:
+		created_at['$lte'] = filters.until
+	if created_at:
+		match['created_at'] = created_at
+	box = area_box(filters)
+	if box:
+		lat_min, lat_max, lng_min, lng_max = box
+		match['latitude'] = {'$gte': lat_min, '$lte': lat_max}
+		match['longitude'] = {'$gte': lng_min, '$lte': lng_max}
+		match.update(geohash_match(box))
+	if filters.circle:
+		match['$expr'] = haversine_expr(*filters.circle)
+	return match
+
+
+def facet_pipeline(filters, offset, limit, projection=None, sort='newest'):
+	"""
+	Return the aggregation producing the page, the total and the facet
+	counts. A projection narrows the page documents.
+	"""
+	by_type = {'disaster_type': {'$in': filters.types}} if filters.types else {}
+	by_status = {'status': {'$in': filters.statuses}} if filters.statuses else {}
+	both = dict(by_type, **by_status)
+	pipeline = [{'$match': base_match(filters)}]
+	page = [{'$match': both}]
+	if sort == 'newest':
+		page.append({'$sort': FEED_SORTS[sort]})
+	else:
+		# Walk the priority index in order; $facet keeps it for the page
+		pipeline.append({'$sort': FEED_SORTS[sort]})
+	page += [{'$skip': offset}, {'$limit': limit}]
+	if projection:
+		page.append({'$project': projection})
+
+	return pipeline + [
+		{'$facet': {
+			'results': page,
+			'total': [{'$match': both}, {'$count': 'count'}],
+			'type': [{'$match': by_status}, {'$group': {'_id': '$disaster_type', 'count': {'$sum': 1}}}],
+			'status': [{'$match': by_type}, {'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+		}},
+	]
+
+
+def area_counts_pipeline(filters):
+	"""Return the aggregation counting reports per type and per status."""
+	return [
+		{'$match': base_match(filters)},
+		{'$facet': {
+			'type': [{'$group': {'_id': '$disaster_type', 'count': {'$sum': 1}}}],
+			'status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+		}},
+	]
+
+
+def parse_area_counts(result):
+	"""Return (type counts, status counts) from the area_counts_pipeline() output."""
+	return (
+		{row['_id']: row['count'] for row in result['type']},
+		{row['_id']: row['count'] for row in result['status']},
+	)
+
+
+def parse_facet_result(result):
+	"""Return (documents, total, facets) from the single $facet output document."""
+	total = result['total'][0]['count'] if result['total'] else 0
+	facets = facet_counts(
+		{row['_id']: row['count'] for row in result['type']},
+		{row['_id']: row['count'] for row in result['status']},
+	)
+	return result['results'], total, facets
+
+
+class FacetedResults:
+	"""
+	Paginator-friendly sequence over a $facet aggregation. The expected page
+	is fetched together with the total and facets in one round-trip; any
+	other slice runs its own aggregation. A projection narrows the documents
+	and sort picks one of FEED_SORTS.
+	"""
+
+	def __init__(self, collection, filters, offset, limit, projection=None, sort='newest'):
+		self.collection = collection
+		self.filters = filters
+		self.offset = offset
+		self.limit = limit
+		self.projection = projection
+		self.sort = sort
+		self._loaded = None
+
+	def _run(self, offset, limit):
+		pipeline = facet_pipeline(self.filters, offset, limit, self.projection, self.sort)
+		result = next(self.collection.aggregate(pipeline))
+		documents, total, facets = parse_facet_result(result)
+		return [DisasterReport._from_son(document) for document in documents], total, facets
+
+	def load(self):
+		if self._loaded is None:
+			self._loaded = self._run(self.offset, self.limit)
+		return self._loaded
+
+	@property
+	def facets(self):
+		return self.load()[2]
+
+	def __len__(self):
+		return self.load()[1]
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			return self[key:key + 1][0]
+		start, stop, _ = key.indices(len(self))
+		if stop <= start:
+			return []
+		if start == self.offset and stop <= self.offset + self.limit:
+			return self.load()[0][:stop - start]
+		return self._run(start, stop - start)[0]
@@ -0,0 +1,104 @@
+"""
+Sparse fieldsets for report responses.
+
+`fields=` (comma separated or repeated) selects the response fields of the
+list, detail and search endpoints; only the model fields they are read
+from are projected out of MongoDB, and the id is always included.
+`compat=false` returns the serializer's own field names (disaster_type,
+reporter_id, image_url) without the frontend aliases (type, reporterId,
+imageUrl). Either name is accepted in `fields=`.
+"""
+from collections import namedtuple
+
+from .facets import list_param
+from .models import DisasterReport
+
+
+# Response field: the model fields it is read from
+REPORT_FIELD_SOURCES = {
+	'id': ('id',),
+	'disaster_type': ('disaster_type',),
+	'description': ('description',),
+	'location': ('latitude', 'longitude'),
+	'timestamp': ('created_at',),
+	'image_url': ('image',),
+	'status': ('status',),
+	'reporter_id': ('reporter_id',),
+}
+
+# The text score comes with every search result; highlights need the description
+SEARCH_FIELD_SOURCES = dict(REPORT_FIELD_SOURCES, score=(), highlights=('description',))
+
+# Serializer field: the key the frontend has always received it under
+COMPAT_ALIASES = {
+	'disaster_type': 'type',
+	'reporter_id': 'reporterId',
+	'image_url': 'imageUrl',
+}
+
+FALSE_VALUES = ('false', '0', 'no')
+
+Fieldset = namedtuple('Fieldset', 'fields compat')
+
+
+def parse_fieldset(params, sources=REPORT_FIELD_SOURCES):
+	"""
+	Read fields= and compat= from a QueryDict. fields is None when every
+	field is wanted. Raises ValueError for unknown fields.
+	"""
+	compat = params.get('compat', 'true').lower() not in FALSE_VALUES
+	names = list_param(params, 'fields')
+	if not names:
+		return Fieldset(None, compat)
+
+	fields = ['id']
+	unknown = []
+	canonical = {alias: name for name, alias in COMPAT_ALIASES.items()}
+	for name in names:
+		name = canonical.get(name, name)
+		if name not in sources:
+			unknown.append(name)
+		elif name not in fields:
+			fields.append(name)
+	if unknown:
+		raise ValueError(f"unknown field {', '.join(sorted(unknown))}")
+	return Fieldset(fields, compat)
+
+
+def model_fields(fieldset, sources=REPORT_FIELD_SOURCES):
+	"""Return the model fields to load for a fieldset, or None for all of them."""
+	if fieldset.fields is None:
+		return None
+	return sorted({source for name in fieldset.fields for source in sources[name]})
+
+
+def mongo_projection(fieldset, sources=REPORT_FIELD_SOURCES):
+	"""Return the raw MongoDB projection for a fieldset, or None for whole documents."""
+	names = model_fields(fieldset, sources)
+	if names is None:
+		return None
+	return {DisasterReport._fields[name].db_field: 1 for name in names}
+
+
+class SparseFieldsetMixin:
+	"""
+	Apply fields= and compat= to a report view: project() narrows a
+	queryset and the serializer context carries the fieldset.
+	"""
+	field_sources = REPORT_FIELD_SOURCES
+
+	def get_fieldset(self):
+		if not hasattr(self, '_fieldset'):
+			self._fieldset = parse_fieldset(self.request.query_params, self.field_sources)
+		return self._fieldset
+
+	def project(self, queryset):
+		names = model_fields(self.get_fieldset(), self.field_sources)
+		return queryset.only(*names) if names else queryset
+
+	def get_serializer_context(self):
+		context = super().get_serializer_context()
+		fieldset = self.get_fieldset()
+		context['fields'] = fieldset.fields
+		context['compat'] = fieldset.compat
+		return context
@@ -0,0 +1,152 @@
+"""
+Geofence alert subscriptions.
+
+A subscription is a circle (center and radius) or a polygon. Both are
+stored as a GeoJSON polygon in a 2dsphere index, a circle as the polygon
+circumscribing it. When a report is created, one $geoIntersects query
+with the report's point finds the subscriptions containing it, so the
+work is proportional to the matching subscriptions rather than to all of
+them. Circle matches are then confirmed with the exact distance, and the
+type filter and the reporter's own subscriptions are applied.
+
+Every match becomes a GeofenceAlert in the subscriber's inbox, which the
+client polls and acknowledges; unacknowledged alerts expire after
+GEOFENCE_ALERT_RETENTION_HOURS.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import GeofenceAlert, GeofenceSubscription
+from .utils import EARTH_RADIUS_KM, haversine_distance
+
+
+# Sides of the polygon approximating a circle
+CIRCLE_SIDES = 32
+
+ALERT_DESCRIPTION_CHARS = 160
+
+SUBSCRIPTION_FIELDS = {'subscriber_id': 1, 'center': 1, 'radius_km': 1, 'types': 1}
+
+
+def destination(lat, lng, bearing, distance_km):
+	"""Return the (lat, lng) reached from a point along a bearing (radians)."""
+	angular = distance_km / EARTH_RADIUS_KM
+	lat1, lng1 = math.radians(lat), math.radians(lng)
+	lat2 = math.asin(
+		math.sin(lat1) * math.cos(angular) + math.cos(lat1) * math.sin(angular) * math.cos(bearing)
+	)
+	lng2 = lng1 + math.atan2(
+		math.sin(bearing) * math.sin(angular) * math.cos(lat1),
+		math.cos(angular) - math.sin(lat1) * math.sin(lat2),
+	)
+	# Normalise to [-180, 180)
+	return math.degrees(lat2), (math.degrees(lng2) + 540) % 360 - 180
+
+
+def circle_polygon(lat, lng, radius_km, sides=CIRCLE_SIDES):
+	"""
+	Return the GeoJSON ring of a polygon containing the circle: its vertices
+	lie slightly outside the radius so the edges never cut into the circle.
+	"""
+	outer = radius_km / math.cos(math.pi / sides) * 1.01
+	ring = []
+	for side in range(sides):
+		vertex_lat, vertex_lng = destination(lat, lng, 2 * math.pi * side / sides, outer)
+		ring.append([round(vertex_lng, 7), round(vertex_lat, 7)])
+	ring.append(ring[0])
+	return [ring]
+
+
+def polygon_ring(points):
+	"""Return a closed GeoJSON polygon from [[lng, lat], ...] vertices."""
+	ring = [[float(lng), float(lat)] for lng, lat in points]
+	if ring[0] != ring[-1]:
+		ring.append(ring[0])
+	return [ring]
+
+
+def match_query(lat, lng):
+	"""The query for the subscriptions whose area contains a point."""
+	return {'area': {'$geoIntersects': {'$geometry': {'type': 'Point', 'coordinates': [lng, lat]}}}}
+
+
+def alert_documents(report, subscriptions):
+	"""
+	Return the alert documents for a raw report document and the raw
+	subscriptions its point intersects.
+	"""
+	lat, lng = report['latitude'], report['longitude']
+	alerts = []
+	for subscription in subscriptions:
+		if subscription['subscriber_id'] == report.get('reporter_id'):
+			# Nobody needs an alert about their own report
+			continue
+		types = subscription.get('types')
+		if types and report.get('disaster_type') not in types:
+			continue
+		distance = None
+		if subscription.get('radius_km') is not None:
+			center_lng, center_lat = subscription['center']
+			distance = haversine_distance(center_lat, center_lng, lat, lng)
+			if distance > subscription['radius_km']:
+				continue
+		alerts.append({
+			'subscriber_id': subscription['subscriber_id'],
+			'subscription': subscription['_id'],
+			'report': report['_id'],
+			'disaster_type': report.get('disaster_type'),
+			'description': (report.get('description') or '')[:ALERT_DESCRIPTION_CHARS],
+			'latitude': lat,
+			'longitude': lng,
+			'reported_at': report.get('created_at'),
+			'distance_km': round(distance, 3) if distance is not None else None,
+			'created_at': timezone.now(),
+		})
+	return alerts
+
+
+def deliver_alerts(report):
+	"""Fan a new report (raw document) out to the inboxes of matching subscribers. Returns the alerts written."""
+	if not settings.GEOFENCE_ALERTS_ENABLED or report.get('latitude') is None or report.get('longitude') is None:
+		return 0
+	try:
+		subscriptions = GeofenceSubscription._get_collection().find(
+			match_query(report['latitude'], report['longitude']), SUBSCRIPTION_FIELDS,
+		)
+		alerts = alert_documents(report, subscriptions)
+		if alerts:
+			GeofenceAlert._get_collection().insert_many(alerts, ordered=False)
+		return len(alerts)
+	except Exception as e:
+		# The report is stored either way; alerts are best effort
+		print(f"Geofence alert delivery failed: {e}")
+		return 0
+
+
+async def deliver_alerts_async(database, report):
+	"""deliver_alerts() through a Motor database."""
+	if not settings.GEOFENCE_ALERTS_ENABLED or report.get('latitude') is None or report.get('longitude') is None:
+		return 0
+	try:
+		cursor = database[GeofenceSubscription._get_collection_name()].find(
+			match_query(report['latitude'], report['longitude']), SUBSCRIPTION_FIELDS,
+		)
+		alerts = alert_documents(report, await cursor.to_list(length=None))
+		if alerts:
+			await database[GeofenceAlert._get_collection_name()].insert_many(alerts, ordered=False)
+		return len(alerts)
+	except Exception as e:
+		print(f"Geofence alert delivery failed: {e}")
+		return 0
+
+
+def inbox(subscriber_id, limit):
+	"""Return the oldest pending alerts of a subscriber."""
+	return list(GeofenceAlert.objects(subscriber_id=subscriber_id).order_by('id')[:limit])
+
+
+def acknowledge(subscriber_id, alert_ids):
+	"""Remove delivered alerts from a subscriber's inbox. Returns the number removed."""
+	return GeofenceAlert.objects(subscriber_id=subscriber_id, id__in=alert_ids).delete()
@@ -0,0 +1,67 @@
+"""
+Geohash encoding and cell geometry.
+
+A geohash interleaves longitude and latitude bisections into a base-32
+string; every prefix is a cell that contains all longer hashes starting
+with it, which is what lets reports/regions.py partition by prefix.
+"""
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+DECODE = {char: index for index, char in enumerate(BASE32)}
+
+
+def encode(lat, lng, precision=12):
+	"""Return the geohash of a point."""
+	lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+	chars = []
+	bits, value, even = 0, 0, True
+	while len(chars) < precision:
+		interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+		middle = (interval[0] + interval[1]) / 2
+		if coordinate >= middle:
+			value = value * 2 + 1
+			interval[0] = middle
+		else:
+			value = value * 2
+			interval[1] = middle
+		even = not even
+		bits += 1
+		if bits == 5:
+			chars.append(BASE32[value])
+			bits, value = 0, 0
+	return ''.join(chars)
+
+
+def bounds(geohash):
+	"""Return (lat_min, lat_max, lng_min, lng_max) of a geohash cell."""
+	lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+	even = True
+	for char in geohash:
+		value = DECODE[char]
+		for shift in range(4, -1, -1):
+			interval = lng_range if even else lat_range
+			middle = (interval[0] + interval[1]) / 2
+			if value >> shift & 1:
+				interval[0] = middle
+			else:
+				interval[1] = middle
+			even = not even
+	return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def children(geohash):
+	"""Return the 32 cells one character longer than geohash."""
+	return [geohash + char for char in BASE32]
+
+
+def intersects(geohash, box):
+	"""Whether a cell overlaps box = (lat_min, lat_max, lng_min, lng_max)."""
+	lat_min, lat_max, lng_min, lng_max = bounds(geohash)
+	return lat_min <= box[1] and box[0] <= lat_max and lng_min <= box[3] and box[2] <= lng_max
+
+
+def covering(box, precision):
+	"""Return the cells of the given precision that overlap box."""
+	cells = ['']
+	for _ in range(precision):
+		cells = [cell for parent in cells for cell in children(parent) if intersects(cell, box)]
+	return cells
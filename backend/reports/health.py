@@ -0,0 +1,123 @@
+"""
+Deep health and readiness checks.
+
+A check pings MongoDB with a tight timeout, reads the connection pool
+counters collected by the CMAP listener, and reports cache status and the
+liveness of background workers. Results are cached for a second per
+process so frequent probes cannot themselves become load.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from disaster_response import mongodb
+from disaster_response.metrics import cache_lookup
+from .snapshot import HEARTBEAT_INTERVAL, snapshot_manager
+
+
+HEALTH_CACHE_SECONDS = 1.0
+
+# A checkout timeout this recent means requests are queueing on the pool
+POOL_FAILURE_WINDOW = 10
+
+_workers = {}
+_cache_lock = threading.Lock()
+_cached = None
+_cached_at = 0.0
+
+
+def register_worker(name, status):
+	"""
+	Register a background worker; status() returns a dict with at least
+	'state' (idle, running or dead) and 'heartbeat_at' (epoch seconds or None).
+	"""
+	_workers[name] = status
+
+
+register_worker('report-snapshot-rebuilder', lambda: snapshot_manager.status()['worker'])
+
+
+def check_database():
+	"""Ping MongoDB with a tight timeout and collect pool statistics."""
+	result = {'ok': False, 'latency_ms': None, 'error': None}
+	try:
+		if not mongodb.is_registered():
+			mongodb.register_connection()
+		result['latency_ms'] = round(mongodb.ping(timeout_ms=settings.MONGODB_HEALTH_TIMEOUT_MS), 2)
+		result['ok'] = True
+	except Exception as e:
+		result['error'] = str(e)
+
+	pool = mongodb.pool_stats.snapshot()
+	last_failure = pool['last_checkout_failure_at']
+	pool['exhausted'] = bool(
+		(pool['max_pool_size'] and pool['checked_out'] >= pool['max_pool_size'])
+		or (last_failure and time.time() - last_failure < POOL_FAILURE_WINDOW)
+	)
+	result['pool'] = pool
+	return result
+
+
+def check_workers():
+	"""Report liveness for every registered background worker."""
+	now = time.time()
+	workers = {}
+	for name, status in _workers.items():
+		try:
+			info = dict(status())
+		except Exception as e:
+			info = {'state': 'dead', 'heartbeat_at': None, 'error': str(e)}
+		heartbeat_at = info.get('heartbeat_at')
+		# Idle workers have not been started yet, which is not a failure
+		info['alive'] = info.get('state') == 'idle' or (
+			info.get('state') == 'running'
+			and heartbeat_at is not None
+			and now - heartbeat_at < HEARTBEAT_INTERVAL * 2
+		)
+		workers[name] = info
+	return workers
+
+
+def run_checks():
+	"""Run every check and derive overall status and readiness."""
+	started = time.perf_counter()
+	database = check_database()
+	snapshot = snapshot_manager.status()
+	snapshot.pop('worker', None)
+	workers = check_workers()
+
+	ready = database['ok'] and not database['pool']['exhausted']
+	degraded = (
+		not all(worker['alive'] for worker in workers.values())
+		or bool(snapshot['enabled'] and (snapshot['last_error'] or snapshot['stale']))
+	)
+
+	return {
+		'status': 'unhealthy' if not ready else ('degraded' if degraded else 'healthy'),
+		'ready': ready,
+		'timestamp': timezone.now().isoformat(),
+		'service': 'Disaster Response API',
+		'database': database,
+		'cache': {'report_snapshot': snapshot},
+		'workers': workers,
+		'check_duration_ms': round((time.perf_counter() - started) * 1000, 2),
+	}
+
+
+def get_health():
+	"""Return the cached check result, refreshing it at most once a second."""
+	global _cached, _cached_at
+	if _cached is not None and time.monotonic() - _cached_at < HEALTH_CACHE_SECONDS:
+		cache_lookup('health', True)
+		return _cached
+	with _cache_lock:
+		# Another thread may have refreshed while we waited
+		if _cached is not None and time.monotonic() - _cached_at < HEALTH_CACHE_SECONDS:
+			cache_lookup('health', True)
+			return _cached
+		cache_lookup('health', False)
+		_cached = run_checks()
+		_cached_at = time.monotonic()
+		return _cached
@@ -0,0 +1,182 @@
+"""
+Index management for the reports collection.
+
+The indexes are declared in DisasterReport.meta['indexes'] and derived from
+CANONICAL_QUERIES, the query shapes the views, serializers and commands
+actually issue. ensure_indexes() creates missing indexes and drops any
+others; explain_queries() runs explain() on every canonical query so a
+plan that falls back to a collection scan is caught before it ships.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import DisasterReport
+from .retention import TTL_INDEX_NAME
+from .utils import bounding_box
+
+
+# Indexes owned elsewhere and never dropped here
+MANAGED_ELSEWHERE = {'_id_', TTL_INDEX_NAME}
+
+# Plan stages that mean the query is not served by an index
+SCAN_STAGES = {'COLLSCAN'}
+
+# How MongoDB stores the key of a text index
+TEXT_KEY_FIELDS = ('_fts', '_ftsx')
+
+
+def canonical_queries():
+	"""
+	Return the query shapes to verify, with representative values.
+	Each entry is (name, issued by, filter, sort).
+	"""
+	now = timezone.now()
+	last_24_hours = now - timedelta(hours=24)
+	lat_min, lat_max, lng_min, lng_max = bounding_box(6.5244, 3.3792, 10)
+	return [
+		('feed', 'ReportsListView, snapshot_rows', {}, [('created_at', -1)]),
+		('feed_priority', 'ReportsListView without the snapshot (sort=priority)', {}, [('priority', -1), ('created_at', -1)]),
+		('priority_new', 'refresh_priorities', {'created_at': {'$gte': now - timedelta(minutes=5)}}, None),
+		('feed_window', 'ReportsListView without the snapshot (since/until)', {
+			'created_at': {'$gte': now - timedelta(days=7), '$lte': now},
+		}, [('created_at', -1)]),
+		('nearby', 'ReportsListView without the snapshot', {
+			'latitude': {'$gte': lat_min, '$lte': lat_max},
+			'longitude': {'$gte': lng_min, '$lte': lng_max},
+		}, None),
+		('nearby_region', 'ReportsListView and reports_summary_view with an area, without the snapshot', {
+			'geohash': {'$gte': 's1', '$lt': 's2'},
+			'latitude': {'$gte': lat_min, '$lte': lat_max},
+			'longitude': {'$gte': lng_min, '$lte': lng_max},
+		}, None),
+		('recent', 'ai_summary_view', {'created_at': {'$gte': last_24_hours}}, [('created_at', -1)]),
+		('recent_by_type', 'ai_summary_view', {
+			'created_at': {'$gte': last_24_hours},
+			'disaster_type': 'flood',
+		}, None),
+		('by_type', 'reports_summary_view', {'disaster_type': 'flood'}, None),
+		('by_status', 'reports_summary_view', {'status': 'active'}, None),
+		('resolved_expiry', 'retention_report, sweep_resolved_reports', {
+			'status': 'resolved',
+			'resolved_at': {'$lt': now},
+		}, [('resolved_at', 1)]),
+		('resolved_missing', 'retention_report (backfill)', {
+			'status': 'resolved',
+			'resolved_at': None,
+		}, None),
+		('search', 'ReportSearchView', {
+			'$text': {'$search': 'bridge collapse'},
+			'status': 'active',
+		}, [('score', {'$meta': 'textScore'})]),
+	]
+
+
+def index_signature(key, weights=None):
+	"""
+	Return a comparable form of an index key. Text indexes are stored as
+	_fts/_ftsx with their fields in `weights`, so they compare by field weights.
+	"""
+	key = [tuple(part) for part in key]
+	plain = tuple(part for part in key if part[0] not in TEXT_KEY_FIELDS and part[1] != 'text')
+	if len(plain) == len(key):
+		return plain
+	weights = weights or {}
+	fields = [field for field, direction in key if direction == 'text' and field not in TEXT_KEY_FIELDS] or list(weights)
+	return plain + (('$text', tuple(sorted((field, weights.get(field, 1)) for field in fields))),)
+
+
+def is_text_index(signature):
+	return any(field == '$text' for field, _ in signature)
+
+
+def declared_indexes():
+	"""Return {signature: (key, options)} for the indexes declared on the model."""
+	declared = {}
+	for spec in DisasterReport._meta['index_specs']:
+		options = dict(spec)
+		key = options.pop('fields')
+		declared[index_signature(key, options.get('weights'))] = (key, options)
+	return declared
+
+
+def ensure_indexes(collection=None, dry_run=False):
+	"""
+	Create declared indexes that are missing, then drop undeclared ones.
+	Indexes are compared by key (text indexes by weights), so existing names
+	are kept. Returns the names created, dropped and kept.
+	"""
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	declared = declared_indexes()
+	existing = collection.index_information()
+	signatures = {name: index_signature(info['key'], info.get('weights')) for name, info in existing.items()}
+	existing_keys = {signature: name for name, signature in signatures.items()}
+
+	result = {'created': [], 'dropped': [], 'kept': []}
+	undeclared = [
+		(name, signature) for name, signature in signatures.items()
+		if name not in MANAGED_ELSEWHERE and signature not in declared
+	]
+
+	def drop(name):
+		if not dry_run:
+			collection.drop_index(name)
+		result['dropped'].append(name)
+
+	# A collection has at most one text index, so a changed one goes first
+	for name, signature in undeclared:
+		if is_text_index(signature):
+			drop(name)
+
+	# Create before the other drops so queries are never left without an index
+	for signature, (key, options) in declared.items():
+		if signature in existing_keys:
+			result['kept'].append(existing_keys[signature])
+			continue
+		name = options.get('name') or '_'.join(f'{field}_{direction}' for field, direction in key)
+		if not dry_run:
+			collection.create_index(list(key), name=name, **{k: v for k, v in options.items() if k != 'name'})
+		result['created'].append(name)
+
+	for name, signature in undeclared:
+		if not is_text_index(signature):
+			drop(name)
+
+	return result
+
+
+def plan_summary(plan):
+	"""Collect the stages and index names used anywhere in a winning plan."""
+	stages, indexes = [], []
+	pending = [plan]
+	while pending:
+		node = pending.pop()
+		if isinstance(node, dict):
+			if 'stage' in node:
+				stages.append(node['stage'])
+			if 'indexName' in node:
+				indexes.append(node['indexName'])
+			pending.extend(node.values())
+		elif isinstance(node, list):
+			pending.extend(node)
+	return stages, indexes
+
+
+def explain_queries(collection=None):
+	"""Explain every canonical query and report whether it scans the collection."""
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	results = []
+	for name, source, query, sort in canonical_queries():
+		cursor = collection.find(query)
+		if sort:
+			cursor = cursor.sort(sort)
+		winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+		stages, indexes = plan_summary(winning_plan)
+		results.append({
+			'name': name,
+			'source': source,
+			'stages': stages,
+			'indexes': indexes,
+			'collscan': bool(SCAN_STAGES.intersection(stages)),
+		})
+	return results
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from reports.archive import compact_pending_segments
+
+
+class Command(BaseCommand):
+	help = 'Compact JSONL.gz archive segments into queryable columnar segments'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--rebuild',
+			action='store_true',
+			help='Rebuild columnar segments that already exist',
+		)
+
+	def handle(self, *args, **options):
+		built = compact_pending_segments(overwrite=options['rebuild'])
+
+		if not built:
+			self.stdout.write(self.style.SUCCESS('All archive segments are already compacted.'))
+			return
+
+		for name in built:
+			self.stdout.write(f'  - {name}')
+		self.stdout.write(self.style.SUCCESS(f'Built {len(built)} columnar archive segments.'))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from disaster_response.schema import build_schema
+
+
+class Command(BaseCommand):
+	help = 'Generate the OpenAPI schema served by /api/schema/ outside DEBUG'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--dir',
+			default=None,
+			help='Output directory (default: OPENAPI_SCHEMA_DIR)',
+		)
+
+	def handle(self, *args, **options):
+		directory = options['dir'] or settings.OPENAPI_SCHEMA_DIR
+		written = build_schema(directory)
+		for name, size in sorted(written.items()):
+			self.stdout.write(f'{name}: {size} bytes')
+		self.stdout.write(self.style.SUCCESS(f'Wrote the API schema to {directory}'))
@@ -0,0 +1,69 @@
+"""
+To try routing locally, start a three member replica set:
+
+	mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0
+	mongod --replSet rs0 --port 27018 --dbpath /tmp/rs0-1
+	mongod --replSet rs0 --port 27019 --dbpath /tmp/rs0-2
+	mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [
+		{_id: 0, host: "localhost:27017"},
+		{_id: 1, host: "localhost:27018"},
+		{_id: 2, host: "localhost:27019"}]})'
+
+then run with MONGODB_URI="mongodb://localhost:27017/?replicaSet=rs0".
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_connection
+
+from disaster_response.mongodb import register_connection
+from reports.routing import collection_for, routing_mode
+
+
+class Command(BaseCommand):
+	help = 'Show which replica set member serves reads for each routed endpoint'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'endpoints',
+			nargs='*',
+			help='Endpoint (URL) names to check; defaults to every configured endpoint',
+		)
+		parser.add_argument(
+			'--strict',
+			action='store_true',
+			help='Exit with an error if a secondary-routed read was served by the primary',
+		)
+
+	def handle(self, *args, **options):
+		register_connection()
+		client = get_connection()
+		endpoints = options['endpoints'] or sorted(settings.MONGODB_READ_ROUTING)
+
+		misrouted = []
+		for endpoint in endpoints:
+			mode = routing_mode(endpoint)
+			cursor = collection_for(endpoint).find({}, {'_id': 1}, limit=1)
+			list(cursor)
+			address = cursor.address
+
+			if address == client.primary:
+				role = 'primary'
+			elif address in client.secondaries:
+				role = 'secondary'
+			else:
+				role = 'standalone' if client.primary is None and not client.secondaries else 'unknown'
+
+			if mode in ('secondary', 'secondaryPreferred') and role == 'primary' and client.secondaries:
+				misrouted.append(endpoint)
+
+			host = f'{address[0]}:{address[1]}' if address else '-'
+			self.stdout.write(f'  {endpoint:<24} {mode:<20} {host:<24} {role}')
+
+		self.stdout.write(f'Max staleness: {settings.MONGODB_MAX_STALENESS_SECONDS}s')
+		if misrouted:
+			message = f'Served by the primary despite available secondaries: {", ".join(misrouted)}'
+			if options['strict']:
+				raise CommandError(message)
+			self.stdout.write(self.style.WARNING(message))
+		else:
+			self.stdout.write(self.style.SUCCESS('Read routing checked.'))
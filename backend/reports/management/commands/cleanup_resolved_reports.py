@@ -1,60 +1,109 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import timedelta
-from reports.models import DisasterReport
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from reports.archive import sweep_resolved_reports
+from reports.retention import retention_report
+from reports.snapshot import snapshot_manager
 
 
 class Command(BaseCommand):
-	help = 'Delete resolved reports that have been resolved for more than 10 minutes'
+	help = (
+		'Verify that resolved reports are being expired by the MongoDB TTL index, '
+		'optionally archiving them to JSONL.gz segments and deleting them first.'
+	)
 
 	def add_arguments(self, parser):
+		parser.add_argument(
+			'--fix',
+			action='store_true',
+			help='Create the TTL index or retune it to RESOLVED_REPORT_RETENTION_MINUTES',
+		)
+		parser.add_argument(
+			'--backfill',
+			action='store_true',
+			help='Set resolved_at on resolved reports that are missing it so they can expire',
+		)
+		parser.add_argument(
+			'--archive',
+			action='store_true',
+			help='Archive resolved reports past the retention window, then delete them in batches',
+		)
+		parser.add_argument(
+			'--batch-size',
+			type=int,
+			default=None,
+			help='Reports per archive batch (default: REPORT_ARCHIVE_BATCH_SIZE)',
+		)
 		parser.add_argument(
 			'--dry-run',
 			action='store_true',
-			help='Show what would be deleted without actually deleting',
+			help='With --archive, only count the reports that would be archived',
+		)
+		parser.add_argument(
+			'--strict',
+			action='store_true',
+			help='Exit with an error when expiry is not healthy',
 		)
 
 	def handle(self, *args, **options):
-		# Calculate the cutoff time (10 minutes ago)
-		cutoff_time = timezone.now() - timedelta(minutes=10)
-		
-		# Find resolved reports that were updated more than 10 minutes ago
-		resolved_reports = DisasterReport.objects.filter(
-			status='resolved',
-			updated_at__lt=cutoff_time
-		)
-		
-		count = resolved_reports.count()
-		
-		if count == 0:
-			self.stdout.write(
-				self.style.SUCCESS('No resolved reports found to delete.')
-			)
-			return
-		
-		if options['dry_run']:
-			self.stdout.write(
-				self.style.WARNING(f'DRY RUN: Would delete {count} resolved reports:')
-			)
-			for report in resolved_reports:
-				self.stdout.write(
-					f'  - {report.get_disaster_type_display()} (ID: {report.id}) - '
-					f'Resolved: {report.updated_at.strftime("%Y-%m-%d %H:%M:%S")}'
-				)
+		if options['archive'] or settings.REPORT_ARCHIVE_ENABLED:
+			self.archive(options)
+
+		report = retention_report(fix=options['fix'], backfill=options['backfill'])
+		ttl_index = report['ttl_index']
+
+		self.stdout.write(f"Retention window: {report['retention_minutes']} minutes")
+
+		if not ttl_index['present']:
+			self.stdout.write(self.style.ERROR(f"TTL index '{ttl_index['name']}' is missing (run with --fix)"))
+		elif not ttl_index['in_sync']:
+			self.stdout.write(self.style.WARNING(
+				f"TTL index expires after {ttl_index['expire_after_seconds']}s, "
+				f"expected {(report['retention_minutes'] + report['ttl_grace_minutes']) * 60}s (run with --fix)"
+			))
 		else:
-			# Log the reports being deleted
-			self.stdout.write(f'Deleting {count} resolved reports:')
-			for report in resolved_reports:
-				self.stdout.write(
-					f'  - {report.get_disaster_type_display()} (ID: {report.id}) - '
-					f'Resolved: {report.updated_at.strftime("%Y-%m-%d %H:%M:%S")}'
-				)
-			
-			# Delete the reports
-			deleted_count, _ = resolved_reports.delete()
-			
-			self.stdout.write(
-				self.style.SUCCESS(
-					f'Successfully deleted {deleted_count} resolved reports.'
-				)
-			)
+			self.stdout.write(self.style.SUCCESS(
+				f"TTL index '{ttl_index['name']}' expires after {ttl_index['expire_after_seconds']}s"
+			))
+
+		if ttl_index['action'] in ('created', 'updated'):
+			self.stdout.write(self.style.SUCCESS(f"TTL index {ttl_index['action']}."))
+
+		if report['backfilled']:
+			self.stdout.write(self.style.SUCCESS(f"Backfilled resolved_at on {report['backfilled']} reports."))
+
+		self.stdout.write(f"Resolved reports: {report['resolved_count']}")
+		self.stdout.write(f"Awaiting TTL expiry: {report['pending_expiry']}")
+
+		if report['overdue']:
+			self.stdout.write(self.style.WARNING(f"Overdue (not expired by TTL monitor): {report['overdue']}"))
+		if report['missing_resolved_at']:
+			self.stdout.write(self.style.WARNING(
+				f"Resolved reports without resolved_at: {report['missing_resolved_at']} (run with --backfill)"
+			))
+
+		if report['healthy']:
+			self.stdout.write(self.style.SUCCESS('Resolved report expiry is healthy.'))
+		elif options['strict']:
+			raise CommandError('Resolved report expiry is not healthy.')
+
+	def archive(self, options):
+		result = sweep_resolved_reports(batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+		if options['dry_run']:
+			self.stdout.write(self.style.WARNING(
+				f"DRY RUN: Would archive and delete {result['matched_count']} resolved reports."
+			))
+			return
+		if result['skipped']:
+			self.stdout.write(self.style.WARNING('Skipped: another archive sweep is running.'))
+			return
+
+		if result['deleted_count']:
+			snapshot_manager.rebuild()
+
+		self.stdout.write(self.style.SUCCESS(
+			f"Archived {result['archived_count']} and deleted {result['deleted_count']} "
+			f"resolved reports in {result['batches']} batches."
+		))
+		for segment in result['segments']:
+			self.stdout.write(f'  - {segment}')
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from reports.indexes import ensure_indexes, explain_queries
+from reports.regions import backfill_geohashes
+from reports.retention import ensure_ttl_index
+
+
+class Command(BaseCommand):
+	help = (
+		'Create the declared report indexes, drop redundant ones, set the geohash on '
+		'reports stored before it existed and verify query plans'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--dry-run',
+			action='store_true',
+			help='Show which indexes would be created or dropped without changing anything',
+		)
+		parser.add_argument(
+			'--skip-explain',
+			action='store_true',
+			help='Do not verify the canonical query plans',
+		)
+
+	def handle(self, *args, **options):
+		dry_run = options['dry_run']
+		result = ensure_indexes(dry_run=dry_run)
+		if not dry_run:
+			result['ttl'] = ensure_ttl_index()
+
+		prefix = 'Would ' if dry_run else ''
+		for name in result['created']:
+			self.stdout.write(f'  + {name}')
+		for name in result['dropped']:
+			self.stdout.write(f'  - {name}')
+		self.stdout.write(
+			f"{prefix}{'create' if dry_run else 'Created'} {len(result['created'])}, "
+			f"{'drop' if dry_run else 'dropped'} {len(result['dropped'])}, "
+			f"kept {len(result['kept'])} indexes."
+		)
+
+		if not dry_run:
+			# Area queries restrict to geohash ranges; a no-op once every report has one
+			updated = backfill_geohashes()
+			if updated:
+				self.stdout.write(f'Set the geohash on {updated} reports.')
+
+		if options['skip_explain']:
+			return
+
+		collscans = []
+		for plan in explain_queries():
+			used = ', '.join(plan['indexes']) or '-'
+			self.stdout.write(f"  {plan['name']:<18} {' > '.join(plan['stages']):<40} {used}")
+			if plan['collscan']:
+				collscans.append(f"{plan['name']} ({plan['source']})")
+
+		if collscans:
+			raise CommandError(f'Queries fall back to COLLSCAN: {", ".join(collscans)}')
+		self.stdout.write(self.style.SUCCESS('Every canonical query is served by an index.'))
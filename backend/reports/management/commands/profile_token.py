@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from disaster_response.stack_profiler import sign_token
+
+
+class Command(BaseCommand):
+	help = (
+		'Print an X-Stack-Profile header value that profiles requests until it expires: '
+		'stack samples with STACK_PROFILER_ENABLED, and a Server-Timing header on the response'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--minutes',
+			type=int,
+			default=15,
+			help='Minutes the token stays valid (default: 15)',
+		)
+
+	def handle(self, *args, **options):
+		if not settings.STACK_PROFILER_SECRET:
+			raise CommandError('STACK_PROFILER_SECRET is not set')
+		if not settings.STACK_PROFILER_ENABLED:
+			self.stderr.write('STACK_PROFILER_ENABLED is off; the token only enables Server-Timing.')
+		token = sign_token(time.time() + options['minutes'] * 60)
+		self.stdout.write(f'X-Stack-Profile: {token}')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from reports.regions import backfill_geohashes, rebalance, region_counts
+
+
+class Command(BaseCommand):
+	help = 'Split geohash region partitions that hold more than REGION_SPLIT_THRESHOLD reports'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--threshold',
+			type=int,
+			default=None,
+			help='Reports above which a region is split (default: REGION_SPLIT_THRESHOLD)',
+		)
+		parser.add_argument(
+			'--dry-run',
+			action='store_true',
+			help='Show which regions would be split without changing anything',
+		)
+		parser.add_argument(
+			'--backfill',
+			action='store_true',
+			help='Set the geohash on reports stored before the field existed first',
+		)
+		parser.add_argument(
+			'--list',
+			action='store_true',
+			help='Print the report count of every leaf region',
+		)
+
+	def handle(self, *args, **options):
+		if options['backfill'] and not options['dry_run']:
+			updated = backfill_geohashes()
+			self.stdout.write(f'Set the geohash on {updated} reports.')
+
+		threshold = options['threshold'] or settings.REGION_SPLIT_THRESHOLD
+		split = rebalance(threshold=threshold, dry_run=options['dry_run'])
+		prefix = 'Would split' if options['dry_run'] else 'Split'
+		for region, count in split:
+			self.stdout.write(f'  {region:<8} {count} reports')
+		self.stdout.write(f'{prefix} {len(split)} regions over {threshold} reports.')
+
+		if options['list']:
+			for region, count in sorted(region_counts().items()):
+				self.stdout.write(f'  {region:<8} {count}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from reports.priority import refresh_priorities
+from reports.snapshot import snapshot_manager
+
+
+class Command(BaseCommand):
+	help = (
+		'Recount the local report density behind the sort=priority feed for reports '
+		'created since the last run and their neighbours, and store their priority.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--full',
+			action='store_true',
+			help='Recompute every report, e.g. nightly or after a bulk load',
+		)
+
+	def handle(self, *args, **options):
+		considered, updated = refresh_priorities(full=options['full'])
+		if updated:
+			# The snapshot carries the priority order
+			snapshot_manager.rebuild()
+		self.stdout.write(self.style.SUCCESS(
+			f'Checked {considered} reports, updated the priority of {updated}.'
+		))
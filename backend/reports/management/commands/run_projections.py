@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from reports.events import backfill_created_events
+from reports.projections import PROJECTIONS, catch_up, rebuild
+
+
+class Command(BaseCommand):
+	help = (
+		'Apply the report events logged since the last run to the read models '
+		'(counts, timeseries, region summaries), or rebuild them from the whole log.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--rebuild',
+			action='store_true',
+			help='Replay the whole event log into fresh collections and swap them in',
+		)
+		parser.add_argument(
+			'--backfill',
+			action='store_true',
+			help='First log a created event for every report without one (reports that predate the log or were bulk loaded)',
+		)
+		parser.add_argument(
+			'--only',
+			choices=sorted(PROJECTIONS),
+			action='append',
+			help='Run only this projection (repeatable)',
+		)
+
+	def handle(self, *args, **options):
+		if options['backfill']:
+			logged = backfill_created_events()
+			self.stdout.write(f'Logged {logged} created events for existing reports.')
+
+		for name in options['only'] or PROJECTIONS:
+			projection = PROJECTIONS[name]
+			try:
+				if options['rebuild']:
+					applied = rebuild(projection)
+				else:
+					applied = catch_up(projection)
+			except Exception as e:
+				raise CommandError(f'Projection {name} failed: {e}')
+			if applied is None:
+				self.stdout.write(self.style.WARNING(f'Skipped {name}: another run is applying it.'))
+			elif options['rebuild']:
+				self.stdout.write(self.style.SUCCESS(f'Rebuilt {name} from {applied} events.'))
+			else:
+				self.stdout.write(self.style.SUCCESS(f'Applied {applied} events to {name}.'))
@@ -1,7 +1,12 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from reports.indexes import ensure_indexes
 from reports.models import DisasterReport
+from reports.retention import ensure_ttl_index
+from reports.synthetic import SPATIAL_DISTRIBUTIONS, TEMPORAL_DISTRIBUTIONS, seed_collection, seed_parallel
 from datetime import datetime, timedelta
+import os
 import random
+import time
 
 
 class Command(BaseCommand):
@@ -19,6 +24,52 @@ class Command(BaseCommand):
 			default=20,
 			help='Number of reports to create (default: 20)',
 		)
+		parser.add_argument(
+			'--bulk',
+			action='store_true',
+			help='Generate synthetic reports in batches and insert them with insert_many from a process pool',
+		)
+		parser.add_argument(
+			'--seed',
+			type=int,
+			default=0,
+			help='Random seed for --bulk; the same seed and batch size give the same data (default: 0)',
+		)
+		parser.add_argument(
+			'--workers',
+			type=int,
+			default=os.cpu_count(),
+			help='Worker processes for --bulk; 1 inserts in-process (default: CPU count)',
+		)
+		parser.add_argument(
+			'--batch-size',
+			type=int,
+			default=5000,
+			help='Reports per insert_many batch for --bulk (default: 5000)',
+		)
+		parser.add_argument(
+			'--spatial',
+			choices=SPATIAL_DISTRIBUTIONS,
+			default='cities',
+			help='Spatial distribution for --bulk (default: cities)',
+		)
+		parser.add_argument(
+			'--temporal',
+			choices=TEMPORAL_DISTRIBUTIONS,
+			default='skewed',
+			help='Temporal distribution for --bulk (default: skewed)',
+		)
+		parser.add_argument(
+			'--days',
+			type=int,
+			default=30,
+			help='Spread --bulk reports over this many past days (default: 30)',
+		)
+		parser.add_argument(
+			'--drop-indexes-during-load',
+			action='store_true',
+			help='Drop secondary indexes before a --bulk load and rebuild them afterwards',
+		)
 	
 	def handle(self, *args, **options):
 		clear_existing = options['clear']
@@ -31,6 +82,11 @@ class Command(BaseCommand):
 				self.style.SUCCESS(f'Cleared {existing_count} existing reports')
 			)
 		
+		if options['bulk']:
+			return self.handle_bulk(count, options)
+		if options['drop_indexes_during_load']:
+			raise CommandError('--drop-indexes-during-load requires --bulk')
+		
 		# Sample data
 		sample_data = [
 			{
@@ -134,3 +190,58 @@ class Command(BaseCommand):
 		self.stdout.write(
 			self.style.SUCCESS(f'Total reports in database: {DisasterReport.objects.count()}')
 		)
+	
+	def handle_bulk(self, count, options):
+		collection = DisasterReport._get_collection()
+		generator_options = {
+			'spatial': options['spatial'],
+			'temporal': options['temporal'],
+			'days': options['days'],
+		}
+		
+		if options['drop_indexes_during_load']:
+			# Every insert would otherwise update each secondary index
+			collection.drop_indexes()
+			self.stdout.write('Dropped secondary indexes for the load')
+		
+		started = time.perf_counter()
+		if options['workers'] <= 1:
+			reports_created = seed_collection(
+				collection, count, seed=options['seed'], batch_size=options['batch_size'], **generator_options
+			)
+		else:
+			reports_created = 0
+			next_progress = count // 10
+			for inserted in seed_parallel(
+				count,
+				seed=options['seed'],
+				batch_size=options['batch_size'],
+				workers=options['workers'],
+				**generator_options,
+			):
+				reports_created += inserted
+				if reports_created >= next_progress:
+					self.stdout.write(f'  {reports_created}/{count} reports inserted')
+					next_progress += max(count // 10, 1)
+		elapsed = time.perf_counter() - started
+		
+		self.stdout.write(
+			self.style.SUCCESS(
+				f'Inserted {reports_created} reports in {elapsed:.1f}s '
+				f'({reports_created / max(elapsed, 1e-9):.0f} reports/s)'
+			)
+		)
+		
+		if options['drop_indexes_during_load']:
+			started = time.perf_counter()
+			result = ensure_indexes(collection)
+			ensure_ttl_index(collection)
+			self.stdout.write(
+				self.style.SUCCESS(
+					f"Rebuilt {len(result['created'])} indexes and the TTL index in {time.perf_counter() - started:.1f}s"
+				)
+			)
+		
+		self.stdout.write(
+			self.style.SUCCESS(f'Total reports in database: {collection.estimated_document_count()}')
+		)
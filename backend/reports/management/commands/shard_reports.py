@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import OperationFailure
+from reports.models import DisasterReport
+from reports.geohash import covering
+from reports.regions import is_sharded_cluster, load_partition_map, split_chunks
+
+
+class Command(BaseCommand):
+	help = (
+		'Shard the reports collection on geohash, so each region partition is a '
+		'range of chunks, and pre-split the chunks at the current region boundaries.'
+	)
+
+	def handle(self, *args, **options):
+		collection = DisasterReport._get_collection()
+		if not is_sharded_cluster(collection):
+			raise CommandError('Not connected to a mongos; MONGODB_URI must point at a sharded cluster.')
+
+		if collection.count_documents({'geohash': None}, limit=1):
+			raise CommandError('Some reports have no geohash; run `manage.py rebalance_regions --backfill` first.')
+
+		admin = collection.database.client.admin
+		namespace = f'{collection.database.name}.{collection.name}'
+		try:
+			admin.command('enableSharding', collection.database.name)
+			# Served by the declared geohash index
+			admin.command('shardCollection', namespace, key={'geohash': 1})
+		except OperationFailure as e:
+			raise CommandError(f'Failed to shard {namespace}: {e}')
+		self.stdout.write(f'Sharded {namespace} on geohash.')
+
+		partitions = load_partition_map()
+		# Parents of the base regions first, then every recorded split
+		parents = covering((-90, 90, -180, 180), partitions.base_precision - 1) + sorted(partitions.splits)
+		made = sum(split_chunks(collection, region) for region in parents)
+		self.stdout.write(self.style.SUCCESS(f'Made {made} chunk splits at region boundaries.'))
@@ -1,7 +1,19 @@
+from contextlib import contextmanager
+from datetime import timedelta
+
 from mongoengine import Document, fields
+from pymongo.errors import DuplicateKeyError
+from django.conf import settings
 from django.utils import timezone
 import uuid
 
+from .geohash import encode
+from .priority import priority_score
+
+
+# ~5m cells; region partitions are prefixes of this
+GEOHASH_PRECISION = 9
+
 
 class DisasterReport(Document):
 	"""
@@ -59,22 +71,65 @@ class DisasterReport(Document):
 		default=timezone.now,
 		help_text='When the report was last updated'
 	)
+	resolved_at = fields.DateTimeField(
+		null=True,
+		help_text='When the report was marked resolved (drives TTL expiry)'
+	)
+	geohash = fields.StringField(
+		max_length=12,
+		null=True,
+		help_text='Geohash of the location'
+	)
+	priority = fields.FloatField(
+		null=True,
+		help_text='Time-invariant feed ranking score (see reports/priority.py)'
+	)
+	priority_density = fields.IntField(
+		default=0,
+		help_text='Reports filed nearby around the same time, counted by refresh_priorities'
+	)
 	
 	meta = {
 		'ordering': ['-created_at'],
 		'verbose_name': 'Disaster Report',
 		'verbose_name_plural': 'Disaster Reports',
+		# Derived from the query shapes in reports/indexes.py and created by
+		# `manage.py ensure_indexes`, not implicitly on first use. The partial
+		# TTL index on resolved_at is managed by reports/retention.py.
+		'auto_create_index': False,
 		'indexes': [
-			'disaster_type',
-			'status',
+			# Feed order, snapshot builds and the 24h window (either direction)
 			'created_at',
+			# Per-type counts, overall and within the 24h window
+			('disaster_type', '-created_at'),
+			# Per-status counts
+			'status',
+			# Bounding-box prefilter for radius searches
 			('latitude', 'longitude'),
+			# Region partitions are geohash prefix ranges; also the shard key (see reports/regions.py)
+			'geohash',
+			# sort=priority feed, newest first among equal scores
+			('-priority', '-created_at'),
+			# Full-text search; a match on the type outweighs a passing mention
+			{
+				'fields': ['$description', '$disaster_type'],
+				'name': 'report_text',
+				'default_language': 'english',
+				'weights': {'description': 5, 'disaster_type': 10},
+			},
 		]
 	}
 	
 	def __str__(self):
 		return f'{self.get_disaster_type_display()} - {self.created_at.strftime("%Y-%m-%d %H:%M")}'
 	
+	def clean(self):
+		"""Derive the geohash and priority; runs on validate() and save()."""
+		if self.latitude is not None and self.longitude is not None:
+			self.geohash = encode(self.latitude, self.longitude, GEOHASH_PRECISION)
+		if self.created_at is not None:
+			self.priority = priority_score(self.disaster_type, self.status, self.created_at, self.priority_density)
+	
 	def save(self, *args, **kwargs):
 		"""Override save to update the updated_at field."""
 		self.updated_at = timezone.now()
@@ -111,4 +166,173 @@ class DisasterReport(Document):
 	@property
 	def mongodb_id(self):
 		"""Return the MongoDB ObjectId as string."""
-		return str(self.id)
\ No newline at end of file
+		return str(self.id)
+
+
+class RegionSplit(Document):
+	"""
+	A region partition that has been split into its 32 child cells.
+	Regions without a RegionSplit are leaves (see reports/regions.py).
+	"""
+	prefix = fields.StringField(primary_key=True, max_length=12)
+	report_count = fields.IntField(help_text='Reports in the region when it was split')
+	split_at = fields.DateTimeField(default=timezone.now)
+	
+	meta = {
+		'collection': 'report_region_splits',
+	}
+
+
+class JobCheckpoint(Document):
+	"""
+	How far an incremental background job has got, by name, and the lease
+	of the run currently doing it. A run takes the lease before reading the
+	position, so overlapping runs (cron, a manual run) never apply the same
+	work twice; a run that dies leaves it to expire after JOB_LEASE_SECONDS.
+	"""
+	name = fields.StringField(primary_key=True, max_length=100)
+	position = fields.DynamicField(help_text='Everything up to this timestamp or event sequence number has been processed')
+	updated_at = fields.DateTimeField(default=timezone.now)
+	lease_owner = fields.StringField(null=True, help_text='Token of the run holding the lease')
+	lease_expires = fields.DateTimeField(null=True)
+	
+	meta = {
+		'collection': 'job_checkpoints',
+	}
+	
+	@classmethod
+	def position_of(cls, name):
+		checkpoint = cls.objects(name=name).first()
+		return checkpoint.position if checkpoint else None
+	
+	@classmethod
+	def advance(cls, name, position):
+		"""Move the checkpoint forward to position, never back. Returns whether it moved."""
+		try:
+			result = cls._get_collection().update_one(
+				{'_id': name, '$or': [{'position': None}, {'position': {'$lt': position}}]},
+				{'$set': {'position': position, 'updated_at': timezone.now()}},
+				upsert=True,
+			)
+		except DuplicateKeyError:
+			# The checkpoint exists and is already at or past position
+			return False
+		return bool(result.modified_count or result.upserted_id)
+	
+	@classmethod
+	def acquire(cls, name, seconds=None):
+		"""Take the lease of a job unless another run holds it. Returns the lease token, or None."""
+		token = uuid.uuid4().hex
+		now = timezone.now()
+		try:
+			cls._get_collection().update_one(
+				{'_id': name, '$or': [{'lease_expires': None}, {'lease_expires': {'$lt': now}}]},
+				{'$set': {
+					'lease_owner': token,
+					'lease_expires': now + timedelta(seconds=seconds or settings.JOB_LEASE_SECONDS),
+				}},
+				upsert=True,
+			)
+		except DuplicateKeyError:
+			# Held by a run whose lease has not expired
+			return None
+		return token
+	
+	@classmethod
+	def renew(cls, name, token, seconds=None):
+		"""Extend a held lease. Returns False when it expired and another run took it."""
+		return bool(cls.objects(name=name, lease_owner=token).update_one(
+			set__lease_expires=timezone.now() + timedelta(seconds=seconds or settings.JOB_LEASE_SECONDS),
+		))
+	
+	@classmethod
+	def release(cls, name, token):
+		cls.objects(name=name, lease_owner=token).update_one(set__lease_owner=None, set__lease_expires=None)
+	
+	@classmethod
+	@contextmanager
+	def lease(cls, name, seconds=None):
+		"""Hold the lease of a job for the block; yields its token, or None when another run holds it."""
+		token = cls.acquire(name, seconds)
+		try:
+			yield token
+		finally:
+			if token:
+				cls.release(name, token)
+
+
+class GeofenceSubscription(Document):
+	"""
+	An area a subscriber wants alerts for. Circles are stored as their
+	circumscribed polygon, so new reports are matched against every
+	subscription with one $geoIntersects on the 2dsphere index over `area`
+	(see reports/geofences.py); the center and radius refine the match.
+	"""
+	subscriber_id = fields.StringField(max_length=100, required=True)
+	area = fields.PolygonField(required=True, auto_index=False)
+	center = fields.ListField(fields.FloatField(), help_text='[lng, lat] of a circular geofence')
+	radius_km = fields.FloatField(null=True, help_text='Radius of a circular geofence')
+	types = fields.ListField(
+		fields.StringField(choices=DisasterReport.DISASTER_TYPE_CHOICES),
+		help_text='Disaster types to alert on; empty for all'
+	)
+	created_at = fields.DateTimeField(default=timezone.now)
+	
+	meta = {
+		'collection': 'geofence_subscriptions',
+		'indexes': [
+			'(area',
+			'subscriber_id',
+		],
+	}
+
+
+class GeofenceAlert(Document):
+	"""A report that fell inside a subscription, waiting in the subscriber's inbox."""
+	subscriber_id = fields.StringField(max_length=100, required=True)
+	subscription = fields.ObjectIdField(required=True)
+	report = fields.ObjectIdField(required=True)
+	disaster_type = fields.StringField(max_length=20)
+	description = fields.StringField()
+	latitude = fields.FloatField()
+	longitude = fields.FloatField()
+	reported_at = fields.DateTimeField()
+	distance_km = fields.FloatField(null=True, help_text='From the center of a circular geofence')
+	created_at = fields.DateTimeField(default=timezone.now)
+	
+	meta = {
+		'collection': 'geofence_alerts',
+		'indexes': [
+			# The inbox, oldest first
+			('subscriber_id', 'id'),
+			# Undelivered alerts expire
+			{'fields': ['created_at'], 'expireAfterSeconds': int(settings.GEOFENCE_ALERT_RETENTION_HOURS * 3600)},
+		],
+	}
+
+
+class ReportEvent(Document):
+	"""
+	One entry of the append-only report event log (see reports/events.py).
+	The sequence number is the primary key, so the log is read in order
+	from the _id index.
+	"""
+	KIND_CHOICES = [
+		('created', 'Created'),
+		('status_changed', 'Status changed'),
+		('deleted', 'Deleted'),
+	]
+	
+	seq = fields.IntField(primary_key=True)
+	kind = fields.StringField(max_length=20, choices=KIND_CHOICES, required=True)
+	report = fields.ObjectIdField(required=True)
+	data = fields.DictField(help_text='The report fields projections need, as of the event')
+	occurred_at = fields.DateTimeField(default=timezone.now)
+	
+	meta = {
+		'collection': 'report_events',
+		'indexes': [
+			# The history of one report
+			('report', 'seq'),
+		],
+	}
@@ -0,0 +1,208 @@
+"""
+Priority ranking for the feed (sort=priority).
+
+A report's weight is the product of its type and status weights and a
+density boost for the other reports filed within PRIORITY_DENSITY_RADIUS_KM
+and PRIORITY_DENSITY_WINDOW_HOURS of it. Its importance decays by half
+every PRIORITY_HALF_LIFE_HOURS, i.e. at time t it is
+
+	weight * 2 ** -((t - created_at) / half_life)
+
+The stored score is the log2 of that plus t / half_life:
+
+	priority = log2(weight) + created_at / half_life
+
+which is the same for every t, so ordering by the stored score is ordering
+by decayed importance at any moment, and the score never goes stale as
+time passes. An index on it serves the feed with no work at read time.
+
+Type and status are known when a report is written, so the score is set
+on every save (see DisasterReport.clean) from the stored density. Density
+only changes when reports are added nearby: `manage.py refresh_priorities`
+recounts it for the reports created since its last run and for their
+neighbours, and `--full` recounts everything (e.g. nightly, to account for
+expired reports) one density window at a time.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .columnar import to_millis
+from .utils import haversine_distance
+
+
+TYPE_WEIGHTS = {
+	'collapse': 1.0,
+	'fire': 0.9,
+	'flood': 0.8,
+	'accident': 0.5,
+}
+STATUS_WEIGHTS = {
+	'active': 1.0,
+	'investigating': 0.7,
+	'resolved': 0.1,
+}
+DEFAULT_WEIGHT = 0.5
+
+# A doubling of nearby reports adds this much to the weight multiplier
+DENSITY_WEIGHT = 0.25
+
+CHECKPOINT_NAME = 'refresh_priorities'
+
+# Writers' clocks may lag the job's; re-read this much before the checkpoint
+CHECKPOINT_OVERLAP = timedelta(minutes=2)
+
+ROW_FIELDS = {'created_at': 1, 'latitude': 1, 'longitude': 1, 'disaster_type': 1, 'status': 1, 'priority_density': 1}
+
+
+def priority_score(disaster_type, status, created_at, density=0):
+	"""Return the time-invariant priority of a report (see the module docstring)."""
+	weight = (
+		TYPE_WEIGHTS.get(disaster_type, DEFAULT_WEIGHT)
+		* STATUS_WEIGHTS.get(status, DEFAULT_WEIGHT)
+		* (1 + DENSITY_WEIGHT * math.log2(1 + (density or 0)))
+	)
+	hours = to_millis(created_at) / 3600000
+	return round(math.log2(weight) + hours / settings.PRIORITY_HALF_LIFE_HOURS, 6)
+
+
+def row_priority(row, density=None):
+	"""priority_score() of a raw report document."""
+	if density is None:
+		density = row.get('priority_density') or 0
+	return priority_score(row.get('disaster_type'), row.get('status'), row.get('created_at'), density)
+
+
+class DensityGrid:
+	"""Reports bucketed in cells of the density radius, for neighbour counts."""
+
+	def __init__(self, rows, radius_km, window):
+		self.radius_km = radius_km
+		self.window_ms = window.total_seconds() * 1000
+		self.cell = radius_km / 111.0
+		self.cells = defaultdict(list)
+		for row in rows:
+			if row.get('latitude') is None or row.get('longitude') is None:
+				continue
+			key = self.key(row['latitude'], row['longitude'])
+			self.cells[key].append((row['_id'], row['latitude'], row['longitude'], to_millis(row.get('created_at'))))
+
+	def key(self, lat, lng):
+		return int(math.floor(lat / self.cell)), int(math.floor(lng / self.cell))
+
+	def neighbours(self, row):
+		"""Yield the ids of the other reports within the radius and window of row."""
+		lat, lng = row.get('latitude'), row.get('longitude')
+		if lat is None or lng is None:
+			return
+		created = to_millis(row.get('created_at'))
+		lat_cell, lng_cell = self.key(lat, lng)
+		# A degree of longitude shrinks towards the poles
+		lng_span = math.ceil(1 / max(math.cos(math.radians(lat)), 0.01))
+		for lat_key in range(lat_cell - 1, lat_cell + 2):
+			for lng_key in range(lng_cell - lng_span, lng_cell + lng_span + 1):
+				for other_id, other_lat, other_lng, other_created in self.cells.get((lat_key, lng_key), ()):
+					if other_id == row['_id'] or abs(other_created - created) > self.window_ms:
+						continue
+					if haversine_distance(lat, lng, other_lat, other_lng) <= self.radius_km:
+						yield other_id
+
+
+def priority_updates(rows, affected_ids, grid):
+	"""Return the UpdateOne operations that store density and priority for the affected rows."""
+	updates = []
+	for row in rows:
+		if row['_id'] not in affected_ids:
+			continue
+		density = sum(1 for _ in grid.neighbours(row))
+		if density == row.get('priority_density') and row.get('priority') is not None:
+			continue
+		updates.append(UpdateOne(
+			{'_id': row['_id']},
+			{'$set': {'priority_density': density, 'priority': row_priority(row, density)}},
+		))
+	return updates
+
+
+def write_updates(collection, updates, batch_size=1000):
+	updated = 0
+	for start in range(0, len(updates), batch_size):
+		updated += collection.bulk_write(updates[start:start + batch_size], ordered=False).modified_count
+	return updated
+
+
+def windows(collection, projection, window):
+	"""
+	Yield (rows, ids of the rows to recount) one density window of reports at a
+	time, oldest first. Their neighbours are at most a window away, so the rows
+	include one window either side: memory stays bounded by three windows of
+	reports however large the collection grows.
+	"""
+	oldest = collection.find_one({'created_at': {'$ne': None}}, {'created_at': 1}, sort=[('created_at', 1)])
+	newest = collection.find_one({'created_at': {'$ne': None}}, {'created_at': 1}, sort=[('created_at', -1)])
+	if oldest is None:
+		return
+	start = oldest['created_at']
+	while start <= newest['created_at']:
+		end = start + window
+		rows = list(collection.find({'created_at': {'$gte': start - window, '$lt': end + window}}, projection))
+		own_ids = {row['_id'] for row in rows if start <= row['created_at'] < end}
+		yield rows, own_ids
+		start = end
+
+
+def refresh_priorities(collection=None, full=False, since=None):
+	"""
+	Recount the density of reports created since the last run (or since
+	`since`) and of their neighbours, and store their priority. With full,
+	every report is recomputed. Returns (reports considered, reports updated).
+	"""
+	from .models import DisasterReport, JobCheckpoint
+
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	radius_km = settings.PRIORITY_DENSITY_RADIUS_KM
+	window = timedelta(hours=settings.PRIORITY_DENSITY_WINDOW_HOURS)
+	started_at = timezone.now()
+	projection = dict(ROW_FIELDS, priority=1)
+
+	if full:
+		considered = updated = 0
+		for rows, own_ids in windows(collection, projection, window):
+			grid = DensityGrid(rows, radius_km, window)
+			updated += write_updates(collection, priority_updates(rows, own_ids, grid))
+			considered += len(own_ids)
+		JobCheckpoint.advance(CHECKPOINT_NAME, started_at)
+		return considered, updated
+
+	if since is None:
+		since = JobCheckpoint.position_of(CHECKPOINT_NAME)
+	if since is None:
+		# First run: nothing to catch up with beyond one density window
+		since = started_at - window
+	since -= CHECKPOINT_OVERLAP
+
+	created = list(collection.find({'created_at': {'$gte': since}}, {'created_at': 1}))
+	if not created:
+		JobCheckpoint.advance(CHECKPOINT_NAME, started_at)
+		return 0, 0
+
+	# Neighbours of a new report are within one window of it, and their own
+	# neighbours within two
+	oldest = min(row['created_at'] for row in created)
+	newest = max(row['created_at'] for row in created)
+	rows = list(collection.find({'created_at': {'$gte': oldest - 2 * window, '$lte': newest + 2 * window}}, projection))
+	grid = DensityGrid(rows, radius_km, window)
+
+	new_ids = {row['_id'] for row in created}
+	affected = set(new_ids)
+	for row in rows:
+		if row['_id'] in new_ids:
+			affected.update(grid.neighbours(row))
+
+	updated = write_updates(collection, priority_updates(rows, affected, grid))
+	JobCheckpoint.advance(CHECKPOINT_NAME, started_at)
+	return len(affected), updated
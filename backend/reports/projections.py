@@ -0,0 +1,239 @@
+"""
+Read models folded from the report event log (see reports/events.py).
+
+A Projection turns each event into increments of documents in its own
+collection; consecutive events are merged into one upsert per document, so
+a batch of events costs one bulk write. `manage.py run_projections` applies
+the events after each projection's checkpoint (a JobCheckpoint named
+``projection:<name>`` holding the last sequence number applied) and is run
+every minute; `--rebuild` replays the whole log into a staging collection
+and swaps it in, e.g. after changing a projection.
+
+Each run, incremental or rebuild, holds the lease of its projection's
+checkpoint (see JobCheckpoint.lease): a run that finds it taken, e.g. the
+next minute's cron run while a backlog is still being applied, skips that
+projection, and checkpoints only ever move forward. Events are applied
+before the checkpoint advances, so a run that dies in between applies that
+batch twice once its lease expires; a rebuild corrects it.
+
+Reports deleted by the TTL index have no event, so resolved counts here are
+cumulative: reports that were resolved, less those archived.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .columnar import from_millis, to_millis
+from .events import head_sequence, read_events
+from .models import JobCheckpoint, ReportEvent
+
+
+class Projection:
+	"""A read model kept in `collection_name`, folded from report events."""
+	name = None
+	collection_name = None
+
+	def changes(self, event):
+		"""Yield (document id, fields to set, {field: increment}) for an event."""
+		raise NotImplementedError
+
+	def updates(self, events):
+		"""Return one upsert per document the events touch."""
+		fields = {}
+		increments = defaultdict(Counter)
+		for event in events:
+			for key, values, deltas in self.changes(event):
+				fields[key] = values
+				increments[key].update(deltas)
+		updates = []
+		for key, values in fields.items():
+			update = {'$set': values}
+			if increments[key]:
+				update['$inc'] = dict(increments[key])
+			updates.append(UpdateOne({'_id': key}, update, upsert=True))
+		return updates
+
+	def read(self, collection):
+		return list(collection.find({}, {'_id': 0}))
+
+
+def open_or_resolved(status):
+	return 'resolved' if status == 'resolved' else 'open'
+
+
+class ReportCounts(Projection):
+	"""Reports per type and status."""
+	name = 'counts'
+	collection_name = 'projection_report_counts'
+
+	def change(self, disaster_type, status, delta):
+		return f'{disaster_type}:{status}', {'disaster_type': disaster_type, 'status': status}, {'count': delta}
+
+	def changes(self, event):
+		data = event['data']
+		if event['kind'] == 'created':
+			yield self.change(data['disaster_type'], data['status'], 1)
+		elif event['kind'] == 'status_changed':
+			yield self.change(data['disaster_type'], data['previous_status'], -1)
+			yield self.change(data['disaster_type'], data['status'], 1)
+		elif event['kind'] == 'deleted':
+			yield self.change(data['disaster_type'], data['status'], -1)
+
+	def read(self, collection):
+		counts = defaultdict(dict)
+		for row in collection.find({'count': {'$ne': 0}}):
+			counts[row['disaster_type']][row['status']] = row['count']
+		return counts
+
+
+class ReportTimeseries(Projection):
+	"""
+	Reports filed, resolved and reopened per hour and type. Reports are counted in
+	the hour they were filed, status changes in the hour they happened.
+	"""
+	name = 'timeseries'
+	collection_name = 'projection_report_timeseries'
+
+	def change(self, at, disaster_type, field):
+		hour = from_millis(to_millis(at)).replace(minute=0, second=0, microsecond=0)
+		# Keys sort by hour, so a time range is an _id range
+		key = f'{hour:%Y-%m-%dT%H}:{disaster_type}'
+		return key, {'hour': hour, 'disaster_type': disaster_type}, {field: 1}
+
+	def changes(self, event):
+		data = event['data']
+		if event['kind'] == 'created':
+			yield self.change(data['created_at'], data['disaster_type'], 'created')
+		elif event['kind'] == 'status_changed' and data['status'] == 'resolved':
+			yield self.change(event['occurred_at'], data['disaster_type'], 'resolved')
+		elif event['kind'] == 'status_changed' and data['previous_status'] == 'resolved':
+			yield self.change(event['occurred_at'], data['disaster_type'], 'reopened')
+
+	def read(self, collection, hours=None):
+		hours = hours or settings.PROJECTION_TIMESERIES_HOURS
+		since = timezone.now() - timedelta(hours=hours)
+		return list(collection.find({'_id': {'$gte': f'{since:%Y-%m-%dT%H}'}}, {'_id': 0}).sort('_id', 1))
+
+
+class RegionSummaries(Projection):
+	"""Open and resolved reports per base region (geohash prefix, see reports/regions.py)."""
+	name = 'regions'
+	collection_name = 'projection_region_summaries'
+
+	def change(self, data, status, delta):
+		region = (data.get('geohash') or '')[:settings.REGION_BASE_PRECISION]
+		state = open_or_resolved(status)
+		deltas = {state: delta}
+		if state == 'open':
+			deltas[f'open_by_type.{data["disaster_type"]}'] = delta
+		return region, {'region': region}, deltas
+
+	def changes(self, event):
+		data = event['data']
+		if not data.get('geohash'):
+			return
+		if event['kind'] == 'created':
+			yield self.change(data, data['status'], 1)
+		elif event['kind'] == 'status_changed':
+			yield self.change(data, data['previous_status'], -1)
+			yield self.change(data, data['status'], 1)
+		elif event['kind'] == 'deleted':
+			yield self.change(data, data['status'], -1)
+
+	def read(self, collection):
+		return list(collection.find({'open': {'$gt': 0}}, {'_id': 0}).sort('open', -1))
+
+
+PROJECTIONS = {projection.name: projection for projection in (
+	ReportCounts(),
+	ReportTimeseries(),
+	RegionSummaries(),
+)}
+
+
+def checkpoint_name(projection):
+	return f'projection:{projection.name}'
+
+
+def database():
+	return ReportEvent._get_collection().database
+
+
+def fold(projection, target, position, batch_size, lease, checkpoint=True):
+	"""Apply the events after position to target. Returns (events applied, last position)."""
+	applied = 0
+	while True:
+		events = read_events(position, batch_size)
+		if not events:
+			break
+		if not JobCheckpoint.renew(checkpoint_name(projection), lease):
+			raise RuntimeError(f'lost the lease of {projection.name} to another run')
+		updates = projection.updates(events)
+		if updates:
+			target.bulk_write(updates, ordered=False)
+		position = events[-1]['_id']
+		applied += len(events)
+		if checkpoint:
+			JobCheckpoint.advance(checkpoint_name(projection), position)
+		if len(events) < batch_size:
+			# Caught up, or stopped at a hole that may still be filled
+			break
+	return applied, position
+
+
+def catch_up(projection, batch_size=None):
+	"""
+	Apply the events logged since the projection's checkpoint. Returns the
+	number applied, or None when another run holds the projection.
+	"""
+	name = checkpoint_name(projection)
+	with JobCheckpoint.lease(name) as lease:
+		if lease is None:
+			return None
+		position = JobCheckpoint.position_of(name) or 0
+		applied, _ = fold(
+			projection, database()[projection.collection_name], position,
+			batch_size or settings.PROJECTION_BATCH_SIZE, lease,
+		)
+		return applied
+
+
+def rebuild(projection, batch_size=None):
+	"""
+	Replay the whole log into a fresh collection and swap it in. Returns the
+	number applied, or None when another run holds the projection.
+	"""
+	name = checkpoint_name(projection)
+	with JobCheckpoint.lease(name) as lease:
+		if lease is None:
+			return None
+		db = database()
+		staging = db[f'{projection.collection_name}_rebuild']
+		staging.drop()
+		applied, position = fold(
+			projection, staging, 0, batch_size or settings.PROJECTION_BATCH_SIZE, lease, checkpoint=False,
+		)
+		if applied:
+			staging.rename(projection.collection_name, dropTarget=True)
+		else:
+			db.drop_collection(projection.collection_name)
+		JobCheckpoint.advance(name, position)
+		return applied
+
+
+def read_model(name, **params):
+	"""Return the current state of a projection."""
+	projection = PROJECTIONS[name]
+	return projection.read(database()[projection.collection_name], **params)
+
+
+def projection_lag():
+	"""Events logged but not yet applied, per projection."""
+	head = head_sequence(database())
+	return {
+		name: max(head - (JobCheckpoint.position_of(checkpoint_name(projection)) or 0), 0)
+		for name, projection in PROJECTIONS.items()
+	}
@@ -0,0 +1,266 @@
+"""
+Geohash region partitions.
+
+Every report stores the geohash of its location, and a region is a geohash
+prefix: the reports of a region are one contiguous range of the geohash
+index, and of the chunks when the collection is sharded on geohash (see
+`manage.py shard_reports`). Regions start at REGION_BASE_PRECISION
+characters; `manage.py rebalance_regions` splits a region holding more than
+REGION_SPLIT_THRESHOLD reports into its 32 children, recorded as a
+RegionSplit, down to REGION_MAX_PRECISION.
+
+Area queries (radius, viewport, area summaries) are restricted to the
+geohash ranges of the regions intersecting their bounding box. Adjacent
+regions are contiguous in geohash order and merge into one range. Writes
+never consult the partition map, so a stale map only means coarser ranges:
+a worker can never miss a report because another one split its region.
+
+Reports stored before the geohash field have none until
+`backfill_geohashes()` has run (`manage.py ensure_indexes` runs it on every
+deploy). Until the partition map sees none left, area queries also match
+reports without a geohash, so they never drop out of nearby results.
+"""
+import threading
+import time
+
+from django.conf import settings
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from .geohash import BASE32, DECODE, children, covering, encode, intersects
+from .models import GEOHASH_PRECISION, DisasterReport, RegionSplit
+
+
+# Beyond this many ranges the bounding box alone is the better filter
+MAX_QUERY_RANGES = 64
+
+_map_lock = threading.Lock()
+_partition_map = None
+_loaded_at = 0.0
+
+
+def successor(prefix):
+	"""Return the smallest geohash after every hash starting with prefix, or None."""
+	prefix = prefix.rstrip(BASE32[-1])
+	if not prefix:
+		return None
+	return prefix[:-1] + BASE32[DECODE[prefix[-1]] + 1]
+
+
+def prefix_range(prefix):
+	"""Return the geohash condition matching the hashes that start with prefix."""
+	condition = {'$gte': prefix}
+	upper = successor(prefix)
+	if upper is not None:
+		condition['$lt'] = upper
+	return condition
+
+
+def merge_ranges(prefixes):
+	"""Merge prefixes into sorted, non-adjacent [(lower, upper)] ranges; upper None is open."""
+	ranges = []
+	for prefix in sorted(prefixes):
+		upper = successor(prefix)
+		# Nothing sorts between 's1' and 's10': trailing zeros are the lowest hashes
+		if ranges and ranges[-1][1] is not None and ranges[-1][1] >= prefix.rstrip(BASE32[0]):
+			lower, previous = ranges[-1]
+			ranges[-1] = (lower, None if upper is None else max(previous, upper))
+		else:
+			ranges.append((prefix, upper))
+	return ranges
+
+
+class PartitionMap:
+	"""The set of split regions; every other region at or below the base precision is a leaf."""
+
+	def __init__(self, splits=(), base_precision=None, max_precision=None, complete=False):
+		self.splits = set(splits)
+		# Whether every located report has a geohash (see backfill_geohashes)
+		self.complete = complete
+		self.base_precision = base_precision or settings.REGION_BASE_PRECISION
+		self.max_precision = max_precision or settings.REGION_MAX_PRECISION
+
+	def region_for(self, geohash):
+		"""Return the leaf region holding a geohash."""
+		region = geohash[:self.base_precision]
+		while region in self.splits and len(region) < min(len(geohash), self.max_precision):
+			region = geohash[:len(region) + 1]
+		return region
+
+	def regions_for_box(self, box):
+		"""Return the leaf regions overlapping box = (lat_min, lat_max, lng_min, lng_max)."""
+		regions = []
+		pending = covering(box, self.base_precision)
+		while pending:
+			region = pending.pop()
+			if region in self.splits and len(region) < self.max_precision:
+				pending.extend(child for child in children(region) if intersects(child, box))
+			else:
+				regions.append(region)
+		return sorted(regions)
+
+	def ranges_for_box(self, box):
+		"""
+		Return the merged geohash ranges of the regions overlapping box, or
+		None when there are too many for an index scan to beat the box itself.
+		"""
+		ranges = merge_ranges(self.regions_for_box(box))
+		return ranges if len(ranges) <= MAX_QUERY_RANGES else None
+
+
+def missing_geohash_query():
+	"""Located reports without a geohash; served by the geohash index, as null matches a missing field."""
+	return {'geohash': None, 'latitude': {'$ne': None}, 'longitude': {'$ne': None}}
+
+
+def load_partition_map():
+	"""Read the partition map from MongoDB."""
+	complete = DisasterReport._get_collection().find_one(missing_geohash_query(), {'_id': 1}) is None
+	return PartitionMap((split.prefix for split in RegionSplit.objects.only('prefix')), complete=complete)
+
+
+def partition_map():
+	"""Return this process's partition map, reloaded every REGION_MAP_REFRESH_SECONDS."""
+	global _partition_map, _loaded_at
+	if _partition_map is not None and time.monotonic() - _loaded_at < settings.REGION_MAP_REFRESH_SECONDS:
+		return _partition_map
+	with _map_lock:
+		if _partition_map is None or time.monotonic() - _loaded_at >= settings.REGION_MAP_REFRESH_SECONDS:
+			try:
+				_partition_map = load_partition_map()
+			except Exception as e:
+				# Coarser ranges are still correct; keep serving with what we have
+				print(f"Failed to load region partition map: {e}")
+				if _partition_map is None:
+					_partition_map = PartitionMap()
+			_loaded_at = time.monotonic()
+	return _partition_map
+
+
+def invalidate_partition_map():
+	"""Make the next partition_map() call reload the map."""
+	global _loaded_at
+	_loaded_at = 0.0
+
+
+def geohash_match(box):
+	"""
+	Return the query conditions restricting reports to the regions
+	overlapping box, or {} when the box covers too many regions. Until every
+	report has a geohash, reports without one match too; the latitude and
+	longitude conditions still apply to them.
+	"""
+	partitions = partition_map()
+	ranges = partitions.ranges_for_box(box)
+	if ranges is None:
+		return {}
+	conditions = []
+	for lower, upper in ranges:
+		condition = {'$gte': lower}
+		if upper is not None:
+			condition['$lt'] = upper
+		conditions.append({'geohash': condition})
+	if not partitions.complete:
+		conditions.append({'geohash': None})
+	if len(conditions) == 1:
+		return conditions[0]
+	return {'$or': conditions}
+
+
+def prefix_counts(collection, prefix, precision):
+	"""Count the reports under prefix per geohash prefix of the given length."""
+	pipeline = [
+		{'$match': {'geohash': prefix_range(prefix)}},
+		{'$group': {'_id': {'$substrBytes': ['$geohash', 0, precision]}, 'count': {'$sum': 1}}},
+	]
+	return {row['_id']: row['count'] for row in collection.aggregate(pipeline)}
+
+
+def region_counts(collection=None, partitions=None):
+	"""Return {region: reports} for every non-empty leaf region."""
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	partitions = partitions or load_partition_map()
+	counts = {}
+	pending = [('', partitions.base_precision)]
+	while pending:
+		prefix, precision = pending.pop()
+		for region, count in prefix_counts(collection, prefix, precision).items():
+			if region in partitions.splits and precision < partitions.max_precision:
+				pending.append((region, precision + 1))
+			else:
+				counts[region] = count
+	return counts
+
+
+def is_sharded_cluster(collection):
+	"""Whether the collection is reached through a mongos router."""
+	return collection.database.client.admin.command('hello').get('msg') == 'isdbgrid'
+
+
+def split_chunks(collection, region):
+	"""
+	Split the chunks of a sharded collection at the boundaries of a region's
+	children, so the balancer can move the hot children apart.
+	Returns the number of splits made.
+	"""
+	namespace = f'{collection.database.name}.{collection.name}'
+	made = 0
+	for child in children(region)[1:]:
+		try:
+			collection.database.client.admin.command('split', namespace, middle={'geohash': child})
+			made += 1
+		except OperationFailure:
+			# Already a chunk boundary
+			pass
+	return made
+
+
+def rebalance(threshold=None, dry_run=False, collection=None):
+	"""
+	Split every region holding more than threshold reports, then any child
+	still over it, until REGION_MAX_PRECISION. Returns the (region, reports)
+	pairs that were split, or would be with dry_run.
+	"""
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	threshold = threshold or settings.REGION_SPLIT_THRESHOLD
+	partitions = load_partition_map()
+	hot = [(region, count) for region, count in region_counts(collection, partitions).items() if count > threshold]
+	sharded = not dry_run and is_sharded_cluster(collection)
+
+	split = []
+	while hot:
+		region, count = hot.pop()
+		if len(region) >= partitions.max_precision:
+			continue
+		split.append((region, count))
+		partitions.splits.add(region)
+		if not dry_run:
+			RegionSplit(prefix=region, report_count=count).save()
+			if sharded:
+				split_chunks(collection, region)
+		hot.extend(
+			(child, child_count)
+			for child, child_count in prefix_counts(collection, region, len(region) + 1).items()
+			if child_count > threshold
+		)
+
+	if split and not dry_run:
+		invalidate_partition_map()
+	return split
+
+
+def backfill_geohashes(collection=None, batch_size=1000):
+	"""Stamp the geohash on reports stored before the field existed. Returns the number updated."""
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	updated = 0
+	batch = []
+	for document in collection.find(missing_geohash_query(), {'latitude': 1, 'longitude': 1}):
+		geohash = encode(document['latitude'], document['longitude'], GEOHASH_PRECISION)
+		batch.append(UpdateOne({'_id': document['_id']}, {'$set': {'geohash': geohash}}))
+		if len(batch) >= batch_size:
+			updated += collection.bulk_write(batch, ordered=False).modified_count
+			batch = []
+	if batch:
+		updated += collection.bulk_write(batch, ordered=False).modified_count
+	invalidate_partition_map()
+	return updated
@@ -0,0 +1,29 @@
+"""
+Response renderers beyond DRF's JSON.
+
+MessagePack is optional: without the msgpack package the renderer is left
+out of MARKER_RENDERERS and clients asking for it get 406 Not Acceptable.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+
+class MessagePackRenderer(BaseRenderer):
+	"""Render with MessagePack; select with Accept: application/msgpack or ?format=msgpack."""
+	media_type = 'application/msgpack'
+	format = 'msgpack'
+	charset = None
+	render_style = 'binary'
+
+	def render(self, data, accepted_media_type=None, renderer_context=None):
+		if data is None:
+			return b''
+		# Coordinates are rounded to ~1m; float32 keeps them within a metre
+		return msgpack.packb(data, use_single_float=True)
+
+
+MARKER_RENDERERS = [JSONRenderer] + ([MessagePackRenderer] if msgpack is not None else [])
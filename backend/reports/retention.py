@@ -0,0 +1,149 @@
+"""
+Retention of resolved reports.
+
+MongoDB expires resolved reports itself through a partial TTL index on
+``resolved_at``, so the application never scans or deletes them. The
+helpers here keep that index in line with the configured retention window
+and report on whether expiry is keeping up.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ASCENDING
+
+from .models import DisasterReport
+
+
+TTL_INDEX_NAME = 'resolved_at_ttl'
+
+# MongoDB's TTL monitor runs every 60 seconds; allow for one missed pass
+TTL_MONITOR_LAG = timedelta(seconds=120)
+
+_ttl_index_lock = threading.Lock()
+_ttl_index_checked = False
+
+
+def retention_seconds():
+	"""Return the configured retention window in seconds."""
+	return settings.RESOLVED_REPORT_RETENTION_MINUTES * 60
+
+
+def ttl_seconds():
+	"""
+	Return the TTL index expiry in seconds.
+	With archiving enabled the grace period lets the archiver run first.
+	"""
+	return (settings.RESOLVED_REPORT_RETENTION_MINUTES + settings.RESOLVED_REPORT_TTL_GRACE_MINUTES) * 60
+
+
+def ensure_ttl_index(collection=None):
+	"""
+	Create the partial TTL index, or retune it when the retention changed.
+	Returns 'created', 'updated' or 'ok'.
+	"""
+	collection = collection if collection is not None else DisasterReport._get_collection()
+	expire_after = ttl_seconds()
+	index = collection.index_information().get(TTL_INDEX_NAME)
+
+	if index is None:
+		collection.create_index(
+			[('resolved_at', ASCENDING)],
+			name=TTL_INDEX_NAME,
+			expireAfterSeconds=expire_after,
+			partialFilterExpression={'status': 'resolved'},
+		)
+		return 'created'
+
+	if index.get('expireAfterSeconds') != expire_after:
+		# collMod changes the TTL in place instead of rebuilding the index
+		collection.database.command(
+			'collMod',
+			collection.name,
+			index={'name': TTL_INDEX_NAME, 'expireAfterSeconds': expire_after},
+		)
+		return 'updated'
+
+	return 'ok'
+
+
+def ensure_ttl_index_once():
+	"""Ensure the TTL index once per process; later calls are free."""
+	global _ttl_index_checked
+	if _ttl_index_checked:
+		return
+	with _ttl_index_lock:
+		if _ttl_index_checked:
+			return
+		try:
+			ensure_ttl_index()
+			_ttl_index_checked = True
+		except Exception as e:
+			# Expiry is verified out of band, never fail the status update
+			print(f"Failed to ensure resolved report TTL index: {e}")
+
+
+def retention_report(fix=False, backfill=False):
+	"""
+	Summarise resolved-report expiry using index-backed counts only.
+
+	fix       create or retune the TTL index to match the configured retention
+	backfill  stamp resolved_at on resolved reports that predate the field,
+	          so the TTL index can expire them
+	"""
+	collection = DisasterReport._get_collection()
+	expire_after = ttl_seconds()
+	now = timezone.now()
+
+	index = collection.index_information().get(TTL_INDEX_NAME)
+	index_action = None
+	if fix:
+		index_action = ensure_ttl_index(collection)
+		index = collection.index_information().get(TTL_INDEX_NAME)
+
+	backfilled = 0
+	if backfill:
+		# Single server-side update; resolved_at falls back to the last update time
+		result = collection.update_many(
+			{'status': 'resolved', 'resolved_at': None},
+			[{'$set': {'resolved_at': '$updated_at'}}],
+		)
+		backfilled = result.modified_count
+
+	cutoff = now - timedelta(seconds=expire_after)
+	report = {
+		'retention_minutes': settings.RESOLVED_REPORT_RETENTION_MINUTES,
+		'ttl_grace_minutes': settings.RESOLVED_REPORT_TTL_GRACE_MINUTES,
+		'ttl_index': {
+			'name': TTL_INDEX_NAME,
+			'present': index is not None,
+			'expire_after_seconds': index.get('expireAfterSeconds') if index else None,
+			'in_sync': bool(index) and index.get('expireAfterSeconds') == expire_after,
+			'action': index_action,
+		},
+		'resolved_count': collection.count_documents({'status': 'resolved'}),
+		# Past the retention window but not yet removed by the TTL monitor
+		'pending_expiry': collection.count_documents({
+			'status': 'resolved',
+			'resolved_at': {'$lt': cutoff},
+		}),
+		# Past the window by more than one TTL monitor pass: expiry is not keeping up
+		'overdue': collection.count_documents({
+			'status': 'resolved',
+			'resolved_at': {'$lt': cutoff - TTL_MONITOR_LAG},
+		}),
+		# Never expire because they were resolved before resolved_at existed
+		'missing_resolved_at': collection.count_documents({
+			'status': 'resolved',
+			'resolved_at': None,
+		}),
+		'backfilled': backfilled,
+		'checked_at': now.isoformat(),
+	}
+	report['healthy'] = (
+		report['ttl_index']['in_sync']
+		and report['overdue'] == 0
+		and report['missing_resolved_at'] == 0
+	)
+	return report
@@ -0,0 +1,56 @@
+"""
+Read-preference routing for report reads.
+
+Each read endpoint is mapped to a MongoDB read preference in
+settings.MONGODB_READ_ROUTING. Reads that tolerate staleness (feed,
+summaries) can go to secondaries, bounded by
+MONGODB_MAX_STALENESS_SECONDS; anything not listed uses the 'default'
+entry (primary). Responses to writes are rendered from the saved document
+itself, so read-after-write never depends on a secondary.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from pymongo import ReadPreference
+from pymongo.read_preferences import Nearest, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from .models import DisasterReport
+
+
+READ_PREFERENCE_MODES = {
+	'primaryPreferred': PrimaryPreferred,
+	'secondary': Secondary,
+	'secondaryPreferred': SecondaryPreferred,
+	'nearest': Nearest,
+}
+
+
+def routing_mode(endpoint):
+	"""Return the configured read preference mode name for an endpoint."""
+	routing = settings.MONGODB_READ_ROUTING
+	return routing.get(endpoint, routing.get('default', 'primary'))
+
+
+@lru_cache(maxsize=None)
+def _read_preference(mode, max_staleness):
+	if mode == 'primary':
+		return ReadPreference.PRIMARY
+	try:
+		return READ_PREFERENCE_MODES[mode](max_staleness=max_staleness)
+	except KeyError:
+		raise ValueError(f'Unknown read preference mode {mode!r} in MONGODB_READ_ROUTING')
+
+
+def read_preference_for(endpoint):
+	"""Return the pymongo read preference for an endpoint."""
+	return _read_preference(routing_mode(endpoint), settings.MONGODB_MAX_STALENESS_SECONDS)
+
+
+def reports_for(endpoint):
+	"""Return a DisasterReport queryset routed for an endpoint."""
+	return DisasterReport.objects.read_preference(read_preference_for(endpoint))
+
+
+def collection_for(endpoint):
+	"""Return the raw reports collection routed for an endpoint."""
+	return DisasterReport._get_collection().with_options(read_preference=read_preference_for(endpoint))
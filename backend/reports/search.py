@@ -0,0 +1,98 @@
+"""
+Full-text search over report descriptions.
+
+Matching and ranking are done by MongoDB's text index (see the
+'report_text' index on DisasterReport): results are ordered by text score.
+Type and status filters and the radius bounding box are part of the same
+indexed query; only the exact distance check runs in Python, over the
+coordinates of matching reports. Highlighting runs on the returned page
+only and approximates the index's stemming by stripping common suffixes.
+"""
+import re
+
+from .utils import bounding_box, haversine_distance
+
+
+MAX_QUERY_LENGTH = 200
+
+# Suffixes stripped from query terms before highlighting, longest first
+SUFFIXES = ('ing', 'ed', 'es', 's')
+
+# Negated terms and phrases ("-fire", "\"bridge collapse\"") in $search syntax
+NEGATED_TERM = re.compile(r'(?:^|\s)-(?:"[^"]*"|\S+)')
+WORD = re.compile(r'\w+')
+
+
+def search_terms(query):
+	"""Return the lowercase terms of a $search string, ignoring negated ones."""
+	return [term.lower() for term in WORD.findall(NEGATED_TERM.sub(' ', query))]
+
+
+def stem(term):
+	for suffix in SUFFIXES:
+		if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+			return term[:-len(suffix)]
+	return term
+
+
+def highlight_pattern(terms):
+	"""Match whole words starting with the stem of any term, or None without terms."""
+	stems = sorted({stem(term) for term in terms}, key=len, reverse=True)
+	if not stems:
+		return None
+	return re.compile(r'\b(?:' + '|'.join(re.escape(value) for value in stems) + r')\w*', re.IGNORECASE)
+
+
+def highlight_spans(text, pattern):
+	"""Return [start, end] offsets of the words in text that match the query."""
+	if not text or pattern is None:
+		return []
+	return [[match.start(), match.end()] for match in pattern.finditer(text)]
+
+
+def text_search(queryset, query, types=None, statuses=None, circle=None):
+	"""
+	Build the ranked, filtered text query. With circle=(lat, lng, radius_km)
+	the bounding box is added to the query; use within_radius() for the
+	exact distance.
+	"""
+	reports = queryset.search_text(query).order_by('$text_score')
+	if types:
+		reports = reports(disaster_type__in=types)
+	if statuses:
+		reports = reports(status__in=statuses)
+	if circle:
+		lat_min, lat_max, lng_min, lng_max = bounding_box(*circle)
+		reports = reports(
+			latitude__gte=lat_min, latitude__lte=lat_max,
+			longitude__gte=lng_min, longitude__lte=lng_max,
+		)
+	return reports
+
+
+class RadiusSearchResults:
+	"""
+	Ranked ids of text matches within a radius, sliced like a queryset.
+	Only ids and coordinates of the matches are read up front; each page is
+	loaded by id with the same text query (or page_reports, e.g. the same
+	query with a projection), so it keeps its scores.
+	"""
+
+	def __init__(self, reports, circle, page_reports=None):
+		lat, lng, radius_km = circle
+		self.reports = page_reports if page_reports is not None else reports
+		self.ids = [
+			row['_id']
+			for row in reports.only('id', 'latitude', 'longitude').as_pymongo()
+			if haversine_distance(lat, lng, row['latitude'], row['longitude']) <= radius_km
+		]
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			return self[key:key + 1][0]
+		ids = self.ids[key]
+		loaded = {report.id: report for report in self.reports(id__in=ids)}
+		return [loaded[report_id] for report_id in ids if report_id in loaded]
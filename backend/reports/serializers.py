@@ -1,6 +1,25 @@
+from django.conf import settings
 from rest_framework import serializers
 from mongoengine import Document
-from .models import DisasterReport
+from disaster_response.metrics import time_outbound
+from .fieldsets import COMPAT_ALIASES
+from .geofences import circle_polygon, polygon_ring
+from .models import DisasterReport, GeofenceSubscription
+from .priority import priority_score
+from .search import highlight_spans
+from .utils import validate_reporter_id
+
+
+# Cloudinary upload options shared by the sync and async create paths
+IMAGE_UPLOAD_OPTIONS = {
+	'folder': 'disaster_reports',
+	'resource_type': 'image',
+	'transformation': [
+		{"width": 800, "height": 600, "crop": "limit"},
+		{"quality": "auto"},
+		{"format": "auto"}
+	],
+}
 
 
 class MongoEngineSerializer(serializers.Serializer):
@@ -20,11 +39,17 @@ class MongoEngineSerializer(serializers.Serializer):
 class DisasterReportSerializer(MongoEngineSerializer):
 	"""
 	Serializer for DisasterReport model.
+	context['fields'] limits the output to those fields and context['compat']
+	(default True) renames them to the frontend aliases (see reports/fieldsets.py).
 	"""
 	id = serializers.SerializerMethodField()  # Handle MongoDB ObjectId as string
+	disaster_type = serializers.CharField(read_only=True)
+	description = serializers.CharField(read_only=True)
 	location = serializers.SerializerMethodField()
 	timestamp = serializers.SerializerMethodField()
 	image_url = serializers.SerializerMethodField()
+	status = serializers.CharField(read_only=True)
+	reporter_id = serializers.CharField(read_only=True)
 	
 	class Meta:
 		model = DisasterReport
@@ -40,6 +65,13 @@ class DisasterReportSerializer(MongoEngineSerializer):
 		]
 		read_only_fields = ['id', 'created_at', 'updated_at']
 	
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		requested = self.context.get('fields')
+		if requested is not None:
+			for name in set(self.fields) - set(requested):
+				self.fields.pop(name)
+	
 	def get_location(self, obj):
 		"""Return location as a dictionary."""
 		return obj.location
@@ -61,21 +93,35 @@ class DisasterReportSerializer(MongoEngineSerializer):
 		"""Customize the representation to match frontend expectations."""
 		data = super().to_representation(instance)
 		
-		# Ensure all required fields are present
-		data['description'] = instance.description
-		data['status'] = instance.status
-		data['reporterId'] = instance.reporter_id  # Explicitly add reporter_id
-		
-		# Map disaster_type to type for frontend compatibility
-		data['type'] = instance.disaster_type
-		
-		# Map image_url to imageUrl for frontend compatibility
-		if 'image_url' in data:
-			data['imageUrl'] = data.pop('image_url')
+		# Map disaster_type to type, reporter_id to reporterId and image_url
+		# to imageUrl for frontend compatibility
+		if self.context.get('compat', True):
+			for name, alias in COMPAT_ALIASES.items():
+				if name in data:
+					data[alias] = data.pop(name)
 		
 		return data
 
 
+class ReportSearchResultSerializer(DisasterReportSerializer):
+	"""
+	A report returned by text search, with its relevance score and the
+	[start, end] offsets of matched words in the description.
+	Expects the highlight pattern in context['highlight'].
+	"""
+	score = serializers.SerializerMethodField()
+	highlights = serializers.SerializerMethodField()
+	
+	class Meta(DisasterReportSerializer.Meta):
+		fields = DisasterReportSerializer.Meta.fields + ['score', 'highlights']
+	
+	def get_score(self, obj):
+		return round(obj.get_text_score(), 4)
+	
+	def get_highlights(self, obj):
+		return highlight_spans(obj.description, self.context.get('highlight'))
+
+
 class CreateDisasterReportSerializer(MongoEngineSerializer):
 	"""
 	Serializer for creating new disaster reports.
@@ -129,22 +175,18 @@ class CreateDisasterReportSerializer(MongoEngineSerializer):
 			try:
 				# Upload to Cloudinary
 				import cloudinary.uploader
-				upload_result = cloudinary.uploader.upload(
-					image_file,
-					folder="disaster_reports",
-					resource_type="image",
-					transformation=[
-						{"width": 800, "height": 600, "crop": "limit"},
-						{"quality": "auto"},
-						{"format": "auto"}
-					]
-				)
+				with time_outbound('image-upload'):
+					upload_result = cloudinary.uploader.upload(image_file, **IMAGE_UPLOAD_OPTIONS)
 				image_url = upload_result['secure_url']
 			except Exception as e:
 				print(f"Cloudinary upload failed: {e}")
 				# Fallback to placeholder if upload fails
 				image_url = f"upload_failed_{image_file.name}"
 		
+		return self.build_report(validated_data, image_url).save()
+	
+	def build_report(self, validated_data, image_url=None):
+		"""Build an unsaved report from validated data and an uploaded image URL."""
 		# Use provided timestamp or current time
 		from django.utils import timezone
 		from datetime import datetime
@@ -187,7 +229,7 @@ class CreateDisasterReportSerializer(MongoEngineSerializer):
 			created_at=created_at
 		)
 		
-		return report.save()
+		return report
 
 
 class UpdateReportStatusSerializer(MongoEngineSerializer):
@@ -207,13 +249,155 @@ class UpdateReportStatusSerializer(MongoEngineSerializer):
 			raise serializers.ValidationError(f'Invalid status. Must be one of: {", ".join(valid_statuses)}')
 		return value
 	
+	def status_changes(self, instance, new_status):
+		"""Return the field values for moving instance to new_status."""
+		from django.utils import timezone
+		
+		changes = {'status': new_status}
+		
+		# resolved_at drives the TTL index that expires resolved reports
+		if new_status == 'resolved' and instance.status != 'resolved':
+			changes['resolved_at'] = timezone.now()
+		elif new_status != 'resolved':
+			changes['resolved_at'] = None
+		
+		# The feed ranking follows the status; the density is unchanged
+		if instance.created_at is not None:
+			changes['priority'] = priority_score(
+				instance.disaster_type, new_status, instance.created_at, instance.priority_density
+			)
+		
+		return changes
+	
 	def update(self, instance, validated_data):
 		"""Update the instance with validated data."""
-		instance.status = validated_data.get('status', instance.status)
+		from .retention import ensure_ttl_index_once
+		
+		changes = self.status_changes(instance, validated_data.get('status', instance.status))
+		if changes.get('resolved_at'):
+			ensure_ttl_index_once()
+		
+		for attr, value in changes.items():
+			setattr(instance, attr, value)
 		instance.save()
 		return instance
 
 
+class ArchivedReportSerializer(serializers.Serializer):
+	"""
+	Serializer for archived reports decoded from columnar archive segments.
+	"""
+	id = serializers.CharField()
+	disaster_type = serializers.CharField()
+	description = serializers.CharField()
+	location = serializers.SerializerMethodField()
+	timestamp = serializers.DateTimeField(source='created_at')
+	resolved_at = serializers.DateTimeField()
+	status = serializers.CharField()
+	reporter_id = serializers.CharField(allow_null=True)
+	image_url = serializers.CharField(source='image', allow_null=True)
+	
+	def get_location(self, obj):
+		"""Return location as a dictionary."""
+		return {'lat': obj['latitude'], 'lng': obj['longitude']}
+	
+	def to_representation(self, instance):
+		"""Match the live report representation for frontend compatibility."""
+		data = super().to_representation(instance)
+		data['type'] = data['disaster_type']
+		data['reporterId'] = data['reporter_id']
+		data['imageUrl'] = data.pop('image_url')
+		return data
+
+
+class GeofenceSubscriptionSerializer(MongoEngineSerializer):
+	"""
+	Serializer for geofence subscriptions: a circle (lat, lng, radius_km) or
+	a polygon of [lng, lat] vertices, optionally limited to some types.
+	"""
+	id = serializers.CharField(read_only=True)
+	subscriber_id = serializers.CharField(max_length=100)
+	lat = serializers.FloatField(min_value=-90, max_value=90, required=False, write_only=True)
+	lng = serializers.FloatField(min_value=-180, max_value=180, required=False, write_only=True)
+	radius_km = serializers.FloatField(min_value=0.01, required=False)
+	polygon = serializers.ListField(
+		child=serializers.ListField(child=serializers.FloatField(), min_length=2, max_length=2),
+		min_length=3,
+		required=False,
+		write_only=True,
+	)
+	types = serializers.ListField(
+		child=serializers.ChoiceField(choices=DisasterReport.DISASTER_TYPE_CHOICES),
+		required=False,
+	)
+	created_at = serializers.DateTimeField(read_only=True)
+	
+	class Meta:
+		model = GeofenceSubscription
+	
+	def validate_subscriber_id(self, value):
+		if not validate_reporter_id(value):
+			raise serializers.ValidationError('Invalid subscriber ID.')
+		return value
+	
+	def validate_radius_km(self, value):
+		if value > settings.GEOFENCE_MAX_RADIUS_KM:
+			raise serializers.ValidationError(f'Radius cannot exceed {settings.GEOFENCE_MAX_RADIUS_KM} km.')
+		return value
+	
+	def validate_polygon(self, value):
+		if len(value) > settings.GEOFENCE_MAX_VERTICES:
+			raise serializers.ValidationError(f'A polygon can have at most {settings.GEOFENCE_MAX_VERTICES} vertices.')
+		for lng, lat in value:
+			if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+				raise serializers.ValidationError('Vertices must be [lng, lat] pairs.')
+		return value
+	
+	def validate(self, attrs):
+		circle = [name for name in ('lat', 'lng', 'radius_km') if name in attrs]
+		if 'polygon' in attrs and circle:
+			raise serializers.ValidationError('Give either lat, lng and radius_km or a polygon, not both.')
+		if 'polygon' not in attrs and len(circle) < 3:
+			raise serializers.ValidationError('Give lat, lng and radius_km, or a polygon.')
+		return attrs
+	
+	def create(self, validated_data):
+		polygon = validated_data.pop('polygon', None)
+		if polygon is not None:
+			validated_data['area'] = polygon_ring(polygon)
+		else:
+			lat, lng = validated_data.pop('lat'), validated_data.pop('lng')
+			validated_data['center'] = [lng, lat]
+			validated_data['area'] = circle_polygon(lat, lng, validated_data['radius_km'])
+		return super().create(validated_data)
+	
+	def to_representation(self, instance):
+		data = super().to_representation(instance)
+		if instance.radius_km is not None:
+			data['center'] = {'lat': instance.center[1], 'lng': instance.center[0]}
+		else:
+			data['polygon'] = instance.area['coordinates'][0] if isinstance(instance.area, dict) else instance.area[0]
+		return data
+
+
+class GeofenceAlertSerializer(serializers.Serializer):
+	"""
+	Serializer for alerts in a geofence inbox, shaped like the live reports.
+	"""
+	id = serializers.CharField()
+	subscription = serializers.CharField()
+	report = serializers.CharField()
+	type = serializers.CharField(source='disaster_type')
+	description = serializers.CharField()
+	location = serializers.SerializerMethodField()
+	timestamp = serializers.DateTimeField(source='reported_at')
+	distance_km = serializers.FloatField(allow_null=True)
+	created_at = serializers.DateTimeField()
+	
+	def get_location(self, obj):
+		return {'lat': obj.latitude, 'lng': obj.longitude}
+
+
 class AISummarySerializer(serializers.Serializer):
 	"""
 	Serializer for AI summary response.
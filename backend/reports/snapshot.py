@@ -0,0 +1,513 @@
+"""
+Memory-mapped columnar snapshot of the live reports collection.
+
+Every gunicorn worker maps the same snapshot file read-only, so the
+feed, nearby and summary reads share one copy of the data instead of
+each worker keeping (and warming) its own cache.
+
+File layout (little-endian, 8-byte aligned columns):
+
+	header        magic, row count, heap size, built_at (ms since epoch)
+	created_at    int64[count]   ms since epoch, sorted newest first
+	latitude      float64[count]
+	longitude     float64[count]
+	ids           12 bytes[count] raw ObjectId bytes
+	desc_offsets  uint32[count + 1] offsets into the description heap
+	types         uint8[count]   index into DisasterReport.DISASTER_TYPE_CHOICES
+	statuses      uint8[count]   index into DisasterReport.STATUS_CHOICES
+	priority      float64[count] feed ranking score (see reports/priority.py)
+	by_priority   uint32[count]  row indices, highest priority first
+	heap          utf-8 short descriptions
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import Counter
+
+from bson import ObjectId
+from django.conf import settings
+
+from disaster_response.metrics import cache_lookup, set_queue_depth
+from .columnar import StringColumn, from_millis, pack, read_string, to_millis, view_columns, write_atomic
+from .models import DisasterReport
+from .priority import row_priority
+from .utils import haversine_distance
+
+
+MAGIC = b'DRSNAP03'
+HEADER = struct.Struct('<8sIIq')
+UNKNOWN_CODE = 255
+SHORT_DESCRIPTION_CHARS = 160
+
+TYPE_CODES = [choice[0] for choice in DisasterReport.DISASTER_TYPE_CHOICES]
+STATUS_CODES = [choice[0] for choice in DisasterReport.STATUS_CHOICES]
+
+# How often a reader re-stats the file to pick up a rebuilt snapshot
+STAT_INTERVAL = 0.5
+
+# How often the idle rebuild thread reports that it is alive
+HEARTBEAT_INTERVAL = 30
+
+
+def choice_code(choices, value):
+	"""Encode a choice value as its uint8 position in choices."""
+	try:
+		return choices.index(value)
+	except ValueError:
+		return UNKNOWN_CODE
+
+
+def choice_value(choices, code):
+	"""Decode a uint8 choice code back to its value."""
+	return choices[code] if code < len(choices) else None
+
+
+def encode_snapshot(rows, built_at=None):
+	"""
+	Encode report rows into the snapshot binary layout.
+	Rows must already be sorted by created_at, newest first.
+	"""
+	created_at = array('q')
+	latitude = array('d')
+	longitude = array('d')
+	ids = bytearray()
+	types = bytearray()
+	statuses = bytearray()
+	priority = array('d')
+	heap = bytearray()
+	descriptions = StringColumn(heap, max_chars=SHORT_DESCRIPTION_CHARS)
+
+	for row in rows:
+		created_at.append(to_millis(row.get('created_at')))
+		latitude.append(row.get('latitude') or 0.0)
+		longitude.append(row.get('longitude') or 0.0)
+		ids += ObjectId(row['_id']).binary
+		descriptions.append(row.get('description'))
+		types.append(choice_code(TYPE_CODES, row.get('disaster_type')))
+		statuses.append(choice_code(STATUS_CODES, row.get('status')))
+		score = row.get('priority')
+		priority.append(score if score is not None else row_priority(row))
+
+	# Stable, so equal scores stay newest first
+	by_priority = array('I', sorted(range(len(priority)), key=priority.__getitem__, reverse=True))
+
+	if built_at is None:
+		built_at = int(time.time() * 1000)
+
+	header = HEADER.pack(MAGIC, len(created_at), len(heap), built_at)
+	columns = (created_at, latitude, longitude, ids, descriptions.offsets, types, statuses, priority, by_priority)
+	return pack(header, columns, heap)
+
+
+class ReportSnapshot:
+	"""
+	Read-only, zero-copy view over a mapped snapshot file.
+	Columns are memoryviews straight into the shared page cache.
+	"""
+
+	def __init__(self, path):
+		fd = os.open(path, os.O_RDONLY)
+		try:
+			self.stat = os.fstat(fd)
+			self._mmap = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+		finally:
+			os.close(fd)
+
+		buf = memoryview(self._mmap)
+		magic, count, heap_size, built_at = HEADER.unpack_from(buf, 0)
+		if magic != MAGIC:
+			raise ValueError(f'Not a report snapshot: {path}')
+
+		self.count = count
+		self.built_at = built_at
+
+		columns, offset = view_columns(buf, HEADER.size, [
+			('created_at', 'q', 8 * count),
+			('latitude', 'd', 8 * count),
+			('longitude', 'd', 8 * count),
+			('ids', 'B', 12 * count),
+			('desc_offsets', 'I', 4 * (count + 1)),
+			('types', 'B', count),
+			('statuses', 'B', count),
+			('priority', 'd', 8 * count),
+			('by_priority', 'I', 4 * count),
+		])
+
+		self.created_at = columns['created_at']
+		self.latitude = columns['latitude']
+		self.longitude = columns['longitude']
+		self.ids = columns['ids']
+		self.desc_offsets = columns['desc_offsets']
+		self.types = columns['types']
+		self.statuses = columns['statuses']
+		self.priority = columns['priority']
+		self.by_priority = columns['by_priority']
+		self.heap = buf[offset:offset + heap_size]
+
+	def __len__(self):
+		return self.count
+
+	@property
+	def age(self):
+		"""Seconds since the snapshot was built."""
+		return time.time() - self.built_at / 1000
+
+	def id_at(self, index):
+		return ObjectId(bytes(self.ids[index * 12:index * 12 + 12]))
+
+	def type_at(self, index):
+		return choice_value(TYPE_CODES, self.types[index])
+
+	def status_at(self, index):
+		return choice_value(STATUS_CODES, self.statuses[index])
+
+	def description_at(self, index):
+		return read_string(self.heap, self.desc_offsets, index)
+
+	def created_at_at(self, index):
+		return from_millis(self.created_at[index])
+
+	def within_radius(self, lat, lng, radius_km, start=0, stop=None):
+		"""Return row indices within radius_km of (lat, lng), newest first."""
+		# Cheap bounding-box rejection before the haversine
+		lat_delta = radius_km / 111.0
+		lat_min, lat_max = lat - lat_delta, lat + lat_delta
+		latitude, longitude = self.latitude, self.longitude
+
+		matches = []
+		for index in range(start, self.count if stop is None else stop):
+			report_lat = latitude[index]
+			if report_lat < lat_min or report_lat > lat_max:
+				continue
+			if haversine_distance(lat, lng, report_lat, longitude[index]) <= radius_km:
+				matches.append(index)
+		return matches
+
+	def within_box(self, bbox, rows):
+		"""Return the rows inside bbox = (min_lng, min_lat, max_lng, max_lat), in order."""
+		min_lng, min_lat, max_lng, max_lat = bbox
+		latitude, longitude = self.latitude, self.longitude
+		return [
+			index for index in rows
+			if min_lat <= latitude[index] <= max_lat and min_lng <= longitude[index] <= max_lng
+		]
+
+	def created_since(self, cutoff):
+		"""Return the number of leading rows created at or after cutoff."""
+		return self._created_since_ms(to_millis(cutoff))
+
+	def _created_since_ms(self, cutoff_ms):
+		created_at = self.created_at
+		# Rows are sorted newest first, so binary search for the boundary
+		low, high = 0, self.count
+		while low < high:
+			middle = (low + high) // 2
+			if created_at[middle] >= cutoff_ms:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def rows_between(self, since=None, until=None):
+		"""Return the (start, stop) row range created within [since, until]."""
+		start = self._created_since_ms(to_millis(until) + 1) if until is not None else 0
+		stop = self.created_since(since) if since is not None else self.count
+		return start, max(start, stop)
+
+	def ranked(self, rows):
+		"""Return rows highest priority first; all rows come precomputed in that order."""
+		if len(rows) == self.count:
+			return self.by_priority
+		return sorted(rows, key=self.priority.__getitem__, reverse=True)
+
+	def filter(self, types=(), statuses=(), since=None, until=None, circle=None, bbox=None, sort='newest'):
+		"""
+		Return (indices, type counts, status counts) for the feed filters, newest
+		first or, with sort='priority', highest priority first. Type counts
+		ignore the type filter and status counts the status filter, so each
+		shows what selecting another value would match.
+		"""
+		rows, type_counts, status_counts = self._filter(types, statuses, since, until, circle, bbox)
+		if sort == 'priority':
+			rows = self.ranked(rows)
+		return rows, type_counts, status_counts
+
+	def _filter(self, types, statuses, since, until, circle, bbox):
+		start, stop = self.rows_between(since, until)
+		type_codes = {choice_code(TYPE_CODES, value) for value in types}
+		status_codes = {choice_code(STATUS_CODES, value) for value in statuses}
+
+		if circle is None and bbox is None and not type_codes and not status_codes:
+			# Counting whole byte ranges needs no per-row loop
+			return range(start, stop), self.count_by_type(stop, start), self.count_by_status(stop, start)
+
+		rows = self.within_radius(*circle, start=start, stop=stop) if circle else range(start, stop)
+		if bbox:
+			rows = self.within_box(bbox, rows)
+		row_types, row_statuses = self.types, self.statuses
+		pairs = Counter((row_types[index], row_statuses[index]) for index in rows)
+
+		type_counts, status_counts = Counter(), Counter()
+		for (type_code, status_code), count in pairs.items():
+			if not status_codes or status_code in status_codes:
+				type_counts[choice_value(TYPE_CODES, type_code)] += count
+			if not type_codes or type_code in type_codes:
+				status_counts[choice_value(STATUS_CODES, status_code)] += count
+
+		if type_codes or status_codes:
+			rows = [
+				index for index in rows
+				if (not type_codes or row_types[index] in type_codes)
+				and (not status_codes or row_statuses[index] in status_codes)
+			]
+		return rows, type_counts, status_counts
+
+	def count_by_type(self, stop=None, start=0):
+		"""Count rows per disaster type, optionally only rows [start, stop)."""
+		codes = self.types[start:stop].tobytes()
+		return {name: codes.count(bytes([code])) for code, name in enumerate(TYPE_CODES)}
+
+	def count_by_status(self, stop=None, start=0):
+		"""Count rows per status, optionally only rows [start, stop)."""
+		codes = self.statuses[start:stop].tobytes()
+		return {name: codes.count(bytes([code])) for code, name in enumerate(STATUS_CODES)}
+
+
+class SnapshotResults:
+	"""
+	Lazy, paginator-friendly sequence over snapshot rows.
+	Only the requested slice is loaded from MongoDB, in one $in query,
+	through `queryset` (e.g. one routed to a secondary). `facets` carries
+	any counts computed alongside the rows.
+	"""
+
+	def __init__(self, snapshot, indices=None, queryset=None, facets=None):
+		self.snapshot = snapshot
+		self.indices = indices
+		self.queryset = queryset if queryset is not None else DisasterReport.objects
+		self.facets = facets
+
+	def __len__(self):
+		return len(self.indices) if self.indices is not None else len(self.snapshot)
+
+	def _ids(self, key):
+		if self.indices is not None:
+			positions = self.indices[key]
+		else:
+			positions = range(len(self.snapshot))[key]
+		return [self.snapshot.id_at(position) for position in positions]
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			return self[key:key + 1][0]
+		ids = self._ids(key)
+		if not ids:
+			return []
+		reports = {report.id: report for report in self.queryset(id__in=ids)}
+		# Preserve snapshot order and skip rows deleted since the build
+		return [reports[report_id] for report_id in ids if report_id in reports]
+
+
+def snapshot_rows():
+	"""Fetch the projected report rows that make up a snapshot."""
+	return (
+		DisasterReport.objects
+		.only(
+			'id', 'disaster_type', 'status', 'latitude', 'longitude', 'created_at', 'description',
+			'priority', 'priority_density',
+		)
+		.order_by('-created_at')
+		.as_pymongo()
+	)
+
+
+def snapshot_built_at(path):
+	"""Return the built_at (ms since epoch) of the snapshot file at path, or None."""
+	try:
+		with open(path, 'rb') as snapshot_file:
+			magic, _, _, built_at = HEADER.unpack(snapshot_file.read(HEADER.size))
+	except (OSError, struct.error):
+		return None
+	return built_at if magic == MAGIC else None
+
+
+def build_snapshot(path=None, unless_built_after=None):
+	"""
+	Rebuild the snapshot file from MongoDB and atomically swap it in.
+	Readers that still map the old file keep a valid view until they re-stat.
+
+	With unless_built_after (seconds since the epoch), the rebuild is skipped
+	when the file was built from a scan started at or after that time, e.g.
+	by another worker while this one waited for the lock. Returns the bytes
+	written, or None when skipped.
+	"""
+	path = path or settings.REPORT_SNAPSHOT_PATH
+	os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+	with open(f'{path}.lock', 'w') as lock_file:
+		# Serialise rebuilds across workers; waiters usually find the work done
+		fcntl.flock(lock_file, fcntl.LOCK_EX)
+		try:
+			if unless_built_after is not None:
+				built_at = snapshot_built_at(path)
+				if built_at is not None and built_at >= unless_built_after * 1000:
+					return None
+			# Stamped with the start of the scan: the file holds every write before it
+			built_at = int(time.time() * 1000)
+			data = encode_snapshot(snapshot_rows(), built_at=built_at)
+			write_atomic(path, data)
+		finally:
+			fcntl.flock(lock_file, fcntl.LOCK_UN)
+	return len(data)
+
+
+class SnapshotManager:
+	"""
+	Per-process handle on the shared snapshot.
+	Remaps when another worker swaps the file and rebuilds in a background
+	thread, unless another worker already built a snapshot that will do.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._snapshot = None
+		self._checked_at = 0.0
+		self._rebuild_event = threading.Event()
+		self._changed_at = None
+		self._thread = None
+		self.last_error = None
+		self.last_rebuild_at = None
+		self.heartbeat_at = None
+
+	@property
+	def path(self):
+		return settings.REPORT_SNAPSHOT_PATH
+
+	def get(self):
+		"""Return the current snapshot, or None when it is unavailable."""
+		if not settings.REPORT_SNAPSHOT_ENABLED:
+			return None
+
+		now = time.monotonic()
+		if now - self._checked_at >= STAT_INTERVAL:
+			with self._lock:
+				self._checked_at = now
+				self._refresh()
+
+		snapshot = self._snapshot
+		cache_lookup('report_snapshot', snapshot is not None)
+		if snapshot is None or snapshot.age > settings.REPORT_SNAPSHOT_MAX_AGE:
+			# Catches writes we never saw, e.g. TTL expiry or other processes
+			self.request_rebuild(stale=True)
+		return snapshot
+
+	def _refresh(self):
+		try:
+			stat = os.stat(self.path)
+		except FileNotFoundError:
+			self._snapshot = None
+			return
+
+		current = self._snapshot
+		if current is not None and (current.stat.st_ino, current.stat.st_mtime_ns) == (stat.st_ino, stat.st_mtime_ns):
+			return
+		try:
+			self._snapshot = ReportSnapshot(self.path)
+		except (OSError, ValueError) as e:
+			print(f"Failed to map report snapshot: {e}")
+			self._snapshot = None
+
+	def request_rebuild(self, stale=False):
+		"""
+		Ask the background thread to rebuild; calls are coalesced. A write
+		needs a snapshot scanned after it; stale=True only needs one younger
+		than REPORT_SNAPSHOT_MAX_AGE, which another worker may already have built.
+		"""
+		if not settings.REPORT_SNAPSHOT_ENABLED:
+			return
+		if not stale:
+			self._changed_at = time.time()
+		self._rebuild_event.set()
+		set_queue_depth('report_snapshot_rebuild', 1)
+		if self._thread is None or not self._thread.is_alive():
+			with self._lock:
+				if self._thread is None or not self._thread.is_alive():
+					self._thread = threading.Thread(
+						target=self._run, name='report-snapshot-rebuilder', daemon=True
+					)
+					self._thread.start()
+
+	def rebuild(self, unless_built_after=None):
+		"""Rebuild synchronously (see build_snapshot) and remap."""
+		try:
+			if build_snapshot(self.path, unless_built_after) is not None:
+				self.last_rebuild_at = time.time()
+			self.last_error = None
+		except Exception as e:
+			self.last_error = str(e)
+			print(f"Report snapshot rebuild failed: {e}")
+		with self._lock:
+			self._checked_at = time.monotonic()
+			self._refresh()
+
+	def _run(self):
+		while True:
+			self.heartbeat_at = time.time()
+			# Wake up periodically so the heartbeat shows the thread is alive
+			if not self._rebuild_event.wait(timeout=HEARTBEAT_INTERVAL):
+				continue
+			# Debounce bursts of writes into a single rebuild
+			time.sleep(0.2)
+			self._rebuild_event.clear()
+			changed_at, self._changed_at = self._changed_at, None
+			set_queue_depth('report_snapshot_rebuild', 0)
+			# Every worker notices staleness at once; one scan serves them all
+			if changed_at is None:
+				changed_at = time.time() - settings.REPORT_SNAPSHOT_MAX_AGE
+			self.rebuild(unless_built_after=changed_at)
+			if self.last_error:
+				# Back off so an unreachable database doesn't spin this thread
+				time.sleep(5)
+
+	def status(self):
+		"""Describe the mapped snapshot and the rebuild thread for health checks."""
+		snapshot = self._snapshot
+		thread = self._thread
+		if thread is None:
+			worker_state = 'idle'
+		elif thread.is_alive():
+			worker_state = 'running'
+		else:
+			worker_state = 'dead'
+		return {
+			'enabled': settings.REPORT_SNAPSHOT_ENABLED,
+			'mapped': snapshot is not None,
+			'rows': len(snapshot) if snapshot is not None else None,
+			'age_seconds': round(snapshot.age, 3) if snapshot is not None else None,
+			'stale': snapshot is not None and snapshot.age > settings.REPORT_SNAPSHOT_MAX_AGE,
+			'last_rebuild_at': self.last_rebuild_at,
+			'last_error': self.last_error,
+			'worker': {
+				'name': 'report-snapshot-rebuilder',
+				'state': worker_state,
+				'heartbeat_at': self.heartbeat_at,
+				'rebuild_pending': self._rebuild_event.is_set(),
+			},
+		}
+
+
+snapshot_manager = SnapshotManager()
+
+
+def get_snapshot():
+	"""Return the shared report snapshot for this process, or None."""
+	return snapshot_manager.get()
+
+
+def reports_changed():
+	"""Signal that reports were written so the snapshot gets rebuilt."""
+	snapshot_manager.request_rebuild()
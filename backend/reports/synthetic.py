@@ -0,0 +1,207 @@
+"""
+Synthetic report datasets for benchmarks, load tests and seeding.
+
+Reports cluster around cities (weighted by size, with a per-city spread)
+and are skewed towards the recent past, with a daytime peak, the way real
+incident reports arrive. Older reports are more likely to be resolved.
+Generation is deterministic for a given seed, and batches are generated
+independently (see batch_seed) so they can be produced in parallel.
+"""
+import math
+import multiprocessing
+import random
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .geohash import encode
+from .models import GEOHASH_PRECISION
+from .priority import priority_score
+
+
+# (name, latitude, longitude, relative weight, spread in km)
+CITIES = [
+	('Lagos', 6.5244, 3.3792, 30, 12),
+	('Abuja', 9.0765, 7.3986, 10, 8),
+	('Kano', 12.0022, 8.5920, 8, 7),
+	('Ibadan', 7.3775, 3.9470, 8, 9),
+	('Port Harcourt', 4.8156, 7.0498, 7, 7),
+	('Accra', 5.6037, -0.1870, 9, 10),
+	('Nairobi', -1.2921, 36.8219, 9, 10),
+	('Cairo', 30.0444, 31.2357, 12, 15),
+	('Johannesburg', -26.2041, 28.0473, 7, 12),
+	('London', 51.5074, -0.1278, 6, 14),
+]
+
+DESCRIPTIONS = {
+	'flood': [
+		'Heavy rainfall causing severe flooding in residential area. Water level rising rapidly.',
+		'River overflow affecting multiple neighborhoods. Emergency evacuation in progress.',
+		'Flash flood reported in downtown area. Several vehicles stranded.',
+		'Damaged drainage system causing water accumulation on main street.',
+	],
+	'fire': [
+		'Building fire reported in commercial district. Smoke visible from several blocks away.',
+		'Vehicle fire on highway causing traffic disruption.',
+		'Electrical fire in residential building. Residents evacuated safely.',
+		'Wildfire spreading near forest area. Fire department responding.',
+	],
+	'accident': [
+		'Multi-vehicle collision on major highway. Emergency services on scene.',
+		'Pedestrian accident reported near school zone.',
+		'Motorcycle accident at busy intersection. Traffic backed up.',
+		'Construction vehicle accident on work site.',
+	],
+	'collapse': [
+		'Building collapse reported in residential area. Search and rescue in progress.',
+		'Bridge collapse affecting traffic flow. Alternative routes recommended.',
+		'Wall collapse at construction site. No injuries reported.',
+		'Roof collapse due to structural damage. Building evacuated.',
+	],
+}
+
+TYPE_WEIGHTS = {'flood': 35, 'fire': 25, 'accident': 30, 'collapse': 10}
+
+SPATIAL_DISTRIBUTIONS = ('cities', 'uniform')
+TEMPORAL_DISTRIBUTIONS = ('skewed', 'uniform')
+
+
+def batch_seed(seed, batch_index):
+	"""Derive an independent, reproducible seed for one batch."""
+	return seed * 1_000_003 + batch_index
+
+
+def random_location(rng, spatial):
+	if spatial == 'uniform':
+		# Uniform over the area covered by the cities
+		return rng.uniform(-35.0, 55.0), rng.uniform(-20.0, 40.0)
+
+	_, lat, lng, _, spread_km = rng.choices(CITIES, weights=[city[3] for city in CITIES])[0]
+	lat_sigma = spread_km / 111.0
+	lng_sigma = spread_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+	return (
+		max(-90.0, min(90.0, rng.gauss(lat, lat_sigma))),
+		max(-180.0, min(180.0, rng.gauss(lng, lng_sigma))),
+	)
+
+
+def random_age(rng, temporal, days):
+	"""Return how long ago a report was created."""
+	if temporal == 'uniform':
+		return timedelta(seconds=rng.uniform(0, days * 86400))
+
+	# Exponential recency (a fifth of the window on average), truncated to the window
+	age_days = min(rng.expovariate(5.0 / days), days)
+	age = timedelta(days=age_days)
+	# Shift towards a daytime peak around 14:00 without leaving the window
+	hour_shift = rng.gauss(0, 3)
+	return max(timedelta(0), min(age + timedelta(hours=hour_shift), timedelta(days=days)))
+
+
+def random_status(rng, age, days):
+	"""Older reports are more likely to have been resolved."""
+	resolved_probability = min(0.9, 0.1 + 0.8 * age.total_seconds() / (days * 86400))
+	roll = rng.random()
+	if roll < resolved_probability:
+		return 'resolved'
+	return 'investigating' if roll < resolved_probability + 0.25 else 'active'
+
+
+def generate_reports(count, seed=0, now=None, days=30, spatial='cities', temporal='skewed', reporters=5000):
+	"""
+	Yield `count` raw report documents (MongoDB field names) ready for insert_many.
+	"""
+	if spatial not in SPATIAL_DISTRIBUTIONS:
+		raise ValueError(f'Unknown spatial distribution {spatial!r}')
+	if temporal not in TEMPORAL_DISTRIBUTIONS:
+		raise ValueError(f'Unknown temporal distribution {temporal!r}')
+
+	rng = random.Random(seed)
+	now = now or timezone.now()
+	types = list(TYPE_WEIGHTS)
+	type_weights = list(TYPE_WEIGHTS.values())
+
+	for _ in range(count):
+		disaster_type = rng.choices(types, weights=type_weights)[0]
+		latitude, longitude = random_location(rng, spatial)
+		age = random_age(rng, temporal, days)
+		created_at = now - age
+		status = random_status(rng, age, days)
+		updated_at = created_at + (now - created_at) * rng.random() if status != 'active' else created_at
+
+		yield {
+			'disaster_type': disaster_type,
+			'description': rng.choice(DESCRIPTIONS[disaster_type]),
+			'latitude': latitude,
+			'longitude': longitude,
+			'geohash': encode(latitude, longitude, GEOHASH_PRECISION),
+			'status': status,
+			'image': None,
+			# Zipf-like: a few reporters file most reports
+			'reporter_id': f'reporter_{int(reporters ** rng.random()):06d}',
+			'created_at': created_at,
+			'updated_at': updated_at,
+			'resolved_at': updated_at if status == 'resolved' else None,
+			# Density is counted by refresh_priorities once the dataset is in place
+			'priority': priority_score(disaster_type, status, created_at),
+			'priority_density': 0,
+		}
+
+
+def seed_collection(collection, count, seed=0, batch_size=5000, **options):
+	"""
+	Insert a synthetic dataset in unordered batches; returns the number inserted.
+	Each batch uses its own derived seed, so a given (seed, batch_size) always
+	produces the same data.
+	"""
+	now = options.pop('now', None) or timezone.now()
+	inserted = 0
+	for batch_index, start in enumerate(range(0, count, batch_size)):
+		size = min(batch_size, count - start)
+		documents = list(generate_reports(size, seed=batch_seed(seed, batch_index), now=now, **options))
+		inserted += len(collection.insert_many(documents, ordered=False).inserted_ids)
+	return inserted
+
+
+# Per-process collection used by pool workers (see seed_parallel)
+_worker_collection = None
+
+
+def _init_worker():
+	"""Open a fresh client in each pool process; clients must not cross processes."""
+	global _worker_collection
+	import django
+	from django.apps import apps
+	if not apps.ready:
+		django.setup()
+
+	from django.conf import settings
+	from pymongo import MongoClient
+	from disaster_response.mongodb import connection_options
+	from .models import DisasterReport
+
+	client = MongoClient(settings.MONGODB_URI, **connection_options())
+	_worker_collection = client[settings.MONGODB_NAME][DisasterReport._get_collection_name()]
+
+
+def _insert_batch(task):
+	seed, batch_index, size, options = task
+	documents = list(generate_reports(size, seed=batch_seed(seed, batch_index), **options))
+	return len(_worker_collection.insert_many(documents, ordered=False).inserted_ids)
+
+
+def seed_parallel(count, seed=0, batch_size=5000, workers=None, **options):
+	"""
+	Insert a synthetic dataset from a pool of worker processes, yielding the
+	number inserted as each batch completes. Batches are derived exactly as in
+	seed_collection, so the data matches a serial run with the same batch_size.
+	"""
+	options['now'] = options.get('now') or timezone.now()
+	tasks = [
+		(seed, batch_index, min(batch_size, count - start), options)
+		for batch_index, start in enumerate(range(0, count, batch_size))
+	]
+	# spawn rather than fork: the parent's MongoClient threads do not survive a fork
+	context = multiprocessing.get_context('spawn')
+	with context.Pool(workers, initializer=_init_worker) as pool:
+		yield from pool.imap_unordered(_insert_batch, tasks)
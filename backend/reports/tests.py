@@ -1,3 +1,1251 @@
-from django.test import TestCase
+"""
+Tests for the reports app.
 
-# Create your tests here.
+Unit tests cover the pure logic behind the feed (snapshot encoding and
+filtering, columnar files, archive segments, geohash regions, sparse fieldsets, feed
+filters, priority scores, geofence alerts and the event log) and run
+without MongoDB:
+
+	python manage.py test reports
+
+The query and latency budgets hold every endpoint to the most MongoDB
+commands it may issue, the most documents the server may examine for it
+(read from the database profiler) and a median latency ceiling, measured
+on a fixed seeded dataset. A change that adds a query per row or falls
+back to a collection scan exceeds its budget, and the failure shows a diff
+between the commands the endpoint is expected to issue and the ones it
+actually issued.
+
+Endpoints are measured twice: served from the report snapshot (the
+production configuration) and straight from MongoDB (the fallback when
+the snapshot is disabled or unavailable).
+
+The budget tests, the priority refresh test and the projection rebuild
+test need a real mongod and are skipped unless MONGODB_TEST_URI is set;
+they use and then drop their own databases:
+
+	MONGODB_TEST_URI=mongodb://localhost:27017 python manage.py test reports
+
+Set REPORT_BUDGET_VERBOSE=1 to print the measurements, e.g. to tighten a
+budget, and REPORT_BUDGET_LATENCY_SCALE to scale the latency ceilings on
+slow machines.
+"""
+import difflib
+import math
+import os
+import random
+import statistics
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from array import array
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import mongoengine
+from bson import ObjectId
+from django.conf import settings
+from django.http import QueryDict
+from django.test import Client, SimpleTestCase, override_settings
+from django.utils import timezone
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
+from pymongo import monitoring
+
+from disaster_response.mongodb import connection_options
+from .archive import (
+	ArchiveSegment, ArchiveSegmentWriter, compact_pending_segments, compact_segment, iter_segment,
+	publish_partial_segments,
+)
+from .columnar import StringColumn, from_millis, pack, read_string, to_millis, view_columns, write_atomic
+from .events import append_events, contiguous, event_data, head_sequence, numbered
+from .facets import FEED_SORTS, facet_pipeline, parse_facet_filters, parse_sort
+from .fieldsets import Fieldset, mongo_projection, parse_fieldset
+from .geofences import ALERT_DESCRIPTION_CHARS, CIRCLE_SIDES, alert_documents, circle_polygon, destination
+from .geohash import bounds, encode
+from .indexes import ensure_indexes
+from .models import GEOHASH_PRECISION, DisasterReport, JobCheckpoint, ReportEvent
+from .priority import (
+	DENSITY_WEIGHT, STATUS_WEIGHTS, TYPE_WEIGHTS, DensityGrid, priority_score, priority_updates,
+	refresh_priorities, row_priority,
+)
+from .projections import (
+	PROJECTIONS, RegionSummaries, ReportCounts, ReportTimeseries, catch_up, checkpoint_name, projection_lag, rebuild,
+)
+from .regions import PartitionMap, invalidate_partition_map, merge_ranges
+from .retention import ensure_ttl_index
+from .snapshot import SHORT_DESCRIPTION_CHARS, ReportSnapshot, build_snapshot, encode_snapshot, snapshot_manager
+from .synthetic import generate_reports, seed_collection
+from .utils import bounding_box, haversine_distance
+from . import views
+
+
+TEST_URI = os.environ.get('MONGODB_TEST_URI')
+TEST_DB = f'{settings.MONGODB_NAME}_budget_tests'
+UNIT_TEST_DB = f'{settings.MONGODB_NAME}_unit_tests'
+
+DATASET_SIZE = 5000
+DATASET_SEED = 38
+RUNS = 5
+LATENCY_SCALE = float(os.environ.get('REPORT_BUDGET_LATENCY_SCALE', 1))
+VERBOSE = bool(os.environ.get('REPORT_BUDGET_VERBOSE'))
+
+# A dense area of the seeded dataset (Lagos); small radius so the prefilter matters
+NEARBY = '?lat=6.5244&lng=3.3792&radius=2'
+
+Budget = namedtuple('Budget', 'method path max_commands max_docs_examined max_latency_ms expected_commands')
+
+SNAPSHOT_BUDGETS = {
+	'list': Budget('get', '/api/reports/', 1, 60, 150, [
+		'find disaster_report _id',
+	]),
+	'list_radius': Budget('get', '/api/reports/' + NEARBY, 1, 60, 150, [
+		'find disaster_report _id',
+	]),
+	'list_filtered': Budget('get', '/api/reports/?type=flood,fire&status=active&since={since}', 1, 60, 150, [
+		'find disaster_report _id',
+	]),
+	# The priority order is precomputed in the snapshot
+	'list_priority': Budget('get', '/api/reports/?sort=priority', 1, 60, 150, [
+		'find disaster_report _id',
+	]),
+	'detail': Budget('get', '/api/reports/{id}/', 1, 1, 50, [
+		'find disaster_report _id',
+	]),
+	'batch': Budget('get', '/api/reports/batch/?ids={id},000000000000000000000000,invalid', 1, 1, 50, [
+		'find disaster_report _id',
+	]),
+	'simple': Budget('get', '/api/reports/simple/', 1, 60, 150, [
+		'find disaster_report',
+	]),
+	'markers': Budget('get', '/api/reports/markers/', 0, 0, 100, []),
+	'summary': Budget('get', '/api/summary/', 0, 0, 50, []),
+	'summary_area': Budget('get', '/api/summary/' + NEARBY, 0, 0, 50, []),
+	'ai_summary': Budget('get', '/api/ai/summary/', 0, 0, 100, []),
+	# The new report is logged and matched against the geofence subscriptions
+	'create': Budget('post', '/api/reports/create/', 4, 0, 100, [
+		'insert disaster_report',
+		'findAndModify event_sequences _id',
+		'insert report_events',
+		'find geofence_subscriptions area',
+	]),
+	'status_update': Budget('patch', '/api/reports/{id}/status/', 4, 2, 100, [
+		'find disaster_report _id',
+		'update disaster_report _id',
+		'findAndModify event_sequences _id',
+		'insert report_events',
+	]),
+	# Ranking sorts every match: the count and the page each read all collapse reports
+	'search': Budget('get', '/api/reports/search/?q=bridge+collapse', 2, 1500, 150, [
+		'aggregate disaster_report $text',
+		'find disaster_report $text',
+	]),
+	'cleanup': Budget('post', '/api/cleanup/resolved/', 5, 100, 100, [
+		'listIndexes disaster_report',
+		'aggregate disaster_report status',
+		'aggregate disaster_report resolved_at,status',
+		'aggregate disaster_report resolved_at,status',
+		'aggregate disaster_report resolved_at,status',
+	]),
+}
+
+MONGODB_BUDGETS = dict(SNAPSHOT_BUDGETS, **{
+	# Unfiltered facet counts read every report, but in a single round-trip
+	'list': Budget('get', '/api/reports/', 1, DATASET_SIZE + 100, 250, [
+		'aggregate disaster_report',
+	]),
+	'list_radius': Budget('get', '/api/reports/' + NEARBY, 1, 200, 150, [
+		'aggregate disaster_report $expr,geohash,latitude,longitude',
+	]),
+	'list_filtered': Budget('get', '/api/reports/?type=flood,fire&status=active&since={since}', 1, 1200, 150, [
+		'aggregate disaster_report created_at',
+	]),
+	# Walks the priority index; the facet counts still read every report
+	'list_priority': Budget('get', '/api/reports/?sort=priority', 1, DATASET_SIZE + 100, 250, [
+		'aggregate disaster_report',
+	]),
+	# Every report fits under MAX_MARKERS, in a single batch
+	'markers': Budget('get', '/api/reports/markers/', 1, DATASET_SIZE + 100, 250, [
+		'find disaster_report',
+	]),
+	'summary': Budget('get', '/api/summary/', 8, 0, 150, [
+		'aggregate disaster_report disaster_type',
+		'aggregate disaster_report disaster_type',
+		'aggregate disaster_report disaster_type',
+		'aggregate disaster_report disaster_type',
+		'aggregate disaster_report status',
+		'aggregate disaster_report status',
+		'aggregate disaster_report status',
+		'count disaster_report',
+	]),
+	# Only the region partitions around the circle are read
+	'summary_area': Budget('get', '/api/summary/' + NEARBY, 1, 200, 150, [
+		'aggregate disaster_report $expr,geohash,latitude,longitude',
+	]),
+	# Reads the last 24 hours, about a sixth of the skewed dataset
+	'ai_summary': Budget('get', '/api/ai/summary/', 7, 1200, 300, [
+		'aggregate disaster_report created_at,disaster_type',
+		'aggregate disaster_report created_at,disaster_type',
+		'aggregate disaster_report created_at,disaster_type',
+		'aggregate disaster_report created_at,disaster_type',
+		'find disaster_report created_at',
+		'getMore disaster_report',
+	]),
+})
+
+
+def command_filter(command):
+	"""Return the filter of a read or write command, or None."""
+	if 'filter' in command:
+		return command['filter']
+	if 'query' in command:
+		return command['query']
+	for key in ('updates', 'deletes'):
+		if command.get(key):
+			return command[key][0].get('q')
+	for stage in command.get('pipeline') or []:
+		if '$match' in stage:
+			return stage['$match']
+	return None
+
+
+def command_shape(event):
+	"""Describe a command by name, collection and filtered fields, without values."""
+	command = event.command
+	name = event.command_name
+	collection = command.get(name)
+	if name == 'getMore':
+		collection = command.get('collection')
+	shape = f'{name} {collection}'
+	fields = command_filter(command)
+	if fields:
+		shape += ' ' + ','.join(sorted(fields))
+	return shape
+
+
+class CommandRecorder(monitoring.CommandListener):
+	"""Record the commands issued by the recording thread only."""
+
+	def __init__(self):
+		self.thread = None
+		self.commands = []
+
+	def start(self):
+		self.commands = []
+		self.thread = threading.get_ident()
+
+	def stop(self):
+		self.thread = None
+		return self.commands
+
+	def started(self, event):
+		if event.database_name == TEST_DB and threading.get_ident() == self.thread:
+			self.commands.append(command_shape(event))
+
+	def succeeded(self, event):
+		pass
+
+	def failed(self, event):
+		pass
+
+
+@unittest.skipUnless(TEST_URI, 'set MONGODB_TEST_URI to run the query budget tests')
+class EndpointBudgetMixin:
+	budgets = None
+	snapshot_enabled = True
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.workdir = tempfile.TemporaryDirectory(prefix='report-budgets-')
+		cls.settings_override = override_settings(
+			REPORT_SNAPSHOT_ENABLED=cls.snapshot_enabled,
+			REPORT_SNAPSHOT_PATH=os.path.join(cls.workdir.name, 'reports.snapshot'),
+			# Never rebuild behind the test's back, never let the TTL monitor shrink the dataset
+			REPORT_SNAPSHOT_MAX_AGE=24 * 60 * 60,
+			RESOLVED_REPORT_RETENTION_MINUTES=10 * 365 * 24 * 60,
+			REPORT_ARCHIVE_ENABLED=False,
+			REGION_MAP_REFRESH_SECONDS=24 * 60 * 60,
+			ALLOWED_HOSTS=['*'],
+		)
+		cls.settings_override.enable()
+
+		cls.recorder = CommandRecorder()
+		options = connection_options()
+		options['event_listeners'] = options['event_listeners'] + [cls.recorder]
+		mongoengine.disconnect_all()
+		mongoengine.connect(db=TEST_DB, host=TEST_URI, alias=DEFAULT_CONNECTION_NAME, **options)
+
+		collection = DisasterReport._get_collection()
+		cls.database = collection.database
+		cls.database.client.drop_database(TEST_DB)
+		seed_collection(collection, DATASET_SIZE, seed=DATASET_SEED)
+		ensure_indexes(collection)
+		ensure_ttl_index(collection)
+		# Loaded again by the warm-up request, from the fresh database
+		invalidate_partition_map()
+		if cls.snapshot_enabled:
+			snapshot_manager.rebuild()
+
+		cls.report = collection.find_one(sort=[('created_at', -1)])
+		# The last day: about a sixth of the skewed dataset
+		cls.since = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.database.command('profile', 0)
+		cls.database.client.drop_database(TEST_DB)
+		mongoengine.disconnect_all()
+		cls.settings_override.disable()
+		cls.workdir.cleanup()
+		super().tearDownClass()
+
+	def setUp(self):
+		self.client = Client()
+		self.created = 0
+		self.statuses = iter(['investigating', 'active'] * RUNS * 2)
+		patches = [
+			# The external AI API and snapshot rebuilds are not part of the request
+			mock.patch.object(views, 'generate_ai_summary', views.generate_fallback_summary),
+			mock.patch.object(views, 'reports_changed'),
+		]
+		for patch in patches:
+			patch.start()
+			self.addCleanup(patch.stop)
+
+	def send(self, budget):
+		path = budget.path.format(id=self.report['_id'], since=self.since)
+		if budget.method == 'get':
+			return self.client.get(path)
+		if budget.path.startswith('/api/reports/create/'):
+			self.created += 1
+			body = {
+				'type': 'flood',
+				'description': f'Budget report {self.created}',
+				'latitude': 6.5244,
+				'longitude': 3.3792,
+			}
+		elif budget.method == 'patch':
+			body = {'status': next(self.statuses), 'reporter_id': self.report['reporter_id']}
+		else:
+			body = {}
+		return getattr(self.client, budget.method)(path, body, content_type='application/json')
+
+	def reset_profiler(self):
+		# The profiler must be off to drop its collection
+		self.database.command('profile', 0)
+		self.database.drop_collection('system.profile')
+		self.database.command('profile', 2)
+
+	def docs_examined(self):
+		collection = DisasterReport._get_collection_name()
+		entries = self.database['system.profile'].find({'ns': f'{TEST_DB}.{collection}'})
+		return sum(entry.get('docsExamined', 0) for entry in entries)
+
+	def measure(self, budget):
+		"""Return (commands issued, docs examined, latency in ms) for one request."""
+		self.reset_profiler()
+		self.recorder.start()
+		started = time.perf_counter()
+		response = self.send(budget)
+		elapsed = (time.perf_counter() - started) * 1000
+		commands = self.recorder.stop()
+		self.assertLess(response.status_code, 400, response.content[:500])
+		return commands, self.docs_examined(), elapsed
+
+	def check_budget(self, name):
+		budget = self.budgets[name]
+		# Warm up pools and caches before measuring
+		self.send(budget)
+
+		runs = [self.measure(budget) for _ in range(RUNS)]
+		commands = max((run[0] for run in runs), key=len)
+		docs_examined = max(run[1] for run in runs)
+		latency = statistics.median(run[2] for run in runs)
+		max_latency = budget.max_latency_ms * LATENCY_SCALE
+
+		if VERBOSE:
+			print(
+				f'\n{type(self).__name__}.{name}: {len(commands)} commands, '
+				f'{docs_examined} docs examined, {latency:.1f} ms'
+			)
+
+		failures = []
+		if len(commands) > budget.max_commands:
+			failures.append(f'{len(commands)} commands (budget {budget.max_commands})')
+		if docs_examined > budget.max_docs_examined:
+			failures.append(f'{docs_examined} documents examined (budget {budget.max_docs_examined})')
+		if latency > max_latency:
+			failures.append(f'median latency {latency:.1f} ms (budget {max_latency:.0f} ms)')
+
+		if failures:
+			diff = '\n'.join(difflib.unified_diff(
+				budget.expected_commands, commands, 'expected commands', 'issued commands', lineterm='',
+			))
+			self.fail(f"{name} over budget: {'; '.join(failures)}\n{diff or 'Commands issued as expected.'}")
+
+	def test_list(self):
+		self.check_budget('list')
+
+	def test_list_radius(self):
+		self.check_budget('list_radius')
+
+	def test_list_filtered(self):
+		self.check_budget('list_filtered')
+
+	def test_list_priority(self):
+		self.check_budget('list_priority')
+
+	def test_detail(self):
+		self.check_budget('detail')
+
+	def test_batch(self):
+		self.check_budget('batch')
+
+	def test_simple(self):
+		self.check_budget('simple')
+
+	def test_markers(self):
+		self.check_budget('markers')
+
+	def test_summary(self):
+		self.check_budget('summary')
+
+	def test_summary_area(self):
+		self.check_budget('summary_area')
+
+	def test_ai_summary(self):
+		self.check_budget('ai_summary')
+
+	def test_create(self):
+		self.check_budget('create')
+
+	def test_status_update(self):
+		self.check_budget('status_update')
+
+	def test_search(self):
+		self.check_budget('search')
+
+	def test_cleanup(self):
+		self.check_budget('cleanup')
+
+
+class SnapshotEndpointBudgetTests(EndpointBudgetMixin, SimpleTestCase):
+	budgets = SNAPSHOT_BUDGETS
+	snapshot_enabled = True
+
+
+class MongoEndpointBudgetTests(EndpointBudgetMixin, SimpleTestCase):
+	budgets = MONGODB_BUDGETS
+	snapshot_enabled = False
+
+
+# Unit tests: no MongoDB needed
+
+REFERENCE_TIME = datetime(2024, 5, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def report_row(minutes_ago, disaster_type='fire', status='active', lat=6.5244, lng=3.3792, **fields):
+	"""A raw report document, as the snapshot and the event log read them."""
+	row = {
+		'_id': ObjectId(),
+		'created_at': REFERENCE_TIME - timedelta(minutes=minutes_ago),
+		'disaster_type': disaster_type,
+		'status': status,
+		'latitude': lat,
+		'longitude': lng,
+		'description': f'{disaster_type} reported {minutes_ago} minutes ago',
+		'priority': None,
+		'priority_density': 0,
+	}
+	row.update(fields)
+	return row
+
+
+def load_snapshot(test, rows):
+	"""Write rows to a snapshot file removed after the test and open it."""
+	directory = tempfile.TemporaryDirectory(prefix='report-snapshot-')
+	test.addCleanup(directory.cleanup)
+	path = os.path.join(directory.name, 'reports.snapshot')
+	write_atomic(path, encode_snapshot(rows, built_at=0))
+	return ReportSnapshot(path)
+
+
+class ReportSnapshotTests(SimpleTestCase):
+	"""encode_snapshot() and the ReportSnapshot reader, with no MongoDB."""
+
+	def setUp(self):
+		self.rows = [
+			report_row(0, 'fire', 'active', description='x' * 500),
+			report_row(30, 'flood', 'investigating', lat=6.60, lng=3.40),
+			report_row(60, 'collapse', 'active', lat=6.5250, lng=3.3800),
+			report_row(120, 'fire', 'resolved', lat=9.0765, lng=7.3986),
+			report_row(240, 'accident', 'active', lat=6.5300, lng=3.3700),
+			report_row(300, 'tornado', 'unknown'),
+		]
+		self.snapshot = load_snapshot(self, self.rows)
+
+	def test_round_trip(self):
+		self.assertEqual(len(self.snapshot), len(self.rows))
+		for index, row in enumerate(self.rows):
+			self.assertEqual(self.snapshot.id_at(index), row['_id'])
+			self.assertEqual(self.snapshot.created_at_at(index), row['created_at'])
+			self.assertEqual(self.snapshot.latitude[index], row['latitude'])
+			self.assertEqual(self.snapshot.longitude[index], row['longitude'])
+		self.assertEqual(self.snapshot.type_at(1), 'flood')
+		self.assertEqual(self.snapshot.status_at(1), 'investigating')
+		self.assertEqual(self.snapshot.description_at(1), self.rows[1]['description'])
+
+	def test_long_descriptions_are_truncated(self):
+		self.assertEqual(self.snapshot.description_at(0), 'x' * SHORT_DESCRIPTION_CHARS)
+
+	def test_unknown_choices_decode_to_none(self):
+		self.assertIsNone(self.snapshot.type_at(5))
+		self.assertIsNone(self.snapshot.status_at(5))
+
+	def test_rejects_other_files(self):
+		with tempfile.NamedTemporaryFile() as other:
+			other.write(b'NOTASNAP' + b'\0' * 64)
+			other.flush()
+			with self.assertRaises(ValueError):
+				ReportSnapshot(other.name)
+
+	def test_filter_by_type_counts_every_type(self):
+		rows, type_counts, status_counts = self.snapshot.filter(types=['fire'])
+		self.assertEqual(list(rows), [0, 3])
+		# Type counts ignore the type filter, status counts honour it
+		self.assertEqual(type_counts['flood'], 1)
+		self.assertEqual(dict(status_counts), {'active': 1, 'resolved': 1})
+
+	def test_filter_by_status_counts_every_status(self):
+		rows, type_counts, status_counts = self.snapshot.filter(statuses=['active'])
+		self.assertEqual(list(rows), [0, 2, 4])
+		self.assertEqual(status_counts['resolved'], 1)
+		self.assertEqual(type_counts['fire'], 1)
+
+	def test_filter_by_time_window(self):
+		rows, _, _ = self.snapshot.filter(
+			since=REFERENCE_TIME - timedelta(minutes=90),
+			until=REFERENCE_TIME - timedelta(minutes=15),
+		)
+		self.assertEqual(list(rows), [1, 2])
+
+	def test_filter_by_radius(self):
+		rows, _, _ = self.snapshot.filter(circle=(6.5244, 3.3792, 2))
+		self.assertEqual(list(rows), [0, 2, 4, 5])
+
+	def test_filter_by_bbox(self):
+		rows, _, _ = self.snapshot.filter(bbox=(3.39, 6.55, 3.41, 6.65))
+		self.assertEqual(list(rows), [1])
+
+	def test_rebuild_skips_when_another_worker_built_since(self):
+		directory = tempfile.TemporaryDirectory(prefix='report-snapshot-')
+		self.addCleanup(directory.cleanup)
+		path = os.path.join(directory.name, 'reports.snapshot')
+		with mock.patch('reports.snapshot.snapshot_rows', return_value=self.rows) as rows:
+			# A second before the build: built_at has whole milliseconds
+			requested_at = time.time() - 1
+			self.assertIsNotNone(build_snapshot(path, unless_built_after=requested_at))
+			# The file now holds a scan started after the request
+			self.assertIsNone(build_snapshot(path, unless_built_after=requested_at))
+			self.assertEqual(rows.call_count, 1)
+			self.assertIsNotNone(build_snapshot(path, unless_built_after=time.time() + 1))
+			self.assertIsNotNone(build_snapshot(path))
+			self.assertEqual(rows.call_count, 3)
+		self.assertEqual(len(ReportSnapshot(path)), len(self.rows))
+
+	def test_unfiltered_counts_cover_every_row(self):
+		rows, type_counts, status_counts = self.snapshot.filter()
+		self.assertEqual(list(rows), list(range(len(self.rows))))
+		self.assertEqual(type_counts['fire'], 2)
+		self.assertEqual(status_counts['active'], 3)
+
+
+class ColumnarTests(SimpleTestCase):
+	"""The column packing shared by the snapshot and the archive segments."""
+
+	def test_string_column(self):
+		heap = bytearray(b'prefix')
+		column = StringColumn(heap, max_chars=4)
+		for value in ('abcdef', None, 'é', ''):
+			column.append(value)
+		self.assertEqual(list(column.offsets), [6, 10, 10, 12, 12])
+		self.assertEqual(read_string(heap, column.offsets, 0), 'abcd')
+		self.assertEqual(read_string(heap, column.offsets, 1), '')
+		self.assertEqual(read_string(heap, column.offsets, 2), 'é')
+
+	def test_pack_aligns_columns(self):
+		header = struct.pack('<3s', b'abc')
+		ints = array('q', [1, -2, 3])
+		codes = bytearray(b'\x01\x02\x03')
+		floats = array('d', [0.5, 1.5, 2.5])
+		heap = bytearray()
+		strings = StringColumn(heap)
+		for value in ('one', 'two', 'three'):
+			strings.append(value)
+
+		data = pack(header, (ints, codes, floats, strings.offsets), heap)
+		columns, offset = view_columns(memoryview(data), len(header), [
+			('ints', 'q', 8 * 3),
+			('codes', 'B', 3),
+			('floats', 'd', 8 * 3),
+			('offsets', 'I', 4 * 4),
+		])
+
+		self.assertEqual(list(columns['ints']), [1, -2, 3])
+		self.assertEqual(bytes(columns['codes']), b'\x01\x02\x03')
+		self.assertEqual(list(columns['floats']), [0.5, 1.5, 2.5])
+		self.assertEqual(offset % 8, 0)
+		self.assertEqual(read_string(memoryview(data)[offset:], columns['offsets'], 2), 'three')
+
+	def test_millis_treat_naive_as_utc(self):
+		aware = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+		self.assertEqual(to_millis(aware), to_millis(aware.replace(tzinfo=None)))
+		self.assertEqual(from_millis(to_millis(aware)), aware.replace(microsecond=123000))
+		self.assertEqual(to_millis(None), 0)
+
+
+class ArchiveSegmentTests(SimpleTestCase):
+	"""Archive segments on disk: discarded ids and compaction, with no MongoDB."""
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory(prefix='report-archive-')
+		self.addCleanup(directory.cleanup)
+		self.writer = ArchiveSegmentWriter(directory=directory.name, max_reports=100)
+		self.rows = [report_row(minutes, status='resolved', resolved_at=REFERENCE_TIME) for minutes in range(6)]
+
+	def test_discarded_reports_stay_out_of_the_archive(self):
+		self.writer.write_batch(self.rows[:3])
+		self.writer.write_batch(self.rows[3:])
+		# Reopened before the delete
+		self.writer.discard({self.rows[1]['_id'], self.rows[4]['_id']})
+		self.writer.close()
+		path = os.path.join(self.writer.directory, self.writer.segments[0])
+		kept = [row['_id'] for row in self.rows if row['_id'] not in (self.rows[1]['_id'], self.rows[4]['_id'])]
+		self.assertEqual([document['_id'] for document in iter_segment(path)], kept)
+
+		segment = ArchiveSegment(compact_segment(path))
+		self.assertEqual(segment.metadata.count, 4)
+		self.assertEqual(
+			sorted(segment.row(index)['id'] for index in range(4)),
+			sorted(str(report_id) for report_id in kept),
+		)
+
+
+	def test_segments_are_published_once_complete(self):
+		directory = self.writer.directory
+		self.writer.max_reports = 3
+		self.writer.write_batch(self.rows[:3])
+		# Still growing: invisible to compaction
+		self.assertEqual(compact_pending_segments(directory=directory), [])
+		self.writer.write_batch(self.rows[3:])
+		first, second = self.writer.segments
+		self.assertEqual(compact_pending_segments(directory=directory), [first.replace('.jsonl.gz', '.col')])
+
+		# A sweep that died leaves its segment partial; the next one publishes it
+		self.assertEqual(publish_partial_segments(directory), [second])
+		self.assertEqual(len(list(iter_segment(os.path.join(directory, second)))), 3)
+		self.assertEqual(compact_pending_segments(directory=directory), [second.replace('.jsonl.gz', '.col')])
+
+
+class GeohashRegionTests(SimpleTestCase):
+	"""Geohash encoding and the region partition ranges area queries use."""
+
+	def test_encode_known_points(self):
+		self.assertEqual(encode(42.6, -5.6, 5), 'ezs42')
+		self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+	def test_cell_contains_its_points(self):
+		lat_min, lat_max, lng_min, lng_max = bounds(encode(6.5244, 3.3792, 7))
+		self.assertTrue(lat_min <= 6.5244 <= lat_max)
+		self.assertTrue(lng_min <= 3.3792 <= lng_max)
+
+	def test_merge_ranges(self):
+		self.assertEqual(merge_ranges(['s0', 's1']), [('s0', 's2')])
+		self.assertEqual(merge_ranges(['s2', 's0']), [('s0', 's1'), ('s2', 's3')])
+		# A prefix and a cell inside it are one range
+		self.assertEqual(merge_ranges(['s1', 's10']), [('s1', 's2')])
+		# Adjacent across a carry, and open at the top
+		self.assertEqual(merge_ranges(['sz', 't0']), [('sz', 't1')])
+		self.assertEqual(merge_ranges(['zz']), [('zz', None)])
+
+	def assert_ranges_cover(self, partitions, box, points=200):
+		ranges = partitions.ranges_for_box(box)
+		self.assertIsNotNone(ranges)
+		generator = random.Random(41)
+		for _ in range(points):
+			lat = generator.uniform(box[0], box[1])
+			lng = generator.uniform(box[2], box[3])
+			geohash = encode(lat, lng, GEOHASH_PRECISION)
+			self.assertTrue(
+				any(lower <= geohash and (upper is None or geohash < upper) for lower, upper in ranges),
+				f'{geohash} ({lat}, {lng}) outside {ranges}',
+			)
+		return ranges
+
+	def test_ranges_cover_the_box(self):
+		box = bounding_box(6.5244, 3.3792, 5)
+		ranges = self.assert_ranges_cover(PartitionMap(base_precision=2, max_precision=6), box)
+		self.assertEqual(ranges, [('s1', 's2')])
+
+	def test_split_regions_narrow_the_ranges(self):
+		box = bounding_box(6.5244, 3.3792, 5)
+		partitions = PartitionMap(['s1', 's14'], base_precision=2, max_precision=6)
+		# Lagos is in s14m; the box reaches into its neighbours
+		self.assertEqual(self.assert_ranges_cover(partitions, box), [('s14k', 's14n')])
+
+	def test_region_for(self):
+		partitions = PartitionMap(['s1', 's1v', 's1vh'], base_precision=2, max_precision=4)
+		# Split at the maximum precision still stops there
+		self.assertEqual(partitions.region_for('s1vhpqrst'), 's1vh')
+		self.assertEqual(partitions.region_for('s1abcdefg'), 's1a')
+		self.assertEqual(partitions.region_for('s2abcdefg'), 's2')
+
+
+class FieldsetTests(SimpleTestCase):
+	"""fields= and compat= parsing, including the frontend aliases."""
+
+	def test_all_fields_by_default(self):
+		self.assertEqual(parse_fieldset(QueryDict('')), Fieldset(None, True))
+
+	def test_aliases_map_to_serializer_fields(self):
+		fieldset = parse_fieldset(QueryDict('fields=type,reporterId&fields=imageUrl&compat=false'))
+		self.assertEqual(fieldset.fields, ['id', 'disaster_type', 'reporter_id', 'image_url'])
+		self.assertFalse(fieldset.compat)
+
+	def test_alias_and_name_are_one_field(self):
+		fieldset = parse_fieldset(QueryDict('fields=type,disaster_type,id'))
+		self.assertEqual(fieldset.fields, ['id', 'disaster_type'])
+
+	def test_unknown_fields_are_rejected(self):
+		with self.assertRaisesMessage(ValueError, 'unknown field bogus, secret'):
+			parse_fieldset(QueryDict('fields=secret,type,bogus'))
+
+	def test_projection_reads_the_source_fields(self):
+		fieldset = parse_fieldset(QueryDict('fields=location,timestamp'))
+		self.assertEqual(mongo_projection(fieldset), {'_id': 1, 'created_at': 1, 'latitude': 1, 'longitude': 1})
+		self.assertIsNone(mongo_projection(Fieldset(None, True)))
+
+
+class FeedFilterTests(SimpleTestCase):
+	"""The feed's type/status/time/area filters and sort= parsing."""
+
+	def test_lists_accept_commas_and_repeats(self):
+		filters = parse_facet_filters(QueryDict('type=fire,flood&type=collapse&status=active'))
+		self.assertEqual(filters.types, ['fire', 'flood', 'collapse'])
+		self.assertEqual(filters.statuses, ['active'])
+
+	def test_unknown_values_are_rejected(self):
+		with self.assertRaisesMessage(ValueError, 'unknown type volcano'):
+			parse_facet_filters(QueryDict('type=fire,volcano'))
+		with self.assertRaisesMessage(ValueError, 'unknown status closed'):
+			parse_facet_filters(QueryDict('status=closed'))
+
+	def test_dates_are_utc(self):
+		filters = parse_facet_filters(QueryDict('since=2024-05-01T10:00:00Z&until=2024-05-01T11:00:00'))
+		self.assertEqual(filters.since, datetime(2024, 5, 1, 10, tzinfo=dt_timezone.utc))
+		self.assertEqual(filters.until, datetime(2024, 5, 1, 11, tzinfo=dt_timezone.utc))
+		with self.assertRaises(ValueError):
+			parse_facet_filters(QueryDict('since=yesterday'))
+
+	def test_area(self):
+		filters = parse_facet_filters(QueryDict('lat=6.5&lng=3.4&bbox=3,6,4,7'))
+		self.assertEqual(filters.circle, (6.5, 3.4, 10.0))
+		self.assertEqual(filters.bbox, (3.0, 6.0, 4.0, 7.0))
+		# Invalid coordinates have always been ignored
+		self.assertIsNone(parse_facet_filters(QueryDict('lat=north&lng=3.4')).circle)
+		with self.assertRaises(ValueError):
+			parse_facet_filters(QueryDict('bbox=3,6,4'))
+
+	def test_sort(self):
+		self.assertEqual(parse_sort(QueryDict('')), 'newest')
+		self.assertEqual(parse_sort(QueryDict('sort=priority')), 'priority')
+		with self.assertRaisesMessage(ValueError, 'unknown sort oldest'):
+			parse_sort(QueryDict('sort=oldest'))
+
+
+class PriorityTests(SimpleTestCase):
+	"""Priority scores, density counts and the priority order of the feed."""
+
+	def importance(self, disaster_type, status, created_at, density, at):
+		"""The decayed importance a score stands for, computed directly at time `at`."""
+		weight = (
+			TYPE_WEIGHTS[disaster_type] * STATUS_WEIGHTS[status]
+			* (1 + DENSITY_WEIGHT * math.log2(1 + density))
+		)
+		hours = (at - created_at).total_seconds() / 3600
+		return weight * 2 ** -(hours / settings.PRIORITY_HALF_LIFE_HOURS)
+
+	def test_score_orders_by_importance_at_any_time(self):
+		generator = random.Random(48)
+		reports = [
+			(
+				generator.choice(list(TYPE_WEIGHTS)),
+				generator.choice(list(STATUS_WEIGHTS)),
+				REFERENCE_TIME - timedelta(minutes=generator.uniform(0, 3 * 24 * 60)),
+				generator.randrange(0, 20),
+			)
+			for _ in range(200)
+		]
+		by_score = sorted(range(len(reports)), key=lambda index: priority_score(*reports[index]))
+		# The stored score never changes, yet matches the order an hour, a day and a month later
+		for later in (timedelta(0), timedelta(hours=1), timedelta(days=1), timedelta(days=30)):
+			at = REFERENCE_TIME + later
+			by_importance = sorted(range(len(reports)), key=lambda index: self.importance(*reports[index], at))
+			self.assertEqual(by_score, by_importance, f'order differs {later} later')
+
+	def test_a_half_life_is_one_point(self):
+		half_life = timedelta(hours=settings.PRIORITY_HALF_LIFE_HOURS)
+		older = priority_score('fire', 'active', REFERENCE_TIME - half_life)
+		self.assertAlmostEqual(priority_score('fire', 'active', REFERENCE_TIME) - older, 1, places=5)
+		# A collapse (weight 1) a half-life old ranks with an accident (weight 0.5) filed now
+		self.assertAlmostEqual(
+			priority_score('collapse', 'active', REFERENCE_TIME - half_life),
+			priority_score('accident', 'active', REFERENCE_TIME),
+			places=5,
+		)
+
+	def test_status_and_density_weights(self):
+		active = priority_score('flood', 'active', REFERENCE_TIME)
+		self.assertLess(priority_score('flood', 'investigating', REFERENCE_TIME), active)
+		self.assertLess(priority_score('flood', 'resolved', REFERENCE_TIME), active)
+		self.assertLess(active, priority_score('flood', 'active', REFERENCE_TIME, density=3))
+		# Unknown values weigh DEFAULT_WEIGHT, and a missing density counts as none
+		self.assertEqual(priority_score('tornado', 'active', REFERENCE_TIME), priority_score('accident', 'active', REFERENCE_TIME))
+		self.assertEqual(priority_score('fire', 'active', REFERENCE_TIME, None), priority_score('fire', 'active', REFERENCE_TIME))
+		self.assertEqual(
+			priority_score('fire', 'active', REFERENCE_TIME.replace(tzinfo=None)),
+			priority_score('fire', 'active', REFERENCE_TIME),
+		)
+
+	def test_row_priority_uses_the_stored_density(self):
+		row = report_row(10, 'collapse', priority_density=4)
+		self.assertEqual(row_priority(row), priority_score('collapse', 'active', row['created_at'], 4))
+		self.assertEqual(row_priority(row, 0), priority_score('collapse', 'active', row['created_at']))
+
+	def neighbours(self, rows, row, radius_km=1.0, window=timedelta(hours=24)):
+		return set(DensityGrid(rows, radius_km, window).neighbours(row))
+
+	def test_density_counts_reports_within_radius_and_window(self):
+		center = report_row(0)
+		# 0.009 degrees of latitude is about 1 km
+		near = report_row(60, lat=6.5244 + 0.005)
+		far = report_row(60, lat=6.5244 + 0.015)
+		earlier = report_row(25 * 60, lat=6.5244 + 0.005)
+		later = report_row(-23 * 60, lng=3.3792 - 0.005)
+		no_location = report_row(0, lat=None, lng=None)
+		rows = [center, near, far, earlier, later, no_location]
+		self.assertEqual(self.neighbours(rows, center), {near['_id'], later['_id']})
+		# The window is measured from each report: an hour earlier, both are a day away
+		self.assertEqual(self.neighbours(rows, near), {center['_id'], earlier['_id'], later['_id']})
+		self.assertEqual(self.neighbours(rows, earlier), {near['_id']})
+		self.assertEqual(self.neighbours(rows, no_location), set())
+
+	def test_density_across_cells(self):
+		# Neighbours on either side of cell boundaries, in every direction
+		center = report_row(0, lat=0.0045, lng=0.0045)
+		rows = [center] + [
+			report_row(0, lat=0.0045 + 0.006 * dlat, lng=0.0045 + 0.006 * dlng)
+			for dlat, dlng in ((1, 0), (-1, 0), (0, 1), (0, -1), (0.7, 0.7), (-0.7, -0.7))
+		]
+		self.assertEqual(self.neighbours(rows, center), {row['_id'] for row in rows[1:]})
+
+	def test_density_near_the_poles(self):
+		# At 89.5 degrees a kilometre spans about a degree of longitude: many cells
+		center = report_row(0, lat=89.5, lng=10.0)
+		east = report_row(0, lat=89.5, lng=10.8)
+		beyond = report_row(0, lat=89.5, lng=11.3)
+		self.assertEqual(self.neighbours([center, east, beyond], center), {east['_id']})
+
+	def test_updates_store_density_and_priority(self):
+		center, near = report_row(0), report_row(10, lat=6.5250)
+		current = report_row(20, lat=7.5)
+		current['priority'] = row_priority(current)
+		rows = [center, near, current]
+		updates = priority_updates(rows, {row['_id'] for row in rows}, DensityGrid(rows, 1.0, timedelta(hours=24)))
+		# Rows already holding their density and priority are not rewritten
+		self.assertEqual([update._filter['_id'] for update in updates], [center['_id'], near['_id']])
+		self.assertEqual(updates[0]._doc['$set'], {
+			'priority_density': 1,
+			'priority': priority_score('fire', 'active', center['created_at'], 1),
+		})
+
+	def test_snapshot_sorts_by_priority(self):
+		rows = [
+			report_row(0, 'accident'),
+			report_row(30, 'collapse', priority_density=5),
+			report_row(60, 'fire', 'resolved'),
+			report_row(90, 'collapse', priority_density=5),
+		]
+		# Equal scores keep the newest first
+		rows[3]['priority'] = row_priority(rows[1])
+		snapshot = load_snapshot(self, rows)
+		ranked, _, _ = snapshot.filter(sort='priority')
+		self.assertEqual(list(ranked), [1, 3, 0, 2])
+		active, _, _ = snapshot.filter(statuses=['active'], sort='priority')
+		self.assertEqual(list(active), [1, 3, 0])
+		newest, _, _ = snapshot.filter(statuses=['active'])
+		self.assertEqual(list(newest), [0, 1, 3])
+
+	def test_pipeline_sorts_by_priority_before_the_facets(self):
+		filters = parse_facet_filters(QueryDict('type=fire'))
+		pipeline = facet_pipeline(filters, 0, 20, sort='priority')
+		self.assertEqual(pipeline[1], {'$sort': FEED_SORTS['priority']})
+		self.assertNotIn({'$sort': FEED_SORTS['priority']}, pipeline[2]['$facet']['results'])
+		newest = facet_pipeline(filters, 0, 20)
+		self.assertIn({'$sort': FEED_SORTS['newest']}, newest[1]['$facet']['results'])
+
+
+@unittest.skipUnless(TEST_URI, 'set MONGODB_TEST_URI to run the MongoDB tests')
+@override_settings(PRIORITY_DENSITY_RADIUS_KM=1.0, PRIORITY_DENSITY_WINDOW_HOURS=24)
+class PriorityRefreshTests(SimpleTestCase):
+	"""refresh_priorities() against a real mongod: incremental runs agree with a full one."""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		mongoengine.disconnect_all()
+		mongoengine.connect(db=UNIT_TEST_DB, host=TEST_URI, alias=DEFAULT_CONNECTION_NAME, **connection_options())
+		cls.collection = DisasterReport._get_collection()
+		cls.collection.database.client.drop_database(UNIT_TEST_DB)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.collection.database.client.drop_database(UNIT_TEST_DB)
+		mongoengine.disconnect_all()
+		super().tearDownClass()
+
+	def scores(self):
+		return {row['_id']: (row['priority_density'], row['priority']) for row in self.collection.find()}
+
+	def test_incremental_runs_match_a_full_run(self):
+		now = timezone.now()
+		documents = list(generate_reports(2000, seed=48, now=now, days=2))
+		cutoffs = [now - timedelta(hours=hours) for hours in (12, 3)]
+		batches = [
+			[row for row in documents if row['created_at'] < cutoffs[0]],
+			[row for row in documents if cutoffs[0] <= row['created_at'] < cutoffs[1]],
+			[row for row in documents if row['created_at'] >= cutoffs[1]],
+		]
+
+		self.collection.insert_many(batches[0])
+		refresh_priorities(self.collection, full=True)
+		for cutoff, batch in zip(cutoffs, batches[1:]):
+			self.collection.insert_many(batch)
+			refresh_priorities(self.collection, since=cutoff)
+		incremental = self.scores()
+
+		refresh_priorities(self.collection, full=True)
+		full = self.scores()
+		self.assertEqual(incremental, full)
+		# The full run counts one window at a time; the counts match one grid over everything
+		rows = list(self.collection.find())
+		grid = DensityGrid(rows, 1.0, timedelta(hours=24))
+		self.assertEqual({row['_id']: sum(1 for _ in grid.neighbours(row)) for row in rows}, {
+			report_id: density for report_id, (density, _) in full.items()
+		})
+		# Lagos is dense enough for the comparison to mean something
+		self.assertGreater(sum(1 for density, _ in full.values() if density), 100)
+
+		# The feed's priority sort: highest score first, ties newest first
+		ranked = [
+			(row['priority'], row['created_at'])
+			for row in self.collection.find().sort(list(FEED_SORTS['priority'].items()))
+		]
+		self.assertEqual(ranked, sorted(ranked, reverse=True))
+		self.assertEqual([priority for priority, _ in ranked], sorted((score for _, score in full.values()), reverse=True))
+
+
+def point_in_ring(lng, lat, ring):
+	"""Ray casting in the plane; fine for rings a few kilometres across."""
+	inside = False
+	for (lng1, lat1), (lng2, lat2) in zip(ring, ring[1:]):
+		if (lat1 > lat) != (lat2 > lat) and lng < lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1):
+			inside = not inside
+	return inside
+
+
+def great_circle_midpoint(lng1, lat1, lng2, lat2):
+	"""The (lat, lng) halfway along the geodesic edge MongoDB draws between two vertices."""
+	vectors = [
+		(math.cos(math.radians(lat)) * math.cos(math.radians(lng)),
+		 math.cos(math.radians(lat)) * math.sin(math.radians(lng)),
+		 math.sin(math.radians(lat)))
+		for lng, lat in ((lng1, lat1), (lng2, lat2))
+	]
+	x, y, z = (a + b for a, b in zip(*vectors))
+	return math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))
+
+
+class GeofenceTests(SimpleTestCase):
+	"""Circle polygons and the alerts a report raises, with no MongoDB."""
+
+	def subscription(self, lat=6.5244, lng=3.3792, radius_km=5.0, subscriber_id='subscriber', types=None):
+		return {'_id': ObjectId(), 'subscriber_id': subscriber_id, 'center': [lng, lat], 'radius_km': radius_km, 'types': types}
+
+	def report_at(self, bearing, distance_km, **fields):
+		lat, lng = destination(6.5244, 3.3792, bearing, distance_km)
+		return report_row(0, lat=lat, lng=lng, reporter_id='reporter', **fields)
+
+	def test_destination_travels_the_distance(self):
+		for bearing in (0, 1, 2.5, 4, 5.5):
+			lat, lng = destination(6.5244, 3.3792, bearing, 5)
+			self.assertAlmostEqual(haversine_distance(6.5244, 3.3792, lat, lng), 5, places=6)
+		lat, _ = destination(6.5244, 3.3792, 0, 111.195)
+		self.assertAlmostEqual(lat, 7.5244, places=3)
+
+	def test_destination_wraps_at_the_antimeridian(self):
+		lat, lng = destination(0, 179.9, math.pi / 2, 50)
+		self.assertAlmostEqual(lat, 0, places=9)
+		self.assertAlmostEqual(lng, 179.9 + 50 / 111.195 - 360, places=3)
+		_, lng = destination(0, -179.9, 3 * math.pi / 2, 50)
+		self.assertAlmostEqual(lng, 360 - 179.9 - 50 / 111.195, places=3)
+		# Longitudes stay in [-180, 180)
+		_, lng = destination(0, 179.5, math.pi / 2, 0.5 * 111.195)
+		self.assertAlmostEqual(lng, -180, places=3)
+		self.assertLess(lng, 180)
+
+	def test_circle_polygon_contains_the_circle(self):
+		radius_km = 5
+		[ring] = circle_polygon(6.5244, 3.3792, radius_km)
+		self.assertEqual(len(ring), CIRCLE_SIDES + 1)
+		self.assertEqual(ring[0], ring[-1])
+		for (lng1, lat1), (lng2, lat2) in zip(ring, ring[1:]):
+			# Vertices and the edges between them stay outside the circle
+			self.assertGreater(haversine_distance(6.5244, 3.3792, lat1, lng1), radius_km)
+			self.assertGreater(haversine_distance(6.5244, 3.3792, *great_circle_midpoint(lng1, lat1, lng2, lat2)), radius_km)
+		for step in range(64):
+			lat, lng = destination(6.5244, 3.3792, 2 * math.pi * step / 64, radius_km * 0.999)
+			self.assertTrue(point_in_ring(lng, lat, ring), f'({lat}, {lng}) outside the polygon')
+		# ...and not by much: the polygon is no excuse for matching far away
+		lat, lng = destination(6.5244, 3.3792, 0, radius_km * 1.1)
+		self.assertFalse(point_in_ring(lng, lat, ring))
+
+	def test_circle_polygon_across_the_antimeridian(self):
+		[ring] = circle_polygon(0, 179.99, 5)
+		self.assertTrue(all(-180 <= lng < 180 for lng, _ in ring))
+		self.assertTrue(any(lng < 0 for lng, _ in ring) and any(lng > 0 for lng, _ in ring))
+		for lng, lat in ring:
+			self.assertGreater(haversine_distance(0, 179.99, lat, lng), 5)
+
+	def test_alerts_inside_the_radius_only(self):
+		subscription = self.subscription(radius_km=5)
+		inside = self.report_at(1, 4.99)
+		outside = self.report_at(1, 5.01)
+		[alert] = alert_documents(inside, [subscription])
+		self.assertEqual(alert['subscriber_id'], 'subscriber')
+		self.assertEqual(alert['subscription'], subscription['_id'])
+		self.assertEqual(alert['report'], inside['_id'])
+		self.assertAlmostEqual(alert['distance_km'], 4.99, places=3)
+		self.assertEqual(alert_documents(outside, [subscription]), [])
+
+	def test_polygon_subscriptions_trust_the_geo_match(self):
+		polygon = dict(self.subscription(radius_km=None), center=None)
+		[alert] = alert_documents(self.report_at(0, 50), [polygon])
+		self.assertIsNone(alert['distance_km'])
+
+	def test_own_reports_raise_no_alert(self):
+		own = self.subscription(subscriber_id='reporter')
+		other = self.subscription(subscriber_id='neighbour')
+		alerts = alert_documents(self.report_at(0, 1), [own, other])
+		self.assertEqual([alert['subscriber_id'] for alert in alerts], ['neighbour'])
+
+	def test_types_filter(self):
+		report = self.report_at(0, 1, disaster_type='flood', description='y' * 500)
+		subscriptions = [
+			self.subscription(subscriber_id='floods', types=['flood', 'collapse']),
+			self.subscription(subscriber_id='fires', types=['fire']),
+			self.subscription(subscriber_id='everything', types=[]),
+		]
+		alerts = alert_documents(report, subscriptions)
+		self.assertEqual([alert['subscriber_id'] for alert in alerts], ['floods', 'everything'])
+		self.assertEqual(alerts[0]['description'], 'y' * ALERT_DESCRIPTION_CHARS)
+
+
+def report_events(count, seed=50):
+	"""A log of created, status changed and deleted events for `count` reports, in order."""
+	generator = random.Random(seed)
+	events = []
+	for index in range(count):
+		minutes_ago = generator.uniform(0, 3 * 24 * 60)
+		row = report_row(
+			minutes_ago, generator.choice(list(TYPE_WEIGHTS)), 'active',
+			lat=6.5244 + generator.gauss(0, 0.5), lng=3.3792 + generator.gauss(0, 0.5),
+		)
+		row['geohash'] = None if index % 10 == 0 else encode(row['latitude'], row['longitude'], GEOHASH_PRECISION)
+		events.append(('created', row['_id'], event_data(row)))
+		status = 'active'
+		for _ in range(generator.randrange(0, 3)):
+			previous, status = status, generator.choice(['investigating', 'resolved', 'active'])
+			if status != previous:
+				row['status'] = status
+				events.append(('status_changed', row['_id'], event_data(row, previous_status=previous)))
+		if generator.random() < 0.2:
+			events.append(('deleted', row['_id'], event_data(row, reason='archived')))
+	with mock.patch('django.utils.timezone.now', return_value=REFERENCE_TIME):
+		return numbered(len(events), events)
+
+
+def apply_updates(collection, updates):
+	"""Apply upserts with $set and $inc (dotted paths) to a dict of documents, as MongoDB would."""
+	for update in updates:
+		key = update._filter['_id']
+		document = collection.setdefault(key, {'_id': key})
+		for operator, values in update._doc.items():
+			for path, value in values.items():
+				*parents, field = path.split('.')
+				target = document
+				for parent in parents:
+					target = target.setdefault(parent, {})
+				target[field] = value if operator == '$set' else target.get(field, 0) + value
+
+
+@override_settings(EVENT_LOG_GAP_GRACE_SECONDS=60)
+class EventLogTests(SimpleTestCase):
+	"""Reading the event log past holes, and folding it into projections."""
+
+	def event(self, sequence, seconds_ago=0):
+		return {'_id': sequence, 'occurred_at': REFERENCE_TIME - timedelta(seconds=seconds_ago)}
+
+	def read(self, events, position=0):
+		return [event['_id'] for event in contiguous(events, position, now=REFERENCE_TIME)]
+
+	def test_numbered_uses_the_reserved_block(self):
+		events = [('created', 'a', {}), ('created', 'b', {}), ('deleted', 'a', {})]
+		documents = numbered(12, events)
+		self.assertEqual([document['_id'] for document in documents], [10, 11, 12])
+		self.assertEqual([document['report'] for document in documents], ['a', 'b', 'a'])
+
+	def test_contiguous_events_are_read(self):
+		self.assertEqual(self.read([self.event(4), self.event(5), self.event(6)], position=3), [4, 5, 6])
+
+	def test_a_fresh_hole_stops_the_read(self):
+		# 6 may still be committed by a slower writer
+		self.assertEqual(self.read([self.event(4), self.event(5), self.event(7)], position=3), [4, 5])
+		self.assertEqual(self.read([self.event(8, seconds_ago=59)], position=6), [])
+
+	def test_a_settled_hole_is_stepped_over(self):
+		events = [self.event(4, 300), self.event(6, 120), self.event(7, 90), self.event(9, 30), self.event(10)]
+		# 5 was reserved by a writer that never came back; 8 may still arrive
+		self.assertEqual(self.read(events, position=3), [4, 6, 7])
+
+	def test_updates_merge_per_document(self):
+		report = report_row(0, 'fire', 'active')
+		data = event_data(report)
+		events = numbered(3, [
+			('created', report['_id'], data),
+			('status_changed', report['_id'], dict(data, status='resolved', previous_status='active')),
+			('status_changed', report['_id'], dict(data, status='active', previous_status='resolved')),
+		])
+		updates = ReportCounts().updates(events)
+		self.assertEqual({update._filter['_id']: update._doc for update in updates}, {
+			'fire:active': {'$set': {'disaster_type': 'fire', 'status': 'active'}, '$inc': {'count': 1}},
+			'fire:resolved': {'$set': {'disaster_type': 'fire', 'status': 'resolved'}, '$inc': {'count': 0}},
+		})
+		self.assertTrue(all(update._upsert for update in updates))
+
+	def test_timeseries_counts_by_hour(self):
+		report = report_row(90, 'flood', 'active')
+		data = event_data(report)
+		events = numbered(2, [
+			('created', report['_id'], data),
+			('status_changed', report['_id'], dict(data, status='resolved', previous_status='active')),
+		])
+		events[1]['occurred_at'] = REFERENCE_TIME
+		store = {}
+		apply_updates(store, ReportTimeseries().updates(events))
+		self.assertEqual(store['2024-05-01T10:flood']['created'], 1)
+		self.assertEqual(store['2024-05-01T12:flood']['resolved'], 1)
+
+	def test_incremental_batches_fold_to_the_rebuild(self):
+		events = report_events(300)
+		for projection in PROJECTIONS.values():
+			rebuilt = {}
+			apply_updates(rebuilt, projection.updates(events))
+			for batch_size in (1, 7, 100):
+				folded = {}
+				for start in range(0, len(events), batch_size):
+					apply_updates(folded, projection.updates(events[start:start + batch_size]))
+				self.assertEqual(folded, rebuilt, f'{projection.name} in batches of {batch_size}')
+
+	def test_counts_match_the_reports(self):
+		events = report_events(300)
+		reports = {}
+		for event in events:
+			if event['kind'] == 'deleted':
+				del reports[event['report']]
+			else:
+				reports[event['report']] = event['data']
+		store = {}
+		apply_updates(store, ReportCounts().updates(events))
+		counts = Counter((data['disaster_type'], data['status']) for data in reports.values())
+		self.assertEqual(
+			{key: document['count'] for key, document in store.items() if document['count']},
+			{f'{disaster_type}:{status}': count for (disaster_type, status), count in counts.items()},
+		)
+		regions = {}
+		apply_updates(regions, RegionSummaries().updates(events))
+		located = [data for data in reports.values() if data['geohash']]
+		self.assertEqual(
+			sum(document.get('open', 0) + document.get('resolved', 0) for document in regions.values()),
+			len(located),
+		)
+
+
+@unittest.skipUnless(TEST_URI, 'set MONGODB_TEST_URI to run the MongoDB tests')
+@override_settings(EVENT_LOG_ENABLED=True)
+class ProjectionRebuildTests(SimpleTestCase):
+	"""The event log and projections against a real mongod: catching up in batches equals a rebuild."""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		mongoengine.disconnect_all()
+		mongoengine.connect(db=UNIT_TEST_DB, host=TEST_URI, alias=DEFAULT_CONNECTION_NAME, **connection_options())
+		cls.database = ReportEvent._get_collection().database
+		cls.database.client.drop_database(UNIT_TEST_DB)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.database.client.drop_database(UNIT_TEST_DB)
+		mongoengine.disconnect_all()
+		super().tearDownClass()
+
+	def read_collection(self, projection):
+		return sorted(self.database[projection.collection_name].find(), key=lambda document: document['_id'])
+
+	def test_catch_up_matches_a_rebuild(self):
+		events = [(event['kind'], event['report'], event['data']) for event in report_events(300)]
+		for start in range(0, len(events), 40):
+			self.assertEqual(len(append_events(events[start:start + 40])), len(events[start:start + 40]))
+			for projection in PROJECTIONS.values():
+				catch_up(projection, batch_size=7)
+		self.assertEqual(head_sequence(), len(events))
+		self.assertEqual(projection_lag(), {name: 0 for name in PROJECTIONS})
+
+		for projection in PROJECTIONS.values():
+			folded = self.read_collection(projection)
+			self.assertEqual(rebuild(projection, batch_size=50), len(events))
+			self.assertEqual(self.read_collection(projection), folded, projection.name)
+
+	def test_overlapping_runs_skip_and_checkpoints_never_regress(self):
+		projection = PROJECTIONS['counts']
+		name = checkpoint_name(projection)
+		with JobCheckpoint.lease(name) as lease:
+			self.assertIsNotNone(lease)
+			self.assertIsNone(JobCheckpoint.acquire(name))
+			self.assertIsNone(catch_up(projection))
+			self.assertIsNone(rebuild(projection))
+		# Released on exit; an expired lease can be taken over
+		token = JobCheckpoint.acquire(name, seconds=-1)
+		self.assertIsNotNone(token)
+		self.assertIsNotNone(JobCheckpoint.acquire(name))
+		self.assertFalse(JobCheckpoint.renew(name, token))
+
+		self.assertTrue(JobCheckpoint.advance('rebuild-tests', 10))
+		self.assertFalse(JobCheckpoint.advance('rebuild-tests', 4))
+		self.assertFalse(JobCheckpoint.advance('rebuild-tests', 10))
+		self.assertTrue(JobCheckpoint.advance('rebuild-tests', 11))
+		self.assertEqual(JobCheckpoint.position_of('rebuild-tests'), 11)
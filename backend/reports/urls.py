@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 app_name = 'reports'
 
@@ -8,18 +8,41 @@ urlpatterns = [
 	path('reports/', views.ReportsListView.as_view(), name='reports-list'),
 	path('reports/simple/', views.simple_reports_view, name='simple-reports'),
 	path('reports/create/', views.CreateReportView.as_view(), name='create-report'),
+	path('reports/search/', views.ReportSearchView.as_view(), name='report-search'),
+	path('reports/markers/', views.report_markers_view, name='report-markers'),
+	path('reports/batch/', views.ReportBatchView.as_view(), name='report-batch'),
 	path('reports/<str:id>/', views.ReportDetailView.as_view(), name='report-detail'),
 	path('reports/<str:id>/status/', views.UpdateReportStatusView.as_view(), name='update-report-status'),
 	
 	# AI and summary endpoints
 	path('ai/summary/', views.ai_summary_view, name='ai-summary'),
 	path('summary/', views.reports_summary_view, name='reports-summary'),
+	path('stats/', views.report_stats_view, name='report-stats'),
+	
+	# Geofence alert subscriptions and their inboxes
+	path('geofences/', views.geofences_view, name='geofences'),
+	path('geofences/inbox/', views.geofence_inbox_view, name='geofence-inbox'),
+	path('geofences/inbox/ack/', views.geofence_inbox_ack_view, name='geofence-inbox-ack'),
+	path('geofences/<str:id>/', views.geofence_detail_view, name='geofence-detail'),
 	
 	# Reporter management
 	path('reporter/id/', views.get_reporter_id_view, name='get-reporter-id'),
 	
 	# Health check
 	path('health/', views.health_check_view, name='health-check'),
+	path('health/ready/', views.readiness_view, name='readiness-check'),
+	path('health/profiling/', views.profiling_stats_view, name='profiling-stats'),
+	
+	# Archive of resolved reports
+	path('archive/reports/', views.ArchivedReportsListView.as_view(), name='archived-reports-list'),
+	
+	# Async counterparts for ASGI deployments (see reports/async_views.py)
+	path('async/reports/', async_views.reports_list_view, name='async-reports-list'),
+	path('async/reports/create/', async_views.create_report_view, name='async-create-report'),
+	path('async/reports/<str:id>/', async_views.report_detail_view, name='async-report-detail'),
+	path('async/reports/<str:id>/status/', async_views.update_report_status_view, name='async-update-report-status'),
+	path('async/ai/summary/', async_views.ai_summary_view, name='async-ai-summary'),
+	path('async/summary/', async_views.reports_summary_view, name='async-reports-summary'),
 	
 	# Cleanup endpoint
 	path('cleanup/resolved/', views.cleanup_resolved_reports_view, name='cleanup-resolved-reports'),
@@ -2,6 +2,7 @@
 Utility functions for reporter identification and session management.
 """
 import hashlib
+import math
 import uuid
 from django.utils import timezone
 from datetime import timedelta
@@ -32,6 +33,26 @@ def generate_reporter_id(request):
     
     return reporter_id
 
+def fingerprint_reporter_id(request):
+    """
+    Generate a consistent reporter ID from browser characteristics and IP.
+    Used by report creation and the reporter ID endpoint so both agree.
+    """
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    
+    # Get IP address (for additional uniqueness)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0].strip()
+    else:
+        ip = request.META.get('REMOTE_ADDR', '')
+    
+    fingerprint_data = f"{user_agent}|{accept_language}|{accept_encoding}|{ip}"
+    fingerprint_hash = hashlib.md5(fingerprint_data.encode()).hexdigest()[:12]
+    return f"reporter_{fingerprint_hash}"
+
 def get_or_create_session_reporter(request):
     """
     Get or create a session-based reporter ID.
@@ -66,3 +87,36 @@ def validate_reporter_id(reporter_id):
     # Check if it starts with 'reporter_' or 'anonymous_'
     valid_prefixes = ['reporter_', 'anonymous_']
     return any(reporter_id.startswith(prefix) for prefix in valid_prefixes)
+
+# Mean radius of the earth
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points on Earth (in kilometers).
+    """
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    
+    return c * EARTH_RADIUS_KM
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Return (lat_min, lat_max, lng_min, lng_max) enclosing a radius around a point.
+    Used to prefilter on the (latitude, longitude) index before the haversine.
+    """
+    lat_delta = radius_km / 111.0
+    cos_lat = math.cos(math.radians(lat))
+    lng_delta = radius_km / (111.0 * cos_lat) if cos_lat > 1e-6 else 360.0
+    lng_min, lng_max = lng - lng_delta, lng + lng_delta
+    # Near the poles or across the antimeridian, keep every longitude
+    if lng_min < -180 or lng_max > 180:
+        lng_min, lng_max = -180.0, 180.0
+    return lat - lat_delta, lat + lat_delta, lng_min, lng_max
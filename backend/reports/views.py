@@ -1,16 +1,19 @@
-import math
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.http import JsonResponse
 from django.utils import timezone
 from django.core.management import call_command
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.generics import ListAPIView, RetrieveAPIView, CreateAPIView, UpdateAPIView
+from rest_framework.generics import GenericAPIView, ListAPIView, RetrieveAPIView, CreateAPIView, UpdateAPIView
 from mongoengine import Q
-from .models import DisasterReport
+from disaster_response.mongodb import ensure_connection
+from disaster_response.metrics import time_outbound
+from disaster_response.profiling import profile_stats
+from .models import DisasterReport, GeofenceSubscription
 from .serializers import (
 	DisasterReportSerializer,
 	CreateDisasterReportSerializer,
@@ -18,25 +21,56 @@ from .serializers import (
 	AISummarySerializer,
 	ReportsResponseSerializer,
 	CreateReportResponseSerializer,
+	ArchivedReportSerializer,
+	ReportSearchResultSerializer,
+	GeofenceSubscriptionSerializer,
+	GeofenceAlertSerializer,
 )
-from .utils import get_anonymous_reporter_id, validate_reporter_id
+from .utils import get_anonymous_reporter_id, validate_reporter_id, fingerprint_reporter_id
+from .snapshot import SnapshotResults, get_snapshot, reports_changed
+from .retention import retention_report
+from .archive import archive_store, sweep_resolved_reports
+from .health import get_health
+from .geofences import acknowledge, deliver_alerts, inbox
+from .events import report_created, report_status_changed
+from .projections import projection_lag, read_model
+from .fieldsets import SEARCH_FIELD_SOURCES, SparseFieldsetMixin, mongo_projection
+from .markers import marker_limit, mongo_markers, snapshot_markers
+from .renderers import MARKER_RENDERERS
+from .routing import collection_for, reports_for
+from .facets import (
+	FacetedResults,
+	area_counts_pipeline,
+	area_filters,
+	datetime_param,
+	facet_counts,
+	list_param,
+	parse_area_counts,
+	parse_facet_filters,
+	parse_sort,
+)
+from .search import MAX_QUERY_LENGTH, RadiusSearchResults, highlight_pattern, search_terms, text_search
 import requests
 import json
 
 
-def generate_ai_summary(summary_counts, reports_data):
+# Hugging Face Inference API (free tier)
+AI_SUMMARY_API_URL = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
+AI_SUMMARY_HEADERS = {"Authorization": "Bearer hf_demo"}  # Free tier, no auth needed for basic usage
+AI_SUMMARY_TIMEOUT = 10
+
+
+def build_ai_summary_prompt(summary_counts, reports_data):
 	"""
-	Generate AI-powered summary using Hugging Face Inference API.
+	Build the prompt for AI analysis of the last 24 hours of reports.
 	"""
-	try:
-		# Prepare the prompt for AI analysis
-		disaster_types = []
-		for disaster_type, count in summary_counts.items():
-			if count > 0:
-				disaster_types.append(f"{count} {disaster_type}")
-		
-		# Create a detailed prompt for the AI
-		prompt = f"""
+	disaster_types = []
+	for disaster_type, count in summary_counts.items():
+		if count > 0:
+			disaster_types.append(f"{count} {disaster_type}")
+	
+	# Create a detailed prompt for the AI
+	return f"""
 		Analyze the following disaster reports from the last 24 hours and provide a comprehensive summary with safety recommendations:
 		
 		Report Summary: {', '.join(disaster_types) if disaster_types else 'No reports'}
@@ -52,31 +86,53 @@ def generate_ai_summary(summary_counts, reports_data):
 		
 		Keep the response concise, professional, and actionable. Focus on public safety.
 		"""
-		
-		# Use Hugging Face Inference API (free tier)
-		api_url = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
-		headers = {"Authorization": "Bearer hf_demo"}  # Free tier, no auth needed for basic usage
-		
-		payload = {
-			"inputs": prompt,
-			"parameters": {
-				"max_length": 200,
-				"temperature": 0.7,
-				"do_sample": True
-			}
+
+
+def ai_summary_payload(prompt):
+	return {
+		"inputs": prompt,
+		"parameters": {
+			"max_length": 200,
+			"temperature": 0.7,
+			"do_sample": True
 		}
-		
-		response = requests.post(api_url, headers=headers, json=payload, timeout=10)
+	}
+
+
+def parse_ai_summary(prompt, result):
+	"""
+	Extract the generated summary from an inference API result, or None.
+	"""
+	if isinstance(result, list) and len(result) > 0:
+		ai_text = result[0].get('generated_text', '')
+		# Clean up the response
+		if ai_text:
+			# Remove the original prompt from the response
+			ai_text = ai_text.replace(prompt, '').strip()
+			return ai_text[:300] + "..." if len(ai_text) > 300 else ai_text
+	return None
+
+
+def generate_ai_summary(summary_counts, reports_data):
+	"""
+	Generate AI-powered summary using Hugging Face Inference API.
+	"""
+	try:
+		prompt = build_ai_summary_prompt(summary_counts, reports_data)
+		with time_outbound('ai-summary') as call:
+			response = requests.post(
+				AI_SUMMARY_API_URL,
+				headers=AI_SUMMARY_HEADERS,
+				json=ai_summary_payload(prompt),
+				timeout=AI_SUMMARY_TIMEOUT,
+			)
+			if response.status_code != 200:
+				call.mark_failed()
 		
 		if response.status_code == 200:
-			result = response.json()
-			if isinstance(result, list) and len(result) > 0:
-				ai_text = result[0].get('generated_text', '')
-				# Clean up the response
-				if ai_text:
-					# Remove the original prompt from the response
-					ai_text = ai_text.replace(prompt, '').strip()
-					return ai_text[:300] + "..." if len(ai_text) > 300 else ai_text
+			summary = parse_ai_summary(prompt, response.json())
+			if summary:
+				return summary
 		
 		# Fallback to rule-based summary if AI fails
 		return generate_fallback_summary(summary_counts, reports_data)
@@ -140,22 +196,16 @@ def generate_fallback_summary(summary_counts, reports_data):
 	return " ".join(summary_parts)
 
 
-def haversine_distance(lat1, lon1, lat2, lon2):
+def summary_counts_by_type(type_counts):
 	"""
-	Calculate the great circle distance between two points on Earth (in kilometers).
+	Map per-type counts onto the plural keys used by the summary responses.
 	"""
-	# Convert decimal degrees to radians
-	lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-	
-	# Haversine formula
-	dlat = lat2 - lat1
-	dlon = lon2 - lon1
-	a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-	c = 2 * math.asin(math.sqrt(a))
-	
-	# Radius of earth in kilometers
-	r = 6371
-	return c * r
+	return {
+		'floods': type_counts.get('flood', 0),
+		'fires': type_counts.get('fire', 0),
+		'accidents': type_counts.get('accident', 0),
+		'collapses': type_counts.get('collapse', 0),
+	}
 
 
 class CustomPagination(PageNumberPagination):
@@ -164,51 +214,62 @@ class CustomPagination(PageNumberPagination):
 	max_page_size = 100
 
 
-class ReportsListView(ListAPIView):
+class ReportsListView(SparseFieldsetMixin, ListAPIView):
 	"""
-	API view to list disaster reports with optional location filtering.
+	API view to list disaster reports, newest first or, with sort=priority,
+	by priority (see reports/priority.py).
+	
+	Filters: type and status (comma separated or repeated), since/until
+	(ISO 8601), lat/lng/radius (km) and bbox=min_lng,min_lat,max_lng,max_lat.
+	The response carries per-type and per-status facet counts for the other
+	filters (see reports/facets.py). fields= and compat= shape the results
+	(see reports/fieldsets.py).
 	"""
 	serializer_class = DisasterReportSerializer
 	pagination_class = CustomPagination
 	permission_classes = [AllowAny]
 	
-	def get_queryset(self):
+	def get_snapshot_queryset(self, snapshot, filters, sort):
+		"""Filter, order and count from the shared snapshot; only the page is read from MongoDB."""
+		rows, type_counts, status_counts = snapshot.filter(
+			types=filters.types,
+			statuses=filters.statuses,
+			since=filters.since,
+			until=filters.until,
+			circle=filters.circle,
+			bbox=filters.bbox,
+			sort=sort,
+		)
+		return SnapshotResults(
+			snapshot, rows,
+			queryset=self.project(reports_for('reports-list')),
+			facets=facet_counts(type_counts, status_counts),
+		)
+	
+	def get_page_bounds(self):
+		"""Return (offset, limit) of the requested page, so it can be fetched with the facets."""
+		page_size = self.paginator.get_page_size(self.request)
 		try:
-			# Test MongoDB connection first
-			DisasterReport.objects.count()  # Simple connection test
-			queryset = DisasterReport.objects.all()
-			
-			# Get query parameters
-			lat = self.request.query_params.get('lat')
-			lng = self.request.query_params.get('lng')
-			radius = float(self.request.query_params.get('radius', 10))  # Default 10km
-			
-			# If lat/lng provided, filter by radius
-			if lat and lng:
-				try:
-					lat = float(lat)
-					lng = float(lng)
-					
-					# Filter reports within radius
-					filtered_reports = []
-					for report in queryset:
-						distance = haversine_distance(lat, lng, report.latitude, report.longitude)
-						if distance <= radius:
-							filtered_reports.append(report)
-					
-					# Return filtered reports as a list (MongoEngine doesn't support id__in with ObjectIds)
-					return filtered_reports
-					
-				except (ValueError, TypeError):
-					# If invalid coordinates, return all reports
-					pass
-			
-			return queryset
-		except Exception as e:
-			# Log the error and return empty queryset
-			print(f"Error in ReportsListView.get_queryset(): {e}")
-			# Return empty list instead of queryset to avoid further DB calls
-			return []
+			page = max(int(self.request.query_params.get(self.paginator.page_query_param, 1)), 1)
+		except ValueError:
+			page = 1
+		return (page - 1) * page_size, page_size
+	
+	def get_queryset(self):
+		filters = parse_facet_filters(self.request.query_params)
+		sort = parse_sort(self.request.query_params)
+		snapshot = get_snapshot()
+		if snapshot is not None:
+			self.results = self.get_snapshot_queryset(snapshot, filters, sort)
+		else:
+			# One $facet aggregation returns the page, the total and the facet counts
+			offset, limit = self.get_page_bounds()
+			self.results = FacetedResults(
+				collection_for('reports-list'), filters, offset, limit,
+				projection=mongo_projection(self.get_fieldset()),
+				sort=sort,
+			)
+		return self.results
 	
 	def list(self, request, *args, **kwargs):
 		"""Override list method to handle errors gracefully and return proper format."""
@@ -225,7 +286,13 @@ class ReportsListView(ListAPIView):
 						'next': None,
 						'previous': None
 					}
+				response.data['facets'] = self.results.facets
 			return response
+		except ValueError as e:
+			return Response(
+				{'results': [], 'count': 0, 'next': None, 'previous': None, 'error': f'Invalid filter: {e}'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
 		except Exception as e:
 			print(f"Error in ReportsListView.list(): {e}")
 			return Response(
@@ -240,9 +307,114 @@ class ReportsListView(ListAPIView):
 			)
 
 
-class ReportDetailView(RetrieveAPIView):
+def parse_list_param(request, name):
+	"""Read a multi-value query parameter given as repeats and/or comma lists."""
+	return list_param(request.query_params, name)
+
+
+class ArchivedReportsListView(ListAPIView):
+	"""
+	API view to query archived (resolved and deleted) reports.
+	Served from memory-mapped archive segments; never queries MongoDB.
+	
+	Filters: since, until (ISO 8601), bbox=min_lng,min_lat,max_lng,max_lat,
+	lat/lng/radius (km), type and status (comma separated or repeated).
+	"""
+	serializer_class = ArchivedReportSerializer
+	pagination_class = CustomPagination
+	permission_classes = [AllowAny]
+	
+	def get_queryset(self):
+		params = self.request.query_params
+		
+		bbox = None
+		if params.get('bbox'):
+			bbox = tuple(float(value) for value in params['bbox'].split(','))
+			if len(bbox) != 4:
+				raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+		
+		circle = None
+		if params.get('lat') and params.get('lng'):
+			circle = (float(params['lat']), float(params['lng']), float(params.get('radius', 10)))
+		
+		return archive_store.query(
+			since=datetime_param(params.get('since')),
+			until=datetime_param(params.get('until')),
+			bbox=bbox,
+			circle=circle,
+			types=parse_list_param(self.request, 'type'),
+			statuses=parse_list_param(self.request, 'status'),
+		)
+	
+	def list(self, request, *args, **kwargs):
+		try:
+			return super().list(request, *args, **kwargs)
+		except ValueError as e:
+			return Response(
+				{'results': [], 'count': 0, 'next': None, 'previous': None, 'error': f'Invalid filter: {e}'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+
+
+class ReportSearchView(SparseFieldsetMixin, ListAPIView):
+	"""
+	API view for relevance-ranked full-text search over reports.
+	
+	Query: q (MongoDB $search syntax: words, "phrases", -negations).
+	Filters: type and status (comma separated or repeated), lat/lng/radius (km).
+	Served by the text index; results carry a score and highlight offsets.
+	fields= and compat= shape the results (see reports/fieldsets.py).
+	"""
+	serializer_class = ReportSearchResultSerializer
+	pagination_class = CustomPagination
+	permission_classes = [AllowAny]
+	field_sources = SEARCH_FIELD_SOURCES
+	
+	def get_query(self):
+		query = self.request.query_params.get('q', '').strip()
+		if not query:
+			raise ValueError('q is required')
+		if len(query) > MAX_QUERY_LENGTH:
+			raise ValueError(f'q must be at most {MAX_QUERY_LENGTH} characters')
+		return query
+	
+	def get_queryset(self):
+		params = self.request.query_params
+		circle = None
+		if params.get('lat') and params.get('lng'):
+			circle = (float(params['lat']), float(params['lng']), float(params.get('radius', 10)))
+		
+		reports = text_search(
+			reports_for('report-search'),
+			self.get_query(),
+			types=parse_list_param(self.request, 'type'),
+			statuses=parse_list_param(self.request, 'status'),
+			circle=circle,
+		)
+		if circle:
+			# The id scan reads coordinates only; the projection applies to the page
+			return RadiusSearchResults(reports, circle, page_reports=self.project(reports))
+		return self.project(reports)
+	
+	def get_serializer_context(self):
+		context = super().get_serializer_context()
+		context['highlight'] = highlight_pattern(search_terms(self.request.query_params.get('q', '')))
+		return context
+	
+	def list(self, request, *args, **kwargs):
+		try:
+			return super().list(request, *args, **kwargs)
+		except ValueError as e:
+			return Response(
+				{'results': [], 'count': 0, 'next': None, 'previous': None, 'error': f'Invalid search: {e}'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+
+
+class ReportDetailView(SparseFieldsetMixin, RetrieveAPIView):
 	"""
 	API view to retrieve a single disaster report.
+	fields= and compat= shape the response (see reports/fieldsets.py).
 	"""
 	serializer_class = DisasterReportSerializer
 	permission_classes = [AllowAny]
@@ -253,10 +425,85 @@ class ReportDetailView(RetrieveAPIView):
 		obj_id = self.kwargs.get(self.lookup_field)
 		try:
 			from bson import ObjectId
-			return DisasterReport.objects.get(id=ObjectId(obj_id))
+			return self.project(reports_for('report-detail')).get(id=ObjectId(obj_id))
 		except:
 			from django.http import Http404
 			raise Http404("Report not found")
+	
+	def retrieve(self, request, *args, **kwargs):
+		try:
+			self.get_fieldset()
+		except ValueError as e:
+			return Response({'error': f'Invalid fields: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+		return super().retrieve(request, *args, **kwargs)
+
+
+class ReportBatchView(SparseFieldsetMixin, GenericAPIView):
+	"""
+	API view to retrieve several reports with one $in query.
+	
+	GET ?ids=a,b,c (comma separated or repeated) or POST {"ids": [...]} for
+	long lists, up to MAX_BATCH_IDS. Results follow the request order; ids
+	that are not ObjectIds are listed under 'invalid' and ids with no report
+	under 'missing'. fields= and compat= shape the results.
+	"""
+	serializer_class = DisasterReportSerializer
+	permission_classes = [AllowAny]
+	
+	MAX_BATCH_IDS = 300
+	
+	def get(self, request, *args, **kwargs):
+		return self.batch(list_param(request.query_params, 'ids'))
+	
+	def post(self, request, *args, **kwargs):
+		ids = request.data.get('ids') if isinstance(request.data, dict) else None
+		if not isinstance(ids, list):
+			return Response({'error': 'ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+		return self.batch([str(value) for value in ids])
+	
+	def batch(self, ids):
+		from bson import ObjectId
+		from bson.errors import InvalidId
+		
+		# Repeated ids are returned once
+		ids = list(dict.fromkeys(ids))
+		if not ids:
+			return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+		if len(ids) > self.MAX_BATCH_IDS:
+			return Response(
+				{'error': f'At most {self.MAX_BATCH_IDS} ids per request'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+		try:
+			self.get_fieldset()
+		except ValueError as e:
+			return Response({'error': f'Invalid fields: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+		
+		object_ids, invalid = [], []
+		for value in ids:
+			try:
+				object_ids.append(ObjectId(value))
+			except (InvalidId, TypeError):
+				invalid.append(value)
+		
+		try:
+			reports = {}
+			if object_ids:
+				reports = {
+					report.id: report
+					for report in self.project(reports_for('report-batch'))(id__in=object_ids)
+				}
+		except Exception as e:
+			print(f"Error in ReportBatchView: {e}")
+			return Response({'error': 'Failed to fetch reports'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+		
+		found = [reports[object_id] for object_id in object_ids if object_id in reports]
+		return Response({
+			'results': self.get_serializer(found, many=True).data,
+			'count': len(found),
+			'missing': [str(object_id) for object_id in object_ids if object_id not in reports],
+			'invalid': invalid,
+		})
 
 
 class CreateReportView(CreateAPIView):
@@ -269,27 +516,7 @@ class CreateReportView(CreateAPIView):
 	def create(self, request, *args, **kwargs):
 		# Generate reporter ID using browser fingerprinting (same as get_reporter_id_view)
 		try:
-			import hashlib
-			
-			# Get request characteristics for fingerprinting
-			user_agent = request.META.get('HTTP_USER_AGENT', '')
-			accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
-			accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
-			
-			# Get IP address (for additional uniqueness)
-			x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-			if x_forwarded_for:
-				ip = x_forwarded_for.split(',')[0].strip()
-			else:
-				ip = request.META.get('REMOTE_ADDR', '')
-			
-			# Create a fingerprint from browser characteristics
-			fingerprint_data = f"{user_agent}|{accept_language}|{accept_encoding}|{ip}"
-			fingerprint_hash = hashlib.md5(fingerprint_data.encode()).hexdigest()[:12]
-			
-			# Create consistent reporter ID
-			reporter_id = f"reporter_{fingerprint_hash}"
-			
+			reporter_id = fingerprint_reporter_id(request)
 		except Exception as e:
 			print(f"Error generating reporter ID in create: {e}")
 			# Fallback to UUID
@@ -303,6 +530,10 @@ class CreateReportView(CreateAPIView):
 		serializer = self.get_serializer(data=data)
 		if serializer.is_valid():
 			report = serializer.save()
+			reports_changed()
+			document = report.to_mongo().to_dict()
+			report_created(document)
+			deliver_alerts(document)
 			response_serializer = DisasterReportSerializer(report)
 			
 			response_data = {
@@ -335,6 +566,7 @@ class UpdateReportStatusView(UpdateAPIView):
 		obj_id = self.kwargs.get(self.lookup_field)
 		try:
 			from bson import ObjectId
+			# Always from the primary: the response must reflect this write
 			return DisasterReport.objects.get(id=ObjectId(obj_id))
 		except:
 			from django.http import Http404
@@ -364,7 +596,10 @@ class UpdateReportStatusView(UpdateAPIView):
 		serializer = self.get_serializer(instance, data=request.data, partial=partial)
 		
 		if serializer.is_valid():
+			previous_status = instance.status
 			serializer.save()
+			reports_changed()
+			report_status_changed(instance.to_mongo().to_dict(), previous_status)
 			# Return the updated report data
 			response_serializer = DisasterReportSerializer(instance)
 			return Response({
@@ -388,15 +623,22 @@ def ai_summary_view(request):
 	try:
 		# Get reports from last 24 hours
 		last_24_hours = timezone.now() - timedelta(hours=24)
-		recent_reports = DisasterReport.objects(created_at__gte=last_24_hours)
-		
-		# Count by disaster type
-		summary_counts = {
-			'floods': recent_reports(disaster_type='flood').count(),
-			'fires': recent_reports(disaster_type='fire').count(),
-			'accidents': recent_reports(disaster_type='accident').count(),
-			'collapses': recent_reports(disaster_type='collapse').count(),
-		}
+		snapshot = get_snapshot()
+		
+		if snapshot is not None:
+			# Served from the shared snapshot without touching MongoDB
+			recent_count = snapshot.created_since(last_24_hours)
+			summary_counts = summary_counts_by_type(snapshot.count_by_type(recent_count))
+		else:
+			recent_reports = reports_for('ai-summary')(created_at__gte=last_24_hours)
+			
+			# Count by disaster type
+			summary_counts = {
+				'floods': recent_reports(disaster_type='flood').count(),
+				'fires': recent_reports(disaster_type='fire').count(),
+				'accidents': recent_reports(disaster_type='accident').count(),
+				'collapses': recent_reports(disaster_type='collapse').count(),
+			}
 		
 		total_reports = sum(summary_counts.values())
 		
@@ -406,13 +648,22 @@ def ai_summary_view(request):
 		else:
 			# Prepare data for AI analysis
 			reports_data = []
-			for report in recent_reports:
-				reports_data.append({
-					'type': report.disaster_type,
-					'description': report.description,
-					'status': report.status,
-					'location': f"{report.latitude:.4f}, {report.longitude:.4f}"
-				})
+			if snapshot is not None:
+				for index in range(recent_count):
+					reports_data.append({
+						'type': snapshot.type_at(index),
+						'description': snapshot.description_at(index),
+						'status': snapshot.status_at(index),
+						'location': f"{snapshot.latitude[index]:.4f}, {snapshot.longitude[index]:.4f}"
+					})
+			else:
+				for report in recent_reports:
+					reports_data.append({
+						'type': report.disaster_type,
+						'description': report.description,
+						'status': report.status,
+						'location': f"{report.latitude:.4f}, {report.longitude:.4f}"
+					})
 			
 			# Generate AI summary using Hugging Face
 			summary_text = generate_ai_summary(summary_counts, reports_data)
@@ -432,7 +683,7 @@ def ai_summary_view(request):
 		# Fallback to basic summary if AI fails
 		try:
 			last_24_hours = timezone.now() - timedelta(hours=24)
-			recent_reports = DisasterReport.objects(created_at__gte=last_24_hours)
+			recent_reports = reports_for('ai-summary')(created_at__gte=last_24_hours)
 			
 			summary_counts = {
 				'floods': recent_reports(disaster_type='flood').count(),
@@ -475,26 +726,7 @@ def get_reporter_id_view(request):
 	This approach doesn't rely on sessions and generates consistent IDs.
 	"""
 	try:
-		import hashlib
-		
-		# Get request characteristics for fingerprinting
-		user_agent = request.META.get('HTTP_USER_AGENT', '')
-		accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
-		accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
-		
-		# Get IP address (for additional uniqueness)
-		x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-		if x_forwarded_for:
-			ip = x_forwarded_for.split(',')[0].strip()
-		else:
-			ip = request.META.get('REMOTE_ADDR', '')
-		
-		# Create a fingerprint from browser characteristics
-		fingerprint_data = f"{user_agent}|{accept_language}|{accept_encoding}|{ip}"
-		fingerprint_hash = hashlib.md5(fingerprint_data.encode()).hexdigest()[:12]
-		
-		# Create consistent reporter ID
-		reporter_id = f"reporter_{fingerprint_hash}"
+		reporter_id = fingerprint_reporter_id(request)
 		
 		return Response({
 			'reporter_id': reporter_id,
@@ -520,14 +752,66 @@ def get_reporter_id_view(request):
 def health_check_view(request):
 	"""
 	Simple health check endpoint.
+	Also reports MongoDB readiness, established once per process.
+	With ?deep=1 it runs the full (cached) checks and returns 503 when not ready.
 	"""
+	if request.query_params.get('deep') in ('1', 'true', 'yes'):
+		health = get_health()
+		return JsonResponse(
+			health,
+			status=status.HTTP_200_OK if health['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+		)
+	
+	readiness = ensure_connection()
 	return JsonResponse({
 		'status': 'healthy',
 		'timestamp': timezone.now().isoformat(),
-		'service': 'Disaster Response API'
+		'service': 'Disaster Response API',
+		'database': {
+			'state': readiness['state'],
+			'error': readiness['error'],
+			'ping_ms': readiness['ping_ms'],
+		},
 	})
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def readiness_view(request):
+	"""
+	Readiness probe for load balancers: 503 unless MongoDB answers within
+	MONGODB_HEALTH_TIMEOUT_MS and the connection pool is not exhausted.
+	"""
+	health = get_health()
+	return JsonResponse(
+		{
+			'ready': health['ready'],
+			'status': health['status'],
+			'timestamp': health['timestamp'],
+			'database': {
+				'ok': health['database']['ok'],
+				'latency_ms': health['database']['latency_ms'],
+				'error': health['database']['error'],
+				'pool_exhausted': health['database']['pool']['exhausted'],
+			},
+		},
+		status=status.HTTP_200_OK if health['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+	)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def profiling_stats_view(request):
+	"""
+	Per-view MongoDB command statistics for sampled requests in this worker.
+	DELETE resets them.
+	"""
+	if request.method == 'DELETE':
+		profile_stats.reset()
+		return Response(status=status.HTTP_204_NO_CONTENT)
+	return Response(profile_stats.snapshot(), status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def simple_reports_view(request):
@@ -536,7 +820,7 @@ def simple_reports_view(request):
 	"""
 	try:
 		# Get all reports
-		reports = DisasterReport.objects.all()[:50]  # Limit to 50 reports
+		reports = reports_for('simple-reports').all()[:50]  # Limit to 50 reports
 		
 		# Serialize the reports
 		serializer = DisasterReportSerializer(reports, many=True)
@@ -562,33 +846,87 @@ def simple_reports_view(request):
 		)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes(MARKER_RENDERERS)
+def report_markers_view(request):
+	"""
+	Map markers as parallel arrays (id, type, status, lat, lng), newest first.
+	Takes the feed filters and limit (at most MAX_MARKERS); JSON by default,
+	MessagePack with Accept: application/msgpack. See reports/markers.py.
+	"""
+	try:
+		filters = parse_facet_filters(request.query_params)
+		limit = marker_limit(request.query_params)
+	except ValueError as e:
+		return Response({'error': f'Invalid filter: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+	
+	try:
+		snapshot = get_snapshot()
+		if snapshot is not None:
+			markers = snapshot_markers(snapshot, filters, limit)
+		else:
+			markers = mongo_markers(collection_for('report-markers'), filters, limit)
+		return Response(markers)
+	except Exception as e:
+		print(f"Error in report_markers_view: {e}")
+		return Response({'error': 'Failed to fetch markers'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def reports_summary_view(request):
 	"""
 	API view to get a summary of all reports (alternative to AI summary).
+	Optionally limited to an area with lat/lng/radius (km) or
+	bbox=min_lng,min_lat,max_lng,max_lat; without the snapshot only the
+	region partitions overlapping the area are read.
 	"""
 	try:
-		# Get all reports
-		all_reports = DisasterReport.objects.all()
-		
-		# Count by disaster type
-		summary_counts = {
-			'floods': all_reports(disaster_type='flood').count(),
-			'fires': all_reports(disaster_type='fire').count(),
-			'accidents': all_reports(disaster_type='accident').count(),
-			'collapses': all_reports(disaster_type='collapse').count(),
-		}
+		area = area_filters(request.query_params)
+	except ValueError as e:
+		return Response({'error': f'Invalid filter: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+	
+	try:
+		snapshot = get_snapshot()
 		
-		# Count by status
-		status_counts = {
-			'active': all_reports(status='active').count(),
-			'resolved': all_reports(status='resolved').count(),
-			'investigating': all_reports(status='investigating').count(),
-		}
+		if area.circle or area.bbox:
+			if snapshot is not None:
+				_, type_counts, status_counts = snapshot.filter(circle=area.circle, bbox=area.bbox)
+			else:
+				result = next(collection_for('reports-summary').aggregate(area_counts_pipeline(area)))
+				type_counts, status_counts = parse_area_counts(result)
+			counts = facet_counts(type_counts, status_counts)
+			summary_counts = summary_counts_by_type(counts['type'])
+			status_counts = counts['status']
+			total_reports = sum(status_counts.values())
+		elif snapshot is not None:
+			# Served from the shared snapshot without touching MongoDB
+			summary_counts = summary_counts_by_type(snapshot.count_by_type())
+			status_counts = snapshot.count_by_status()
+			total_reports = len(snapshot)
+		else:
+			# Get all reports
+			all_reports = reports_for('reports-summary').all()
+			
+			# Count by disaster type
+			summary_counts = {
+				'floods': all_reports(disaster_type='flood').count(),
+				'fires': all_reports(disaster_type='fire').count(),
+				'accidents': all_reports(disaster_type='accident').count(),
+				'collapses': all_reports(disaster_type='collapse').count(),
+			}
+			
+			# Count by status
+			status_counts = {
+				'active': all_reports(status='active').count(),
+				'resolved': all_reports(status='resolved').count(),
+				'investigating': all_reports(status='investigating').count(),
+			}
+			total_reports = all_reports.count()
 		
 		response_data = {
-			'total_reports': all_reports.count(),
+			'total_reports': total_reports,
 			'by_type': summary_counts,
 			'by_status': status_counts,
 			'last_updated': timezone.now().isoformat(),
@@ -607,49 +945,184 @@ def reports_summary_view(request):
 @permission_classes([AllowAny])
 def cleanup_resolved_reports_view(request):
 	"""
-	API endpoint to manually trigger cleanup of resolved reports.
-	Deletes resolved reports that have been resolved for more than 10 minutes.
+	API endpoint to check expiry of resolved reports.
+	Resolved reports are deleted by a MongoDB TTL index once they have been
+	resolved for RESOLVED_REPORT_RETENTION_MINUTES; this only reports on it.
+	With REPORT_ARCHIVE_ENABLED, due reports are archived and deleted in batches.
 	"""
 	try:
-		# Calculate the cutoff time (10 minutes ago)
-		cutoff_time = timezone.now() - timedelta(minutes=10)
-		
-		# Find resolved reports that were updated more than 10 minutes ago
-		resolved_reports = DisasterReport.objects.filter(
-			status='resolved',
-			updated_at__lt=cutoff_time
-		)
-		
-		count = resolved_reports.count()
-		
-		if count == 0:
+		if settings.REPORT_ARCHIVE_ENABLED:
+			result = sweep_resolved_reports()
+			if result['deleted_count']:
+				reports_changed()
+			
+			# Counts and segment names only, never the archived documents
 			return Response({
 				'success': True,
-				'message': 'No resolved reports found to delete.',
-				'deleted_count': 0
+				'message': (
+					'Another archive sweep is running; nothing archived.'
+					if result['skipped'] else
+					f"Successfully archived {result['archived_count']} resolved reports."
+				),
+				'skipped': result['skipped'],
+				'archived_count': result['archived_count'],
+				'deleted_count': result['deleted_count'],
+				'batches': result['batches'],
+				'segments': result['segments'],
 			}, status=status.HTTP_200_OK)
 		
-		# Log the reports being deleted
-		deleted_reports = []
-		for report in resolved_reports:
-			deleted_reports.append({
-				'id': str(report.id),
-				'type': report.disaster_type,
-				'resolved_at': report.updated_at.isoformat()
-			})
-		
-		# Delete the reports
-		deleted_count = resolved_reports.delete()
+		report = retention_report()
 		
 		return Response({
 			'success': True,
-			'message': f'Successfully deleted {deleted_count} resolved reports.',
-			'deleted_count': deleted_count,
-			'deleted_reports': deleted_reports
+			'message': (
+				f"{report['pending_expiry']} resolved reports awaiting TTL expiry."
+				if report['healthy'] else
+				'Resolved report expiry needs attention.'
+			),
+			'deleted_count': 0,
+			**report,
 		}, status=status.HTTP_200_OK)
 		
 	except Exception as e:
 		return Response({
 			'success': False,
-			'error': f'Failed to cleanup resolved reports: {str(e)}'
-		}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+			'error': f'Failed to check resolved reports: {str(e)}'
+		}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+MAX_INBOX_ALERTS = 200
+
+
+def subscriber_param(value):
+	"""Return a valid subscriber ID from a request value, or None."""
+	return value if isinstance(value, str) and validate_reporter_id(value) else None
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+def geofences_view(request):
+	"""
+	GET ?subscriber_id= lists a subscriber's geofences. POST registers one:
+	{"subscriber_id", "lat", "lng", "radius_km"} or {"subscriber_id",
+	"polygon": [[lng, lat], ...]}, with optional "types". New reports inside
+	it are delivered to the subscriber's inbox (see reports/geofences.py).
+	"""
+	from mongoengine.errors import OperationError
+	
+	if request.method == 'GET':
+		subscriber_id = subscriber_param(request.query_params.get('subscriber_id'))
+		if subscriber_id is None:
+			return Response({'error': 'A valid subscriber_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+		subscriptions = GeofenceSubscription.objects(subscriber_id=subscriber_id).order_by('created_at')
+		return Response({'results': GeofenceSubscriptionSerializer(subscriptions, many=True).data})
+	
+	serializer = GeofenceSubscriptionSerializer(data=request.data)
+	if not serializer.is_valid():
+		return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+	
+	subscriber_id = serializer.validated_data['subscriber_id']
+	if GeofenceSubscription.objects(subscriber_id=subscriber_id).count() >= settings.GEOFENCE_MAX_PER_SUBSCRIBER:
+		return Response(
+			{'success': False, 'error': f'At most {settings.GEOFENCE_MAX_PER_SUBSCRIBER} geofences per subscriber'},
+			status=status.HTTP_400_BAD_REQUEST
+		)
+	try:
+		subscription = serializer.save()
+	except OperationError as e:
+		# The 2dsphere index rejects self-intersecting or degenerate polygons
+		print(f"Invalid geofence area: {e}")
+		return Response({'success': False, 'error': 'Invalid geofence area'}, status=status.HTTP_400_BAD_REQUEST)
+	return Response(
+		{'success': True, 'geofence': GeofenceSubscriptionSerializer(subscription).data},
+		status=status.HTTP_201_CREATED
+	)
+
+
+@api_view(['DELETE'])
+@permission_classes([AllowAny])
+def geofence_detail_view(request, id):
+	"""Remove a geofence (?subscriber_id= must own it) and its pending alerts."""
+	from bson import ObjectId
+	from bson.errors import InvalidId
+	from .models import GeofenceAlert
+	
+	subscriber_id = subscriber_param(request.query_params.get('subscriber_id'))
+	if subscriber_id is None:
+		return Response({'error': 'A valid subscriber_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+	try:
+		subscription_id = ObjectId(id)
+	except (InvalidId, TypeError):
+		return Response({'error': 'Geofence not found'}, status=status.HTTP_404_NOT_FOUND)
+	
+	if not GeofenceSubscription.objects(id=subscription_id, subscriber_id=subscriber_id).delete():
+		return Response({'error': 'Geofence not found'}, status=status.HTTP_404_NOT_FOUND)
+	GeofenceAlert.objects(subscription=subscription_id).delete()
+	return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def geofence_inbox_view(request):
+	"""
+	Poll the pending alerts of ?subscriber_id=, oldest first (?limit=, up to
+	MAX_INBOX_ALERTS). Alerts stay until acknowledged or expired.
+	"""
+	subscriber_id = subscriber_param(request.query_params.get('subscriber_id'))
+	if subscriber_id is None:
+		return Response({'error': 'A valid subscriber_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+	try:
+		limit = min(max(int(request.query_params.get('limit', 50)), 1), MAX_INBOX_ALERTS)
+	except ValueError:
+		return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+	
+	alerts = inbox(subscriber_id, limit)
+	return Response({'alerts': GeofenceAlertSerializer(alerts, many=True).data, 'count': len(alerts)})
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def geofence_inbox_ack_view(request):
+	"""Acknowledge delivered alerts: {"subscriber_id", "ids": [...]} removes them from the inbox."""
+	from bson import ObjectId
+	from bson.errors import InvalidId
+	
+	subscriber_id = subscriber_param(request.data.get('subscriber_id'))
+	ids = request.data.get('ids')
+	if subscriber_id is None:
+		return Response({'error': 'A valid subscriber_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+	if not isinstance(ids, list) or len(ids) > MAX_INBOX_ALERTS:
+		return Response(
+			{'error': f'ids must be a list of at most {MAX_INBOX_ALERTS} alert ids'},
+			status=status.HTTP_400_BAD_REQUEST
+		)
+	try:
+		alert_ids = [ObjectId(str(value)) for value in ids]
+	except InvalidId:
+		return Response({'error': 'Invalid alert id'}, status=status.HTTP_400_BAD_REQUEST)
+	return Response({'acknowledged': acknowledge(subscriber_id, alert_ids)})
+
+
+MAX_STATS_HOURS = 7 * 24
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def report_stats_view(request):
+	"""
+	Report counts, open reports per region and the hourly timeseries (?hours=,
+	default PROJECTION_TIMESERIES_HOURS), read from the projections of the
+	report event log rather than computed from the reports. `lag` is the
+	number of events each projection has yet to apply.
+	"""
+	try:
+		hours = min(max(int(request.query_params.get('hours', settings.PROJECTION_TIMESERIES_HOURS)), 1), MAX_STATS_HOURS)
+	except ValueError:
+		return Response({'error': 'hours must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+	
+	return Response({
+		'counts': read_model('counts'),
+		'regions': read_model('regions'),
+		'timeseries': read_model('timeseries', hours=hours),
+		'lag': projection_lag(),
+	})
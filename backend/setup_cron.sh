@@ -1,6 +1,6 @@
 #!/bin/bash
 
-# Setup cron job to cleanup resolved reports every 5 minutes
+# Setup cron job to verify TTL expiry of resolved reports every 5 minutes
 # This script should be run as root or with appropriate permissions
 
 # Get the current directory (backend directory)
@@ -10,11 +10,21 @@ PYTHON_PATH="$(which python3)"
 # Create the cron job entry
 CRON_JOB="*/5 * * * * cd $BACKEND_DIR && $PYTHON_PATH cleanup_script.py >> /var/log/disaster_cleanup.log 2>&1"
 
-# Add the cron job (this will add it to the current user's crontab)
-(crontab -l 2>/dev/null; echo "$CRON_JOB") | crontab -
+# Keep the feed's priority ranking current: new reports every minute, a full recount nightly
+PRIORITY_JOB="* * * * * cd $BACKEND_DIR && $PYTHON_PATH manage.py refresh_priorities >> /var/log/disaster_priorities.log 2>&1"
+PRIORITY_FULL_JOB="30 3 * * * cd $BACKEND_DIR && $PYTHON_PATH manage.py refresh_priorities --full >> /var/log/disaster_priorities.log 2>&1"
+
+# Fold the report event log into the stats read models every minute; a run still
+# busy with a backlog holds each projection's lease, so the next one skips it
+PROJECTIONS_JOB="* * * * * cd $BACKEND_DIR && $PYTHON_PATH manage.py run_projections >> /var/log/disaster_projections.log 2>&1"
+
+# Add the cron jobs (this will add them to the current user's crontab)
+(crontab -l 2>/dev/null; echo "$CRON_JOB"; echo "$PRIORITY_JOB"; echo "$PRIORITY_FULL_JOB"; echo "$PROJECTIONS_JOB") | crontab -
 
 echo "Cron job added successfully!"
-echo "The cleanup script will run every 5 minutes."
+echo "The expiry check will run every 5 minutes."
+echo "Priority ranking will be refreshed every minute, and recounted fully at 03:30."
+echo "The stats projections will catch up with the report event log every minute."
 echo "Logs will be written to /var/log/disaster_cleanup.log"
 echo ""
 echo "To view the cron job: crontab -l"
@@ -16,6 +16,14 @@ python manage.py migrate
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
+# Build the OpenAPI schema served by /api/schema/ (without it the first request builds it)
+echo "Building API schema..."
+python manage.py build_schema || echo "Schema build failed, continuing"
+
+# Create the MongoDB indexes and backfill geohashes (never block startup on it)
+echo "Ensuring MongoDB indexes..."
+python manage.py ensure_indexes --skip-explain || echo "Index check failed, continuing"
+
 # Start the server
 echo "Starting Gunicorn server..."
-exec gunicorn disaster_response.wsgi:application --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+exec gunicorn disaster_response.wsgi:application -c gunicorn.conf.py